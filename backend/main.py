@@ -12,6 +12,14 @@ from google.auth.transport import requests
 GCS_BUCKET_NAME = os.environ.get("GCS_BUCKET_NAME", "default-bucket-name")
 # ---------------------
 
+# sync_gcs.py publishes each album's manifest as an immutable, gzip-encoded,
+# content-hashed object, plus this small pointer naming the current version.
+MANIFEST_POINTER_NAME = "manifest-pointer.json"
+
+# Versioned manifests never change once written, so a warm instance can keep
+# every one it has parsed, keyed by object path, without revalidating.
+_manifest_cache = {}
+
 def verify_album_exists(bucket_name: str, prefix: str):
     """
     Verifies if an album (GCS prefix) exists by checking for the presence
@@ -26,10 +34,39 @@ def verify_album_exists(bucket_name: str, prefix: str):
         print(f"Error verifying album existence for prefix '{prefix}': {e}")
         return False
 
+def is_content_addressed(manifest):
+    """True if the manifest maps filenames to shared content-addressed objects."""
+    return isinstance(manifest, dict) and isinstance(manifest.get("objects"), dict)
+
+def load_published_manifest(bucket, prefix: str):
+    """
+    Follows an album's manifest pointer to its current versioned manifest.
+    Returns (manifest_data, manifest_path), or (None, None) for albums synced
+    before manifests were versioned. Only the pointer's metadata is fetched
+    when the version is already cached.
+    """
+    pointer_blob = bucket.get_blob(f"{prefix}{MANIFEST_POINTER_NAME}")
+    if pointer_blob is None:
+        return None, None
+
+    manifest_name = (pointer_blob.metadata or {}).get("manifest")
+    if not manifest_name:
+        manifest_name = json.loads(pointer_blob.download_as_bytes())["manifest"]
+    manifest_path = f"{prefix}{manifest_name}"
+
+    if manifest_path not in _manifest_cache:
+        print(f"Loading {manifest_path}.")
+        # Stored with Content-Encoding: gzip; the client decompresses it transparently.
+        _manifest_cache[manifest_path] = json.loads(bucket.blob(manifest_path).download_as_bytes())
+    return _manifest_cache[manifest_path], manifest_path
+
 def get_gcs_data(bucket_name: str, prefix: str):
     """
-    Lists all image filenames in a GCS bucket under a given prefix and
-    retrieves the manifest.json if it exists.
+    Returns (image_filenames, manifest, manifest_path, status_code) for an album
+    (image_filenames may be empty for an album of only videos).
+    Albums with a published (versioned) manifest are served straight from it;
+    older albums fall back to listing image files under the prefix and reading
+    their plain manifest.json, with manifest_path None.
     """
     if not prefix.endswith('/'):
         prefix += '/'
@@ -37,6 +74,21 @@ def get_gcs_data(bucket_name: str, prefix: str):
     try:
         storage_client = storage.Client()
         bucket = storage_client.bucket(bucket_name)
+
+        # The manifest is authoritative for everything sync_gcs.py publishes,
+        # so no listing is needed for those albums.
+        manifest_data, manifest_path = load_published_manifest(bucket, prefix)
+        if manifest_data is not None:
+            if is_content_addressed(manifest_data):
+                objects = manifest_data["objects"]
+                image_filenames = [objects[name] for name in manifest_data.get("images", []) if name in objects]
+            else:
+                image_filenames = list(manifest_data.get("images", []))
+            # An album may hold only videos (HLS packages listed under "videos")
+            if not image_filenames and not manifest_data.get("videos"):
+                print(f"Manifest for prefix '{prefix}' lists no images or videos.")
+                return None, None, None, 404
+            return image_filenames, manifest_data, manifest_path, 200
         
         # Get all image filenames
         image_filenames = []
@@ -49,10 +101,6 @@ def get_gcs_data(bucket_name: str, prefix: str):
             # Add any valid image files to the list
             if blob.name.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.webp')):
                 image_filenames.append(os.path.basename(blob.name))
-        
-        if not image_filenames:
-            print(f"No image files found in GCS bucket '{bucket_name}' with prefix '{prefix}'.")
-            return None, None, 404
 
         # Try to load the manifest file
         manifest_data = None
@@ -63,11 +111,21 @@ def get_gcs_data(bucket_name: str, prefix: str):
         else:
             print(f"manifest.json not found for prefix '{prefix}'.")
 
-        return image_filenames, manifest_data, 200
+        # Deduplicated albums (sync_gcs.py --dedupe) hold only a manifest; their
+        # images are shared objects, listed as paths relative to the bucket root.
+        if is_content_addressed(manifest_data):
+            objects = manifest_data["objects"]
+            image_filenames = [objects[name] for name in manifest_data.get("images", []) if name in objects]
+
+        if not image_filenames:
+            print(f"No image files found in GCS bucket '{bucket_name}' with prefix '{prefix}'.")
+            return None, None, None, 404
+
+        return image_filenames, manifest_data, None, 200
 
     except Exception as e:
         print(f"An unexpected error occurred when accessing GCS for prefix '{prefix}': {e}")
-        return None, None, 500
+        return None, None, None, 500
 
 @functions_framework.http
 def private_gallery_backend(request):
@@ -117,7 +175,7 @@ def private_gallery_backend(request):
         return jsonify({"detail": "Gallery not found or album name incorrect."}), 404, headers
 
     # Step 2: If it exists, get the list of images and the manifest.
-    image_filenames, manifest, status_code = get_gcs_data(
+    image_filenames, manifest, manifest_path, status_code = get_gcs_data(
         bucket_name=GCS_BUCKET_NAME,
         prefix=album_name
     )
@@ -128,11 +186,23 @@ def private_gallery_backend(request):
     if status_code == 404:
         return jsonify({"detail": "Gallery not found or is empty."}), 404, headers
 
-    # Construct the public base URL for the images
+    # Construct the public base URL for the images. Content-addressed image
+    # paths are relative to the bucket root rather than the album folder.
     base_image_url = f"https://storage.googleapis.com/{GCS_BUCKET_NAME}/{album_name}/"
+    if is_content_addressed(manifest):
+        base_image_url = f"https://storage.googleapis.com/{GCS_BUCKET_NAME}/"
 
-    return jsonify({
+    response = {
         "base_url": base_image_url,
         "images": image_filenames,
         "manifest": manifest  # Pass through as-is; frontend handles both array and object formats
-    }), 200, headers
+    }
+
+    # A versioned manifest is immutable and publicly cached, so point the browser
+    # at it instead of inlining it -- repeat visits then come from the browser's
+    # own cache. Clients that can't fetch it directly ask again with inline_manifest.
+    if manifest_path and not request_json.get('inline_manifest'):
+        response["manifest"] = None
+        response["manifest_url"] = f"https://storage.googleapis.com/{GCS_BUCKET_NAME}/{manifest_path}"
+
+    return jsonify(response), 200, headers
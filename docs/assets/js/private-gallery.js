@@ -60,13 +60,36 @@ document.addEventListener('DOMContentLoaded', () => {
         });
     }
 
+    function requestAlbum(albumName, inlineManifest = false) {
+        const body = { album_name: albumName };
+        if (inlineManifest) body.inline_manifest = true;
+        return fetch(backendUrl, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify(body),
+        });
+    }
+
+    // Versioned manifests are immutable and served with long-lived caching, so
+    // the backend sends their URL rather than the manifest itself and repeat
+    // visits are answered from the browser cache. If the direct fetch fails
+    // (e.g. no bucket CORS for this origin), ask the backend to inline it.
+    async function resolveManifest(albumName, data) {
+        if (data.manifest || !data.manifest_url) return data.manifest;
+        try {
+            const response = await fetch(data.manifest_url);
+            if (response.ok) return await response.json();
+        } catch (error) {
+            console.warn('Could not fetch manifest directly, asking backend to inline it:', error);
+        }
+        const retry = await requestAlbum(albumName, true);
+        if (!retry.ok) return null;
+        return (await retry.json()).manifest;
+    }
+
     async function loadAlbum(albumName) {
         try {
-            const response = await fetch(backendUrl, {
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({ album_name: albumName }),
-            });
+            const response = await requestAlbum(albumName);
 
             if (!response.ok) {
                 const errorData = await response.json().catch(() => null);
@@ -75,34 +98,46 @@ document.addEventListener('DOMContentLoaded', () => {
             }
 
             const data = await response.json();
-            if (!data.base_url || !data.images || !data.images.length) {
+            if (!data.base_url || !data.images) {
                 displayError('No images found for the provided album name, or the gallery is empty.');
                 return;
             }
 
-            albumAccessSection.style.display = 'none';
-            galleryContainer.style.display = '';
-
-            if (albumTitleElement) {
-                albumTitleElement.textContent = albumName;
-                albumTitleElement.style.display = '';
-            }
-
             // The GCS manifest is either a plain array of filenames (old format)
             // or { images: [...], sequences: [...] } (new format). Normalise so
             // the rest of the code is consistent.
-            let manifest = data.manifest;
+            let manifest = await resolveManifest(albumName, data);
             let sequences = [];
+            let objects = null;
+            let videos = [];
             if (manifest && !Array.isArray(manifest) && typeof manifest === 'object') {
                 sequences = manifest.sequences || [];
+                objects = manifest.objects || null; // deduplicated albums: filename -> shared object path
+                videos = manifest.videos || []; // HLS packages, paths relative to base_url
                 manifest = manifest.images || [];
             }
 
+            if (!data.images.length && !videos.length) {
+                displayError('No images found for the provided album name, or the gallery is empty.');
+                return;
+            }
+
+            albumAccessSection.style.display = 'none';
+            galleryContainer.style.display = '';
+
+            if (albumTitleElement) {
+                albumTitleElement.textContent = albumName;
+                albumTitleElement.style.display = '';
+            }
+
             const linkMode = albumAccessSection.dataset.linkMode || null;
             const imagesPerRowOverride = parseInt(albumAccessSection.dataset.imagesPerRow, 10) || null;
 
-            if (typeof window.initMultipleExposureViewer === 'function' && sequences.length > 0) {
-                window.initMultipleExposureViewer(sequences, data.base_url);
+            renderVideos(data.base_url, videos);
+            if (!data.images.length) {
+                galleryContainer.innerHTML = '';
+            } else if (typeof window.initMultipleExposureViewer === 'function' && sequences.length > 0) {
+                window.initMultipleExposureViewer(sequences, data.base_url, objects);
             } else {
                 populateGallery(data.base_url, data.images, manifest, linkMode, imagesPerRowOverride);
             }
@@ -112,6 +147,77 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     }
 
+    // Videos are HLS packages (see scripts/hls_package.py). Safari plays HLS
+    // natively; other browsers get hls.js, loaded only for albums that have
+    // videos. Only the playlists load up front. Segments start on the first
+    // play, at a low rendition, and hls.js then adapts to the connection.
+    const HLS_JS_URL = 'https://cdn.jsdelivr.net/npm/hls.js@1/dist/hls.min.js';
+    let hlsJsPromise = null;
+
+    function loadHlsJs() {
+        if (!hlsJsPromise) {
+            hlsJsPromise = new Promise((resolve, reject) => {
+                const script = document.createElement('script');
+                script.src = HLS_JS_URL;
+                script.onload = () => resolve(window.Hls);
+                script.onerror = reject;
+                document.head.appendChild(script);
+            });
+        }
+        return hlsJsPromise;
+    }
+
+    async function attachStream(video, playlistUrl) {
+        if (video.canPlayType('application/vnd.apple.mpegurl')) {
+            video.src = playlistUrl;
+            return;
+        }
+        try {
+            const Hls = await loadHlsJs();
+            if (Hls && Hls.isSupported()) {
+                const hls = new Hls({ autoStartLoad: false, capLevelToPlayerSize: true });
+                hls.loadSource(playlistUrl);
+                hls.attachMedia(video);
+                video.addEventListener('play', () => hls.startLoad(), { once: true });
+                return;
+            }
+        } catch (error) {
+            console.warn('Could not load hls.js:', error);
+        }
+        video.src = playlistUrl; // Last resort; without MSE few browsers can play it
+    }
+
+    function renderVideos(baseUrl, videos) {
+        let container = document.getElementById('video-gallery-container');
+        if (!videos.length) {
+            if (container) container.remove();
+            return;
+        }
+        if (!container) {
+            container = document.createElement('div');
+            container.id = 'video-gallery-container';
+            galleryContainer.parentNode.insertBefore(container, galleryContainer);
+        }
+        container.innerHTML = '';
+
+        videos.forEach(entry => {
+            const figure = document.createElement('figure');
+            const video = document.createElement('video');
+            video.controls = true;
+            video.playsInline = true;
+            video.preload = 'none';
+            if (entry.poster) video.poster = `${baseUrl}${entry.poster}`;
+            // Reserve the right space before the poster arrives
+            if (entry.width && entry.height) video.style.aspectRatio = `${entry.width} / ${entry.height}`;
+            attachStream(video, `${baseUrl}${entry.playlist}`);
+
+            const caption = document.createElement('figcaption');
+            caption.textContent = entry.name;
+            figure.append(video, caption);
+            container.appendChild(figure);
+        });
+    }
+
     function populateGallery(baseUrl, images, manifest = null, linkMode = null, imagesPerRowOverride = null) {
         if (!galleryContainer) return;
         galleryContainer.innerHTML = ''; // Clear any existing content
@@ -129,7 +235,7 @@ document.addEventListener('DOMContentLoaded', () => {
             const imgElement = document.createElement('img');
             imgElement.className = 'gallery-image-source grid__item-image-lazy js-lazy';
             imgElement.src = `${baseUrl}${imageName}`;
-            imgElement.alt = imageName; // Use filename as alt text
+            imgElement.alt = imageName.split('/').pop(); // Use filename as alt text (shared object paths end in it)
             galleryContainer.appendChild(imgElement);
         });
 
@@ -2,6 +2,7 @@
     'use strict';
 
     var baseUrl = '';
+    var objectPaths = {};       // filename -> shared object path, for deduplicated (--dedupe) albums
     var allSequences = [];
     var currentSequence = null;
     var baseImage = null;
@@ -14,11 +15,13 @@
     var viewerLastFocused = null; // element to restore focus to when the viewer closes
     var exposureCanvas = null;  // #exposure-canvas, resolved once in createModal()
     var exposureCtx = null;
+    var viewerLevel = null;     // the level the viewer is blending, or null for the originals
 
 
-    function initMultipleExposureViewer(sequences, galleryBaseUrl) {
+    function initMultipleExposureViewer(sequences, galleryBaseUrl, objects) {
         if (!sequences || sequences.length === 0) return;
         baseUrl = galleryBaseUrl;
+        objectPaths = objects || {};
         allSequences = sequences;
         renderExposuresSection(sequences);
         createModal();
@@ -89,7 +92,7 @@
 
     function createPlainThumbnail(sequence) {
         var img = document.createElement('img');
-        img.src = baseUrl + sequence.base;
+        img.src = sequenceUrls(sequence, cardLevel(sequence))[0];
         img.alt = sequence.base;
         return img;
     }
@@ -145,7 +148,41 @@
         }
     }
 
-    // Loads `srcs` (relative to baseUrl) as Image objects and calls onAllSettled(imgs)
+    // Sequences always name images by filename; deduplicated albums store each
+    // one under a shared object path instead of directly in the album folder.
+    function imageUrl(filename) {
+        return baseUrl + (objectPaths[filename] || filename);
+    }
+
+    // Sequences from sync_gcs.py carry "levels": the base and every overlay
+    // pre-scaled to a few identical sizes, smallest first. Blending needs only
+    // the smallest level at least as wide as it will be drawn, so originals
+    // are only fetched when asked for -- or when no level is wide enough, or
+    // the manifest predates levels.
+    function pickLevel(sequence, neededWidth) {
+        var levels = sequence.levels || [];
+        for (var i = 0; i < levels.length; i++) {
+            if (levels[i].width >= neededWidth) return levels[i];
+        }
+        return null;
+    }
+
+    // URLs for the base then each overlay, from `level` (or the originals if null).
+    function sequenceUrls(sequence, level) {
+        if (level) {
+            return level.images.map(function (path) { return baseUrl + path; });
+        }
+        return [sequence.base].concat(sequence.overlays).map(imageUrl);
+    }
+
+    // Cards are laid out three to a row (see .exposure-card), and never drawn
+    // larger than CARD_CANVAS_MAX_PX.
+    function cardLevel(sequence) {
+        var dpr = window.devicePixelRatio || 1;
+        return pickLevel(sequence, Math.min(CARD_CANVAS_MAX_PX, Math.round(window.innerWidth / 3 * dpr)));
+    }
+
+    // Loads `srcs` (URLs) as Image objects and calls onAllSettled(imgs)
     // once every one has either loaded or errored (errors are tolerated -- callers
     // check img.complete/naturalWidth before drawing).
     function loadImageSet(srcs, onAllSettled) {
@@ -158,7 +195,7 @@
             }
             img.onload = onSettled;
             img.onerror = onSettled;
-            img.src = baseUrl + srcs[idx];
+            img.src = srcs[idx];
         });
         return imgs;
     }
@@ -169,7 +206,7 @@
         canvas.setAttribute('aria-hidden', 'true');
         canvas._ctx = canvas.getContext('2d');
 
-        loadImageSet([sequence.base].concat(sequence.overlays), function (imgs) {
+        loadImageSet(sequenceUrls(sequence, cardLevel(sequence)), function (imgs) {
             var base = imgs[0];
             if (!base.complete || !base.naturalWidth) return;
             canvas._imgs = imgs;
@@ -445,6 +482,7 @@
                     '<p class="exposure-instructions">Click an overlay to enable it and combine exposures. Experiment with different combinations to find your favourite composite.</p>' +
                     '<p class="exposure-instructions">Note: this is an indicative preview only. The base image and overlays will be refined in post-processing for the final edit.</p>' +
                     '<div id="exposure-overlays-list" class="exposure-overlays-list"></div>' +
+                    '<button id="exposure-full-res-btn" class="exposure-select-all-btn exposure-full-res-btn" hidden>Load full resolution</button>' +
                 '</div>' +
             '</div>';
 
@@ -454,6 +492,9 @@
         exposureCtx = exposureCanvas.getContext('2d');
 
         document.getElementById('multiple-exposure-viewer-close').addEventListener('click', closeModal);
+        document.getElementById('exposure-full-res-btn').addEventListener('click', function () {
+            if (currentSequence) loadImages(currentSequence, true);
+        });
         modal.addEventListener('click', function (e) { if (e.target === modal) closeModal(); });
         document.addEventListener('keydown', function (e) {
             if (e.key === 'Escape') { closeModal(); return; }
@@ -562,9 +603,40 @@
         btn.textContent = allEnabled ? 'Deselect all' : 'Select all';
     }
 
-    function loadImages(sequence) {
+    // The level covering the canvas area at its fitted size, for this sequence's aspect ratio.
+    function levelForViewer(sequence) {
+        var levels = sequence.levels || [];
+        if (levels.length === 0) return null;
+        var wrap = exposureCanvas.parentElement;
+        var dpr = window.devicePixelRatio || 1;
+        var width = Math.min(wrap.clientWidth, wrap.clientHeight * levels[0].width / levels[0].height);
+        return pickLevel(sequence, Math.round(width * dpr));
+    }
+
+    function updateFullResButton(loading) {
+        var btn = document.getElementById('exposure-full-res-btn');
+        btn.hidden = !viewerLevel;
+        btn.disabled = loading;
+        btn.textContent = loading ? 'Loading full resolution...' : 'Load full resolution';
+    }
+
+    // Draws the sequence at screen resolution, or with fullResolution the
+    // originals -- which replace the current images only once all have loaded,
+    // keeping the overlay selection.
+    function loadImages(sequence, fullResolution) {
         var myGen = ++viewerLoadGen;
 
+        if (fullResolution) {
+            updateFullResButton(true);
+            loadImageSet(sequenceUrls(sequence, null), function (imgs) {
+                if (myGen !== viewerLoadGen) return;
+                showImages(imgs, null);
+            });
+            return;
+        }
+
+        viewerLevel = levelForViewer(sequence);
+        updateFullResButton(false);
         exposureCanvas.width = exposureCanvas.width || 400;
         exposureCanvas.height = exposureCanvas.height || 300;
         exposureCtx.fillStyle = '#1a1a1a';
@@ -574,19 +646,25 @@
         exposureCtx.textAlign = 'center';
         exposureCtx.fillText('Loading...', exposureCanvas.width / 2, exposureCanvas.height / 2);
 
-        loadImageSet([sequence.base].concat(sequence.overlays), function (imgs) {
+        loadImageSet(sequenceUrls(sequence, viewerLevel), function (imgs) {
             if (myGen !== viewerLoadGen) return;   // a newer sequence has since been opened; discard
-            var base = imgs[0];
-            if (base.complete && base.naturalWidth) {
-                exposureCanvas.width = base.naturalWidth;
-                exposureCanvas.height = base.naturalHeight;
-            }
-            baseImage = imgs[0];
-            overlayImages = imgs.slice(1);
-            redraw();
+            showImages(imgs, viewerLevel);
         });
     }
 
+    function showImages(imgs, level) {
+        var base = imgs[0];
+        if (base.complete && base.naturalWidth) {
+            exposureCanvas.width = base.naturalWidth;
+            exposureCanvas.height = base.naturalHeight;
+        }
+        baseImage = imgs[0];
+        overlayImages = imgs.slice(1);
+        viewerLevel = level;
+        updateFullResButton(false);
+        redraw();
+    }
+
     function setTargetAlpha() {
         if (animFrameId !== null) cancelAnimationFrame(animFrameId);
         lastTimestamp = null;
@@ -660,6 +738,7 @@
         document.body.style.overflow = '';
         viewerLoadGen++;   // discard any in-flight image loads from the closed sequence
         currentSequence = null;
+        viewerLevel = null;
         baseImage = null;
         overlayImages = [];
         if (viewerLastFocused && typeof viewerLastFocused.focus === 'function') {
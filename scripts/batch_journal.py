@@ -0,0 +1,139 @@
+"""A journal of the video batch scripts' jobs, so a rerun picks up where a crash left off.
+
+compress_videos.py and denoise_videos.py append a line to a journal in the
+folder their outputs go to (.compress_videos.journal.jsonl and
+.denoise_videos.journal.jsonl) as each job changes state:
+
+- started: the source, the final path, and the ffmpeg command about to run
+- done: the committed output's size, mtime and a quick hash of it
+- failed: the tail of ffmpeg's error output
+
+Each line is flushed and fsynced before the script moves on, so after a
+crash, a sleep that never woke, or a power cut, the journal is no further
+behind than the job that was running. A rerun reads the journal, newest
+line per output winning, and uses state() to sort its jobs:
+
+- A job whose output the journal records as done, and whose output still
+  matches (same size and mtime, or failing that the same quick hash), is
+  finished, without probing or decoding the output. This is what lets a
+  rerun of --overwrite tell an already-denoised file from one still to do.
+- A job that was started but never recorded as done is run again, even if
+  an output exists at its final path (it may be a commit the crash caught
+  halfway to disk). The exception is a file being replaced in place: there
+  the journal keeps the source's quick hash, and a file that no longer
+  matches it is the committed output, so it's done.
+- A done output that no longer matches is run again.
+- An output the journal knows nothing about (from before the journal, or
+  from another batch) is treated as before: if it exists, it's finished.
+
+The quick hash covers the file's size and three 1 MiB blocks at its start,
+middle and end, so it's cheap to check even on a NAS. It catches a
+truncated or replaced file, not a flipped bit in the middle.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+HASH_BLOCK = 1 << 20
+
+DONE = 'done'
+UNFINISHED = 'unfinished'
+CHANGED = 'changed'
+
+
+def quick_hash(path: Path) -> str:
+    """blake2b of the file's size and three HASH_BLOCK blocks spread through it."""
+    size = os.stat(path).st_size
+    digest = hashlib.blake2b(str(size).encode(), digest_size=16)
+    with open(path, 'rb') as f:
+        for offset in sorted({0, max(0, size // 2 - HASH_BLOCK // 2), max(0, size - HASH_BLOCK)}):
+            f.seek(offset)
+            digest.update(f.read(HASH_BLOCK))
+    return digest.hexdigest()
+
+
+class BatchJournal:
+    """The journal for one tool's outputs under `folder` (see the module docstring)."""
+
+    def __init__(self, folder: Path, tool: str):
+        self.folder = folder
+        self.path = folder / f".{tool}.journal.jsonl"
+        self._entries: dict[str, dict] = {}
+        self._read_to = 0
+        self._lock = threading.Lock()
+        self.refresh()
+
+    def refresh(self) -> None:
+        """Reads lines appended since the last read, by this process or another (see work_queue.py)."""
+        try:
+            with open(self.path, 'rb') as f:
+                f.seek(self._read_to)
+                data = f.read()
+        except OSError:
+            return
+        end = data.rfind(b'\n') + 1  # a line still being written is read next time
+        with self._lock:
+            for line in data[:end].splitlines():
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # a line cut short by a crash
+                self._entries[entry['output']] = entry
+            self._read_to += end
+
+    def _key(self, final: Path) -> str:
+        return os.path.relpath(final, self.folder)
+
+    def _append(self, entry: dict) -> None:
+        entry['time'] = round(time.time(), 3)
+        line = json.dumps(entry, sort_keys=True) + '\n'
+        with self._lock:
+            self._entries[entry['output']] = entry
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+
+    def entry(self, final: Path) -> dict | None:
+        """The newest line for `final`, if any."""
+        return self._entries.get(self._key(final))
+
+    def state(self, final: Path) -> str | None:
+        """
+        DONE, UNFINISHED or CHANGED for an output the journal knows about (see
+        the module docstring), or None if it knows nothing about it.
+        """
+        entry = self._entries.get(self._key(final))
+        if entry is None:
+            return None
+        try:
+            st = os.stat(final)
+        except OSError:
+            return CHANGED if entry['state'] == DONE else UNFINISHED
+        if entry['state'] != DONE:
+            replaced = entry.get('source_hash') and quick_hash(final) != entry['source_hash']
+            return DONE if replaced else UNFINISHED
+        if st.st_size != entry['size']:
+            return CHANGED
+        if st.st_mtime_ns == entry['mtime_ns'] or quick_hash(final) == entry['hash']:
+            return DONE
+        return CHANGED
+
+    def started(self, final: Path, source: Path, cmd: list[str]) -> None:
+        entry = {'output': self._key(final), 'state': 'started', 'source': str(source), 'args': cmd}
+        if final == source:
+            entry['source_hash'] = quick_hash(source)  # see state()
+        self._append(entry)
+
+    def done(self, final: Path) -> None:
+        """Records final, just committed, as finished."""
+        st = os.stat(final)
+        self._append({'output': self._key(final), 'state': DONE, 'size': st.st_size,
+                      'mtime_ns': st.st_mtime_ns, 'hash': quick_hash(final)})
+
+    def failed(self, final: Path, error: str) -> None:
+        self._append({'output': self._key(final), 'state': 'failed', 'error': error.strip()[-500:]})
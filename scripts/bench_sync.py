@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""Benchmark sync_gcs.py end to end against a local stand-in bucket.
+
+Generates synthetic staging trees (small JPEGs carrying EXIF capture times,
+sub-second times, flash and IPTC keywords, nested as event/personNN albums
+like the real staging folder) and syncs each one into a sync_targets
+LocalBucket, reporting the wall time of every sync stage -- discovery,
+metadata, levels, video, diff, upload, manifests and cleanup -- for three scenarios:
+
+  cold         first sync into an empty target, with no local caches
+  noop         the same sync again, with nothing changed
+  one-album    one image rewritten and one added in a single album
+
+Generated trees are kept under --work-dir and reused by later runs with the
+same size and image dimensions, so only the first run pays to build them.
+Benchmarks use their own photo catalog under --work-dir.
+--trace-memory adds each sync's peak Python heap (via tracemalloc, which
+slows the run down) to the report.
+
+Usage: python3 bench_sync.py [--sizes 100,10000,50000] [--work-dir DIR]
+                             [--latency-ms MS] [--trace-memory] [--json REPORT.json]
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import shutil
+import struct
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from pathlib import Path
+
+os.environ.setdefault('TQDM_DISABLE', '1')  # progress bars would swamp the report
+
+import sync_gcs
+from photo_catalog import CATALOG_ENV
+from sync_targets import LocalBucket
+
+DEFAULT_SIZES = '100,10000,50000'
+IMAGES_PER_ALBUM = 100
+ALBUMS_PER_EVENT = 20
+SCENARIOS = ('cold', 'noop', 'one-album')
+STAGES = ('discovery', 'metadata', 'levels', 'video', 'diff', 'upload', 'manifests', 'cleanup')
+READY_MARKER = '.bench_ready'
+
+_EXIF_IFD = 0x8769
+_TAG_DT, _TAG_DTO, _TAG_SSDTO, _TAG_FLASH = 306, 36867, 37521, 37385
+
+
+def iptc_app13(keywords: list[str]) -> bytes:
+    """An APP13 (Photoshop IRB) segment holding IPTC 2:25 keywords, as Lightroom writes them."""
+    iptc = b''.join(
+        b'\x1c\x02\x19' + struct.pack('>H', len(kw.encode())) + kw.encode()
+        for kw in keywords
+    )
+    if len(iptc) % 2:
+        iptc += b'\x00'
+    resource = b'8BIM' + struct.pack('>H', 0x0404) + b'\x00\x00' + struct.pack('>I', len(iptc)) + iptc
+    payload = b'Photoshop 3.0\x00' + resource
+    return b'\xff\xed' + struct.pack('>H', len(payload) + 2) + payload
+
+
+def synthetic_jpeg(size: tuple[int, int], capture: datetime, flash: bool,
+                   keywords: list[str], rng: random.Random) -> bytes:
+    from PIL import Image
+    img = Image.new('RGB', size, (rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+    exif = Image.Exif()
+    stamp = capture.strftime('%Y:%m:%d %H:%M:%S')
+    exif[_TAG_DT] = stamp
+    exif_ifd = exif.get_ifd(_EXIF_IFD)
+    exif_ifd[_TAG_DTO] = stamp
+    exif_ifd[_TAG_SSDTO] = f"{capture.microsecond // 10_000:02d}"
+    exif_ifd[_TAG_FLASH] = 1 if flash else 0
+    buf = io.BytesIO()
+    img.save(buf, 'JPEG', quality=80, exif=exif.tobytes())
+    data = buf.getvalue()
+    # Splice the IPTC segment in straight after SOI
+    return data[:2] + iptc_app13(keywords) + data[2:]
+
+
+def generate_tree(root: Path, n_images: int, size: tuple[int, int], seed: int = 0) -> None:
+    rng = random.Random(seed)
+    start = datetime(2026, 3, 14, 18, 0, 0)
+    n_albums = max(1, -(-n_images // IMAGES_PER_ALBUM))
+    written = 0
+    for album in range(n_albums):
+        folder = root / f"event{album // ALBUMS_PER_EVENT:03d}" / f"person{album:05d}"
+        folder.mkdir(parents=True, exist_ok=True)
+        # Every fifth album is a multiple-exposure shoot, so sequences get built too
+        multiple_exposure = album % 5 == 0
+        capture = start + timedelta(hours=album)
+        for i in range(min(IMAGES_PER_ALBUM, n_images - written)):
+            capture += timedelta(milliseconds=rng.randrange(200, 5000))
+            keywords = [f"{album % 100:02d}_selects"]
+            if multiple_exposure:
+                keywords.append('multiple_exposure')
+            data = synthetic_jpeg(size, capture, flash=multiple_exposure and i % 4 == 0,
+                                  keywords=keywords, rng=rng)
+            (folder / f"IMG_{written:06d}.jpg").write_bytes(data)
+            written += 1
+    (root / READY_MARKER).touch()
+
+
+def change_one_album(root: Path, size: tuple[int, int]) -> None:
+    """Rewrites one image and adds one new one in the first album."""
+    album = next(p for p in sorted(root.rglob('person*')) if p.is_dir())
+    rng = random.Random(time.time())
+    existing = sorted(album.glob('*.jpg'))[0]
+    capture = datetime(2026, 3, 14, 18, 0, 1)
+    existing.write_bytes(synthetic_jpeg(size, capture, False, ['00_selects'], rng))
+    (album / f"IMG_added_{int(time.time() * 1000)}.jpg").write_bytes(
+        synthetic_jpeg(size, capture + timedelta(seconds=1), False, ['00_selects'], rng))
+
+
+def timed_sync(staging: Path, bucket: LocalBucket, trace_memory: bool = False) -> dict[str, float]:
+    timings: dict[str, float] = {}
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            sync_gcs.run_sync(str(staging), bucket, timings=timings)
+        timings['total'] = time.perf_counter() - start
+        if trace_memory:
+            timings['peak_mb'] = tracemalloc.get_traced_memory()[1] / 2**20
+    finally:
+        if trace_memory:
+            tracemalloc.stop()
+    return timings
+
+
+def bench_size(n_images: int, work_dir: Path, size: tuple[int, int], latency: float,
+               trace_memory: bool = False) -> dict:
+    staging = work_dir / f"staging_{n_images}_{size[0]}x{size[1]}"
+    if not (staging / READY_MARKER).exists():
+        shutil.rmtree(staging, ignore_errors=True)
+        print(f"Generating {n_images} synthetic images in {staging}...", flush=True)
+        t0 = time.perf_counter()
+        generate_tree(staging, n_images, size)
+        print(f"  generated in {time.perf_counter() - t0:.1f}s", flush=True)
+
+    # A cold run starts with an empty target, no local sync caches and an empty catalog
+    target = work_dir / f"target_{n_images}"
+    shutil.rmtree(target, ignore_errors=True)
+    for name in (sync_gcs.SYNC_CACHE_FILENAME, sync_gcs.UPLOAD_SESSIONS_FILENAME):
+        (staging / name).unlink(missing_ok=True)
+    # ... and no rendered levels or packaged videos, so it resizes and packages everything
+    for name in (sync_gcs.LEVELS_CACHE_DIRNAME, sync_gcs.HLS_CACHE_DIRNAME):
+        shutil.rmtree(staging / name, ignore_errors=True)
+    catalog = Path(os.environ[CATALOG_ENV])
+    for path in (catalog, catalog.with_name(catalog.name + '-wal'), catalog.with_name(catalog.name + '-shm')):
+        path.unlink(missing_ok=True)
+    bucket = LocalBucket(str(target), latency=latency)
+
+    results = {}
+    for scenario in SCENARIOS:
+        if scenario == 'one-album':
+            change_one_album(staging, size)
+        print(f"  {n_images:>6} images, {scenario}...", flush=True)
+        results[scenario] = timed_sync(staging, bucket, trace_memory)
+    return results
+
+
+def print_report(report: dict) -> None:
+    with_memory = any('peak_mb' in t for results in report.values() for t in results.values())
+    header = f"{'images':>7}  {'scenario':<10}" + ''.join(f"{s:>11}" for s in (*STAGES, 'total'))
+    if with_memory:
+        header += f"{'peak MB':>10}"
+    print('\n' + header)
+    print('-' * len(header))
+    for n_images, results in report.items():
+        for scenario, timings in results.items():
+            row = ''.join(f"{timings.get(s, 0.0):>10.2f}s" for s in (*STAGES, 'total'))
+            if with_memory:
+                row += f"{timings.get('peak_mb', 0.0):>10.1f}"
+            print(f"{n_images:>7}  {scenario:<10}{row}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default=DEFAULT_SIZES,
+                        help=f'Comma-separated staging tree sizes, in images (default: {DEFAULT_SIZES})')
+    parser.add_argument('--work-dir', type=Path, default=Path(tempfile.gettempdir()) / 'photosby_bench_sync',
+                        help='Where generated trees and targets live; trees are reused between runs')
+    parser.add_argument('--image-size', default='64x48',
+                        help='Synthetic image WIDTHxHEIGHT (default: 64x48)')
+    parser.add_argument('--latency-ms', type=float, default=0.0,
+                        help='Simulated round-trip latency per storage call, in ms (default: 0)')
+    parser.add_argument('--trace-memory', action='store_true',
+                        help='Also report each sync\'s peak Python memory (slower)')
+    parser.add_argument('--json', type=Path, default=None,
+                        help='Also write the report as JSON to this path')
+    args = parser.parse_args()
+
+    try:
+        sizes = [int(s) for s in args.sizes.split(',') if s]
+        width, height = (int(x) for x in args.image_size.lower().split('x'))
+    except ValueError:
+        print("Invalid --sizes or --image-size")
+        sys.exit(1)
+
+    work_dir = args.work_dir.expanduser().resolve()
+    work_dir.mkdir(parents=True, exist_ok=True)
+    # Benchmarks keep their own photo catalog, leaving the user's alone
+    os.environ[CATALOG_ENV] = str(work_dir / 'catalog.sqlite')
+
+    report = {}
+    for n_images in sizes:
+        report[n_images] = bench_size(n_images, work_dir, (width, height), args.latency_ms / 1000,
+                                      args.trace_memory)
+
+    print_report(report)
+    if args.json is not None:
+        args.json.write_text(json.dumps({
+            'image_size': f"{width}x{height}",
+            'latency_ms': args.latency_ms,
+            'results': report,
+        }, indent=2))
+        print(f"\nSaved: {args.json}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,196 @@
+"""Encode one long video as parallel video-only chunks, with its audio muxed once.
+
+denoise_videos.py used to split long videos into chunks and encode them in
+parallel, audio and all. The audio spliced back together at the chunk
+boundaries glitched, so chunking was removed. This brings it back for the
+video only, and only when asked for (--chunked):
+
+1. The video stream's packets are listed (no decoding). The file is split
+   at keyframes at least chunk_seconds apart, so each chunk starts cleanly
+   on a frame that needs nothing before it. Cameras and editors put
+   keyframes at scene cuts, so most splits land on one.
+2. Each chunk is encoded with no audio, subtitle or data streams. It seeks
+   to just before its keyframe and stops after exactly the number of
+   frames up to the next split (or the end), so no frame is dropped or
+   doubled. The last chunk is held to its count too: left to run to the
+   end, ffmpeg can pad it with a copy of the final frame.
+3. The chunks are joined with the concat demuxer, without re-encoding. In
+   the same pass, every audio track is copied untouched from the original,
+   the timecode is set, and the video is offset by however much it started
+   after the audio in the original. Audio is never cut or spliced.
+4. The result is checked against the original: the same number of video
+   frames, the same video duration, and the same audio/video offset, each
+   to within a frame. A single-pass encode would keep all three. Anything
+   else is reported, and the caller falls back to a single-pass encode.
+"""
+
+import json
+import subprocess
+from dataclasses import dataclass
+from pathlib import Path
+
+CHUNK_SECONDS = 120
+THREADS_PER_CHUNK = 2
+
+
+@dataclass
+class Chunk:
+    index: int
+    seek: float              # -ss for the input: just before the chunk's first keyframe
+    frames: int              # frames to encode
+    duration: float          # seconds of video, for progress
+
+
+@dataclass
+class ChunkPlan:
+    chunks: list[Chunk]
+    frames: int              # video frames in the whole source
+    frame_seconds: float     # shortest gap between frames
+    video_offset: float      # first video frame's time from the start of the file
+
+
+def _video_packets(path: Path) -> list[tuple[float, bool]] | None:
+    """(presentation time, is keyframe) for each video packet, in presentation order."""
+    cmd = ['ffprobe', '-v', 'error', '-select_streams', 'v:0',
+           '-show_entries', 'packet=pts_time,flags', '-of', 'csv=p=0', str(path)]
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    if result.returncode != 0:
+        return None
+    packets = []
+    for line in result.stdout.splitlines():
+        pts, _, flags = line.partition(',')
+        try:
+            packets.append((float(pts), 'K' in flags))
+        except ValueError:
+            return None  # a packet without a timestamp can't be placed in a chunk
+    packets.sort()
+    return packets
+
+
+def plan_chunks(path: Path, start_time: float, chunk_seconds: float = CHUNK_SECONDS) -> ChunkPlan | None:
+    """
+    Splits path's video at keyframes at least chunk_seconds apart, or None
+    if that doesn't give at least two chunks (too short, too few keyframes,
+    or packets ffprobe can't time). start_time is the file's VideoInfo.start_time.
+    """
+    packets = _video_packets(path)
+    if not packets or len(packets) < 2:
+        return None
+    gaps = [b[0] - a[0] for a, b in zip(packets, packets[1:]) if b[0] > a[0]]
+    if not gaps:
+        return None
+    frame_seconds = min(gaps)
+    end = packets[-1][0] + frame_seconds
+
+    starts = [0]  # packet index of each chunk's first frame
+    for i, (pts, key) in enumerate(packets):
+        # Split at this keyframe if the chunk so far is long enough, and what's
+        # left isn't so short it would be better folded into this chunk
+        if (key and pts - packets[starts[-1]][0] >= chunk_seconds
+                and end - pts >= chunk_seconds / 2):
+            starts.append(i)
+    if len(starts) < 2:
+        return None
+
+    chunks = []
+    for n, first in enumerate(starts):
+        last = starts[n + 1] if n + 1 < len(starts) else len(packets)
+        pts = packets[first][0]
+        chunks.append(Chunk(
+            index=n,
+            # Half a frame early, so rounding in pts_time can't skip the keyframe itself
+            seek=max(0.0, pts - start_time - frame_seconds / 2),
+            frames=last - first,
+            duration=(packets[last][0] if last < len(packets) else end) - pts,
+        ))
+    return ChunkPlan(chunks=chunks, frames=len(packets), frame_seconds=frame_seconds,
+                     video_offset=packets[0][0] - start_time)
+
+
+def chunk_input_args(src: Path, chunk: Chunk) -> list[str]:
+    """ffmpeg input options for one chunk (everything from -ss to the input)."""
+    return ['-ss', f"{chunk.seek:.6f}", '-i', str(src)]
+
+
+def chunk_output_args(chunk: Chunk) -> list[str]:
+    """ffmpeg output options that keep a chunk to its frames and to video only."""
+    return ['-an', '-sn', '-dn', '-map', '0:v:0', '-frames:v', str(chunk.frames)]
+
+
+def _quote_concat(path: Path) -> str:
+    return "'" + str(path).replace("'", "'\\''") + "'"
+
+
+def concat_and_mux(chunk_files: list[Path], plan: ChunkPlan, src: Path, out: Path,
+                   timecode: str | None, extra_args: list[str] = ()) -> tuple[int, str]:
+    """
+    Joins the encoded chunks (stream copy) with every audio track of src,
+    into out. Returns (returncode, stderr).
+    """
+    list_file = chunk_files[0].with_name('chunks.txt')
+    list_file.write_text(''.join(f"file {_quote_concat(p)}\n" for p in chunk_files), encoding='utf-8')
+    cmd = ['ffmpeg', '-y', '-nostdin', '-loglevel', 'error', '-f', 'concat', '-safe', '0']
+    if plan.video_offset > 0:
+        cmd += ['-itsoffset', f"{plan.video_offset:.6f}"]
+    cmd += ['-i', str(list_file), '-i', str(src), '-map', '0:v:0', '-map', '1:a?', '-c', 'copy', *extra_args]
+    if timecode:
+        cmd += ['-timecode', timecode]
+    cmd.append(str(out))
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    return result.returncode, result.stderr
+
+
+def _stream_timing(path: Path, count: bool) -> dict[str, dict]:
+    """{'video'/'audio': first stream's start_time, duration and (if count) packets}."""
+    cmd = ['ffprobe', '-v', 'error', *(['-count_packets'] if count else []),
+           '-show_entries', 'stream=codec_type,start_time,duration,nb_read_packets', '-of', 'json', str(path)]
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    try:
+        streams = json.loads(result.stdout).get('streams', [])
+    except ValueError:
+        return {}
+    timing = {}
+    for stream in streams:
+        kind = stream.get('codec_type')
+        if kind in ('video', 'audio') and kind not in timing:
+            timing[kind] = stream
+    return timing
+
+
+def _seconds(stream: dict | None, key: str) -> float | None:
+    try:
+        return float(stream[key])
+    except (TypeError, KeyError, ValueError):
+        return None
+
+
+def check_output(src: Path, out: Path, plan: ChunkPlan) -> str | None:
+    """
+    Compares the joined output against the original (see the module
+    docstring). Returns what's wrong, or None if it matches.
+    """
+    source, output = _stream_timing(src, count=False), _stream_timing(out, count=True)
+    if 'video' not in output:
+        return "no video stream in the output"
+    frames = output['video'].get('nb_read_packets')
+    if frames is None or int(frames) != plan.frames:
+        return f"{frames} video frames, the original has {plan.frames}"
+
+    tolerance = plan.frame_seconds * 1.5
+    src_duration, out_duration = _seconds(source.get('video'), 'duration'), _seconds(output['video'], 'duration')
+    if src_duration is not None and out_duration is not None and abs(out_duration - src_duration) > tolerance:
+        return f"video lasts {out_duration:.3f}s, the original {src_duration:.3f}s"
+
+    if 'audio' in source:
+        if 'audio' not in output:
+            return "the audio is missing"
+        src_offset = _offset(source)
+        out_offset = _offset(output)
+        if src_offset is not None and out_offset is not None and abs(out_offset - src_offset) > tolerance:
+            return f"audio/video offset is {out_offset * 1000:+.0f} ms, the original {src_offset * 1000:+.0f} ms"
+    return None
+
+
+def _offset(timing: dict[str, dict]) -> float | None:
+    video, audio = _seconds(timing.get('video'), 'start_time'), _seconds(timing.get('audio'), 'start_time')
+    return None if video is None or audio is None else video - audio
@@ -22,42 +22,101 @@ Each file is encoded with:
 Every output is always an .mp4, mirroring the input's subfolder structure
 under the output folder (so no name collision with the source, and hvc1 is
 only ever written into a container that supports it). A file is skipped if
-its corresponding output already exists.
+its corresponding output already exists and is finished.
+
+A video that's already efficiently coded is remuxed instead: its streams
+are copied into the .mp4 as they are, with the hvc1 tag if it's HEVC and its
+timecode, which takes seconds rather than hours and costs no quality. That
+is one coded at --remux-bpp bits per pixel per frame or fewer (default:
+0.05), or one already in a codec listed in --remux-codecs (default: hevc)
+at up to REMUX_CODEC_BPP (0.1, about what this script's own encodes come
+out at), going by its probe. Re-encoding those would come out little
+smaller, or even larger. A high-bitrate HEVC camera original is still
+re-encoded. The end of the run reports the CPU-hours the remuxes saved
+and the bytes the whole batch saved.
+
+Each job's progress is journaled in the output folder (see batch_journal.py),
+so a rerun after a crash or an overnight sleep resumes exactly the jobs that
+didn't finish, and checks the finished ones against the journal instead of
+re-probing them.
 
 Each video is encoded in a single ffmpeg pass. An overall progress bar tracks
 files completed across the whole batch, with ETA, plus one progress bar per
 file currently being encoded, updated continuously from ffmpeg's own progress
 stream rather than only jumping when a file finishes.
 
-If the run looks likely to push disk usage past 90%, you'll be warned and
-asked to confirm.
+Several files are encoded at once, each held to its share of the CPU
+threads (see thread_budget.py) so that x265's own thread pools don't
+oversubscribe the machine. --bench-threads finds the fastest split.
+
+Before the batch starts, a few seconds of a few of its files are encoded
+with the real settings to predict each output's size and encode time (see
+sample_predict.py). The disk-space check, the longest-first scheduling and
+the overall ETA all use those predictions. --no-sample skips this.
+
+A file only starts encoding while the output disk is projected to stay
+under 90% full, counting what the encodes already running have yet to write
+(see disk_budget.py); otherwise it waits for one of them to finish, or is
+skipped if it wouldn't fit even on its own. If the run looks likely to skip
+files, you'll be warned and asked to confirm up front.
+
+With --worker, several runs over the same folders, on this machine or
+others sharing them, split the batch between them by leasing jobs in the
+output folder (see work_queue.py). A worker that stops heartbeating has its
+jobs taken over by the others.
 
 Usage: python3 compress_videos.py <input_folder> <output_folder> [--crf CRF] [--preset PRESET]
+                                  [--jobs N] [--bench-threads] [--no-sample] [--worker]
+                                  [--remux-bpp BPP] [--remux-codecs CODECS]
 
 Requires ffmpeg on PATH.
 """
 
 import argparse
-import os
 import platform
 import shutil
 import subprocess
 import sys
 import tempfile
 import threading
+import time
 from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import nullcontext
 from dataclasses import dataclass
 from pathlib import Path
-
-from tqdm import tqdm
-
-VIDEO_EXTS = {'.mp4', '.mov', '.m4v', '.avi', '.mkv', '.mts', '.m2ts', '.wmv', '.flv', '.webm'}
-
-WORKERS = max(1, (os.cpu_count() or 2) - 1)  # max files encoded concurrently; leave one core free
+from typing import TYPE_CHECKING
+
+import profiling
+from batch_journal import CHANGED, DONE, UNFINISHED, BatchJournal
+from disk_budget import DiskBudget, Reservation
+from sample_predict import SIZE_MARGIN, WeightedBar, predict, weights
+from thread_budget import (TOTAL_THREADS, ThreadBudget, benchmark, default_concurrency, ffmpeg_thread_args,
+                           saved_concurrency)
+from video_probe import VIDEO_EXTS, ProbeCache, VideoInfo, is_valid_video
+from video_schedule import BatchSchedule, format_duration, job_cost
+from work_files import cleanup_stale, commit, working_path
+from work_queue import POLL_SECONDS, WorkQueue
+
+if TYPE_CHECKING:  # tqdm is imported where it's used (see photosby.py)
+    from tqdm import tqdm
+
+# Files encoded at once, unless --jobs or a --bench-threads result for the settings says otherwise
+WORKERS = default_concurrency()
 DISK_WARN_PCT = 90
 
 DEFAULT_CRF = 20
 DEFAULT_PRESET = 'slow'
+# Sources at or under this many bits per pixel per frame, or in one of these
+# codecs at up to REMUX_CODEC_BPP, are remuxed rather than re-encoded (see remux_reason)
+DEFAULT_REMUX_BPP = 0.05
+DEFAULT_REMUX_CODECS = 'hevc'
+REMUX_CODEC_BPP = 0.1
+MP4_CODECS = {'h264', 'hevc', 'av1', 'vp9', 'mpeg4'}  # video codecs that can be copied into an .mp4 as-is
+WORK_TAG = 'compressing'  # working files are .<name>.compressing.tmp.mp4 (see work_files.py)
+
+# What process_file returns, with --worker, for a job it didn't run (see work_queue.py)
+HELD = 'held'            # another worker has it leased
+ELSEWHERE = 'elsewhere'  # another worker finished it, or gave up on it
 
 # Run ffmpeg at the lowest scheduling/I/O priority so it only uses spare capacity
 # and gets out of the way of foreground work. On macOS, `taskpolicy -b -d throttle`
@@ -78,31 +137,11 @@ class FileJob:
     final_path: Path
     duration: float
     timecode: str | None
-
-
-def _probe(path: Path, *entries: str, select_streams: str | None = None) -> str:
-    cmd = ['ffprobe', '-v', 'error']
-    if select_streams:
-        cmd += ['-select_streams', select_streams]
-    cmd += ['-show_entries', *entries, '-of', 'default=noprint_wrappers=1:nokey=1', str(path)]
-    result = subprocess.run(cmd, capture_output=True, text=True)
-    return result.stdout.strip()
-
-
-def get_duration(path: Path) -> float | None:
-    raw = _probe(path, 'format=duration')
-    try:
-        return float(raw)
-    except ValueError:
-        return None
-
-
-def get_timecode(path: Path) -> str | None:
-    return _probe(path, 'stream_tags=timecode', select_streams='d') or None
-
-
-def is_valid_video(path: Path) -> bool:
-    return path.exists() and path.stat().st_size > 0 and get_duration(path) is not None
+    cost: float  # see video_schedule.job_cost
+    video_codec: str | None = None
+    remux: bool = False  # stream-copied into the output rather than re-encoded (see remux_reason)
+    predicted_bytes: int | None = None  # see sample_predict.py
+    predicted_seconds: float | None = None
 
 
 def discover_videos(folder: Path) -> list[Path]:
@@ -114,11 +153,13 @@ def discover_videos(folder: Path) -> list[Path]:
 
 
 def cleanup_stale_temp_files(folder: Path) -> None:
-    """Remove .*.compressing.tmp* files left behind by a previous run that got interrupted."""
-    for p in folder.rglob('.*.compressing.tmp*'):
-        if p.is_file():
-            print(f"  Removing stale temp file from an interrupted run: {p.name}")
-            p.unlink(missing_ok=True)
+    """Remove working files and temp folders left behind by a previous run that got interrupted."""
+    cleanup_stale(folder, WORK_TAG)
+    cleanup_stale(folder, f"{WORK_TAG}.*")  # --worker ones, named for their worker
+    for p in folder.glob('.compress_videos_*'):
+        if p.is_dir():
+            print(f"  Removing stale temp folder from an interrupted run: {p.name}")
+            shutil.rmtree(p, ignore_errors=True)
 
 
 def final_path_for(video: Path, input_folder: Path) -> Path:
@@ -126,25 +167,82 @@ def final_path_for(video: Path, input_folder: Path) -> Path:
     return rel
 
 
-def build_jobs(files: list[Path], input_folder: Path, output_folder: Path) -> list[FileJob]:
-    jobs = []
+def already_compressed(video: Path, final_path: Path, journal: BatchJournal) -> bool:
+    """Whether final_path is a finished output, going by the journal where it can (see batch_journal.py)."""
+    state = journal.state(final_path)
+    if state == DONE or (state is None and final_path.exists()):
+        print(f"  SKIP (already compressed): {video.name}")
+        return True
+    if state == UNFINISHED:
+        print(f"  RESUME (unfinished in an earlier run): {video.name}")
+    elif state == CHANGED and final_path.exists():
+        print(f"  REDO (output changed since it was compressed): {video.name}")
+    return False
+
+
+def bits_per_pixel(info: VideoInfo, file_size: int) -> float | None:
+    """
+    The video stream's bits per pixel per frame, from its own bit rate or,
+    failing that, the whole file's. None if its size or frame rate is unknown.
+    """
+    if not info.size or not info.frame_rate or not info.duration:
+        return None
+    bit_rate = info.bit_rate or file_size * 8 / info.duration
+    return bit_rate / (info.width * info.height * info.frame_rate)
+
+
+def remux_reason(info: VideoInfo, file_size: int, remux_bpp: float, remux_codecs: set[str]) -> str | None:
+    """
+    Why the video is better stream-copied than re-encoded, or None if it
+    isn't. Footage coded at remux_bpp bits per pixel or fewer, or already in
+    one of remux_codecs at up to REMUX_CODEC_BPP, would take hours of
+    encoding to come out little smaller, or even larger, and a generation
+    worse. Footage whose bits per pixel can't be worked out is re-encoded.
+    """
+    if info.video_codec not in MP4_CODECS:
+        return None
+    bpp = bits_per_pixel(info, file_size)
+    if bpp is None:
+        return None
+    if bpp <= remux_bpp:
+        return f"{bpp:.3f} bits/pixel"
+    if info.video_codec in remux_codecs and bpp <= max(remux_bpp, REMUX_CODEC_BPP):
+        return f"already {info.video_codec}, {bpp:.3f} bits/pixel"
+    return None
+
+
+def build_jobs(files: list[Path], input_folder: Path, output_folder: Path, journal: BatchJournal,
+               remux_bpp: float, remux_codecs: set[str]) -> list[FileJob]:
+    todo = []
     for i, video in enumerate(files):
         final_path = output_folder / final_path_for(video, input_folder)
-        if final_path.exists():
-            print(f"  SKIP (already compressed): {video.name}")
+        if already_compressed(video, final_path, journal):
             continue
+        todo.append((i, video, final_path))
 
-        duration = get_duration(video)
-        if duration is None:
+    with ProbeCache() as cache:
+        probes = cache.probe_all([video for _, video, _ in todo])
+
+    jobs = []
+    for i, video, final_path in todo:
+        info = probes[video]
+        if info is None or info.duration is None:
             print(f"  SKIP (unreadable): {video.name}")
             continue
 
+        reason = remux_reason(info, video.stat().st_size, remux_bpp, remux_codecs)
+        if reason:
+            print(f"  REMUX ({reason}): {video.name}")
+
         jobs.append(FileJob(
             index=i,
             path=video,
             final_path=final_path,
-            duration=duration,
-            timecode=get_timecode(video),
+            duration=info.duration,
+            timecode=info.timecode,
+            cost=job_cost(info),
+            video_codec=info.video_codec,
+            remux=reason is not None,
         ))
     return jobs
 
@@ -154,25 +252,32 @@ def disk_usage_pct(folder: Path, extra_bytes: int) -> float:
     return (usage.used + extra_bytes) / usage.total * 100
 
 
+def output_estimate(job: FileJob) -> int:
+    if job.predicted_bytes is not None:
+        return int(job.predicted_bytes * SIZE_MARGIN)
+    # CRF-based encoding has no predictable target size, so without a sampled
+    # prediction assume each output is roughly the size of its source (a
+    # conservative over-estimate for archival compression, which should
+    # shrink most files).
+    return job.path.stat().st_size
+
+
 def confirm_disk_space(output_folder: Path, jobs: list[FileJob]) -> None:
-    # CRF-based encoding has no predictable target size, so fall back to
-    # assuming each output is roughly the size of its source (a conservative
-    # over-estimate for archival compression, which should shrink most files).
-    peak_extra = sum(j.path.stat().st_size for j in jobs)
+    peak_extra = sum(output_estimate(j) for j in jobs)
 
     projected = disk_usage_pct(output_folder, peak_extra)
     if projected <= DISK_WARN_PCT:
         return
 
     print(f"\nWARNING: this run is projected to push disk usage to about {projected:.0f}% "
-          f"(threshold {DISK_WARN_PCT}%).")
+          f"(threshold {DISK_WARN_PCT}%). Files that would push it past that will be skipped.")
     answer = input("Continue anyway? [y/N]: ").strip().lower()
     if answer != 'y':
         print("Aborted.")
         sys.exit(1)
 
 
-def _run_with_progress(cmd: list[str], duration_hint: float, pbars: list[tqdm],
+def _run_with_progress(cmd: list[str], duration_hint: float, pbars: list['tqdm'],
                         lock: threading.Lock) -> tuple[int, str]:
     proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
 
@@ -205,37 +310,67 @@ def _run_with_progress(cmd: list[str], duration_hint: float, pbars: list[tqdm],
     return proc.returncode, ''.join(stderr_chunks)
 
 
-def encode_file(job: FileJob, tmp_dir: Path, crf: int, preset: str,
-                 pbars: list[tqdm], lock: threading.Lock) -> Path | None:
-    tmp_out = tmp_dir / f"{job.index:04d}.mp4"
-
+def build_encode_command(job: FileJob, out: Path, crf: int, preset: str, threads: int) -> list[str]:
+    input_threads, output_threads = ffmpeg_thread_args(threads, x265=True)
     cmd = [*BACKGROUND_PREFIX, 'ffmpeg', '-y', '-nostdin', '-loglevel', 'error',
-           '-progress', 'pipe:1', '-nostats', '-i', str(job.path),
+           '-progress', 'pipe:1', '-nostats', *input_threads, '-i', str(job.path),
            '-c:v', 'libx265', '-pix_fmt', 'yuv420p10le', '-crf', str(crf), '-preset', preset,
-           '-tag:v', 'hvc1']
+           *output_threads, '-tag:v', 'hvc1']
     if job.timecode:
         cmd += ['-timecode', job.timecode]
-    cmd += ['-c:a', 'copy', str(tmp_out)]
+    return cmd + ['-c:a', 'copy', str(out)]
+
+
+def build_remux_command(job: FileJob, out: Path) -> list[str]:
+    """Copies the streams as they are, with the same tag and timecode as an encode would get."""
+    cmd = [*BACKGROUND_PREFIX, 'ffmpeg', '-y', '-nostdin', '-loglevel', 'error',
+           '-progress', 'pipe:1', '-nostats', '-i', str(job.path), '-c:v', 'copy']
+    if job.video_codec == 'hevc':
+        cmd += ['-tag:v', 'hvc1']
+    if job.timecode:
+        cmd += ['-timecode', job.timecode]
+    return cmd + ['-c:a', 'copy', str(out)]
+
 
-    returncode, stderr = _run_with_progress(cmd, job.duration, pbars, lock)
+def encode_file(job: FileJob, tmp_out: Path, crf: int, preset: str, budget: ThreadBudget, journal: BatchJournal,
+                queue: WorkQueue | None, pbars: list['tqdm'], lock: threading.Lock) -> Path | None:
+    from tqdm import tqdm
+    # A remux barely touches the CPU, so it doesn't take a share of the threads
+    with nullcontext() if job.remux else budget.lease(job.index) as threads:
+        if job.remux:
+            cmd = build_remux_command(job, tmp_out)
+        else:
+            cmd = build_encode_command(job, tmp_out, crf, preset, threads)
+        journal.started(job.final_path, job.path, cmd)
+        returncode, stderr = _run_with_progress(cmd, job.duration, pbars, lock)
 
     if returncode != 0 or not is_valid_video(tmp_out):
-        tqdm.write(f"  ERROR encoding {job.path.name}:\n{stderr.strip()[-500:]}")
+        tqdm.write(f"  ERROR {'remuxing' if job.remux else 'encoding'} {job.path.name}:\n{stderr.strip()[-500:]}")
+        if queue is None or queue.holds(job.final_path):  # else the new owner's entries stand
+            journal.failed(job.final_path, stderr)
         tmp_out.unlink(missing_ok=True)
         return None
     return tmp_out
 
 
-def finalize(job: FileJob, tmp_out: Path | None) -> bool:
+def finalize(job: FileJob, tmp_out: Path | None, reservation: Reservation, journal: BatchJournal,
+             queue: WorkQueue | None) -> bool | str:
+    from tqdm import tqdm
+    if queue is not None and not queue.holds(job.final_path):
+        tqdm.write(f"  DISCARDED (another worker took over while this one was stalled): {job.path.name}")
+        if tmp_out is not None:
+            tmp_out.unlink(missing_ok=True)
+        return ELSEWHERE
     if tmp_out is None:
         tqdm.write(f"  FAILED: {job.path.name}")
         return False
 
-    job.final_path.parent.mkdir(parents=True, exist_ok=True)
-    shutil.move(str(tmp_out), str(job.final_path))
+    commit(tmp_out, job.final_path)
+    reservation.committed()
+    journal.done(job.final_path)
 
     size_mb = job.final_path.stat().st_size / 1_048_576
-    tqdm.write(f"  Saved: {job.final_path.name}  ({size_mb:.0f} MB)")
+    tqdm.write(f"  Saved: {job.final_path.name}  ({size_mb:.0f} MB{', remuxed' if job.remux else ''})")
     return True
 
 
@@ -249,6 +384,7 @@ class FileBarPool:
     """
 
     def __init__(self, n: int, base_position: int):
+        from tqdm import tqdm
         bar_format = "  {desc}: {bar}| {percentage:3.0f}% [{elapsed}<{remaining}]"
         self._bars = [tqdm(total=1, position=base_position + i, leave=False, bar_format=bar_format)
                       for i in range(n)]
@@ -256,7 +392,7 @@ class FileBarPool:
         self._lock = threading.Lock()
         self._local = threading.local()
 
-    def acquire(self, job: 'FileJob') -> tqdm:
+    def acquire(self, job: 'FileJob') -> 'tqdm':
         if not hasattr(self._local, 'slot'):
             with self._lock:
                 self._local.slot = self._free.pop()
@@ -270,63 +406,221 @@ class FileBarPool:
             bar.close()
 
 
-def process_file(job: FileJob, tmp_dir: Path, crf: int, preset: str,
-                  overall_pbar: tqdm, file_bars: FileBarPool, lock: threading.Lock) -> bool:
-    file_pbar = file_bars.acquire(job)
-    tmp_out = encode_file(job, tmp_dir, crf, preset, [overall_pbar, file_pbar], lock)
-    return finalize(job, tmp_out)
+def finished_elsewhere(job: FileJob, journal: BatchJournal, since: float) -> bool:
+    """Whether another worker has finished job, or given up on it since `since` (see work_queue.py)."""
+    journal.refresh()
+    entry = journal.entry(job.final_path)
+    if entry is None:
+        return False
+    if entry['state'] == 'failed':
+        return entry['time'] >= since
+    return journal.state(job.final_path) == DONE
+
+
+def process_file(job: FileJob, tmp_dir: Path, crf: int, preset: str, budget: ThreadBudget, disk: DiskBudget,
+                  journal: BatchJournal, queue: WorkQueue | None, since: float, overall_pbar: 'tqdm | WeightedBar',
+                  file_bars: FileBarPool, lock: threading.Lock) -> bool | str | None:
+    """
+    Compresses one file once its output fits on disk. None if it never will
+    (skipped). With a queue (--worker), only once this worker holds its
+    lease: HELD or ELSEWHERE if it doesn't.
+    """
+    from tqdm import tqdm
+    tag = WORK_TAG
+    if queue is not None:
+        if finished_elsewhere(job, journal, since):
+            with lock:
+                overall_pbar.update(1)
+            return ELSEWHERE
+        previous = queue.claim(job.final_path)
+        if previous is None:
+            return HELD
+        if finished_elsewhere(job, journal, since):  # between the check and the claim
+            queue.release(job.final_path)
+            with lock:
+                overall_pbar.update(1)
+            return ELSEWHERE
+        if previous:
+            tqdm.write(f"  Reclaimed {job.path.name} from {previous['worker']}, which stopped heartbeating")
+        if job.final_path.parent.is_dir():
+            cleanup_stale(job.final_path.parent, f"{WORK_TAG}.*", job.final_path.stem)
+        tag = f"{WORK_TAG}.{queue.worker}"
 
+    def waiting() -> None:
+        tqdm.write(f"  Waiting for disk space: {job.path.name}")
 
-def run(input_folder: Path, output_folder: Path, crf: int, preset: str) -> None:
+    try:
+        with disk.reserve(output_estimate(job), on_wait=waiting) as reservation:
+            if reservation is None:
+                tqdm.write(f"  SKIP (would exceed {DISK_WARN_PCT}% disk usage): {job.path.name}")
+                with lock:
+                    overall_pbar.update(1)
+                return None
+            file_pbar = file_bars.acquire(job)
+            # Next to the final file, so finishing it is a rename rather than a copy
+            tmp_out = working_path(job.final_path, tag, tmp_dir)
+            reservation.track(tmp_out)
+            tmp_out = encode_file(job, tmp_out, crf, preset, budget, journal, queue,
+                                  [overall_pbar, file_pbar], lock)
+            return finalize(job, tmp_out, reservation, journal, queue)
+    finally:
+        if queue is not None:
+            queue.release(job.final_path)
+
+
+def savings_report(finished: list[FileJob], schedule: BatchSchedule, threads: int) -> list[str]:
+    """
+    Lines on what the batch saved: the encoding time its remuxes didn't spend
+    (in CPU-hours, once an encode rate is known), and the bytes all its
+    finished outputs saved over their sources.
+    """
+    lines = []
+    remuxed = [job for job in finished if job.remux]
+    if remuxed:
+        text = (f"Remuxed {len(remuxed)} file(s) ({format_duration(sum(job.duration for job in remuxed))} "
+                f"of footage) instead of re-encoding them")
+        rate = schedule.seconds_per_unit()
+        if rate:
+            cpu_hours = sum(job.cost for job in remuxed) * rate * threads / 3600
+            text += f", saving about {cpu_hours:.1f} CPU-hours"
+        lines.append(text)
+    source = sum(job.path.stat().st_size for job in finished)
+    if source:
+        saved = source - sum(job.final_path.stat().st_size for job in finished)
+        if saved >= 0:
+            lines.append(f"Saved {saved / 1e9:.2f} GB ({saved / source:.0%}) of {source / 1e9:.2f} GB of sources")
+        else:
+            lines.append(f"Outputs came out {-saved / 1e9:.2f} GB ({-saved / source:.0%}) larger than "
+                         f"their {source / 1e9:.2f} GB of sources")
+    return lines
+
+
+def run(input_folder: Path, output_folder: Path, crf: int, preset: str,
+        concurrency: int | None = None, bench_threads: bool = False, sample: bool = True,
+        worker: bool = False, remux_bpp: float = DEFAULT_REMUX_BPP,
+        remux_codecs: set[str] = frozenset({DEFAULT_REMUX_CODECS})) -> None:
+    from tqdm import tqdm
     if not shutil.which('ffmpeg') or not shutil.which('ffprobe'):
         print("ffmpeg/ffprobe not found on PATH. Install with: brew install ffmpeg")
         sys.exit(1)
 
-    if output_folder.exists():
+    # Other workers' working files are live (they clean up after dead ones themselves)
+    if output_folder.exists() and not worker:
         cleanup_stale_temp_files(output_folder)
 
     output_folder.mkdir(parents=True, exist_ok=True)
 
-    files = discover_videos(input_folder)
+    with profiling.stage('discover'):
+        files = discover_videos(input_folder)
     print(f"Found {len(files)} video file(s) in {input_folder}\n")
     if not files:
         sys.exit(0)
 
-    jobs = build_jobs(files, input_folder, output_folder)
+    journal = BatchJournal(output_folder, 'compress_videos')
+    with profiling.stage('probe'):
+        jobs = build_jobs(files, input_folder, output_folder, journal, remux_bpp, remux_codecs)
     if not jobs:
         print("\nNothing to do.")
         sys.exit(0)
+    encodes = [job for job in jobs if not job.remux]
+
+    settings = f"compress_videos libx265 {preset}"
+    if bench_threads:
+        if not encodes:
+            print("Nothing to encode: every file would be remuxed.")
+            return
+        longest = max(encodes, key=lambda j: j.cost)
+        print(f"Sample: {longest.path.name}")
+        benchmark(settings, lambda threads, out: build_encode_command(longest, out, crf, preset, threads))
+        return
 
-    # Smallest files first, so quick wins land early instead of queuing behind
-    # whatever huge file happened to sort alphabetically first.
-    jobs.sort(key=lambda j: j.path.stat().st_size)
-
-    confirm_disk_space(output_folder, jobs)
-
-    print(f"Encoder: libx265 (crf {crf}, preset {preset})")
-    print(f"{len(jobs)} file(s) to compress\n")
-
-    succeeded = failed = 0
+    n_slots = min(concurrency or saved_concurrency(settings) or WORKERS, len(jobs))
+    threads = max(1, TOTAL_THREADS // n_slots)
+    # A worker doesn't know which of the jobs it'll end up running
+    if sample and not worker and encodes:
+        with profiling.stage('sample'):
+            predictions = predict(encodes, lambda job, threads, out: build_encode_command(job, out, crf, preset, threads),
+                                  n_slots, threads)
+        for job in encodes:
+            if job.index in predictions:
+                job.predicted_bytes = predictions[job.index].bytes
+                job.predicted_seconds = predictions[job.index].seconds
+
+    if not worker:  # workers run unattended; the DiskBudget still holds back what won't fit
+        confirm_disk_space(output_folder, jobs)
+
+    # Longest first, so a long clip doesn't start last and finish alone. The
+    # remuxes take next to no time, so they go last and fill in the gaps
+    budget = ThreadBudget(TOTAL_THREADS, n_slots, len(encodes))
+    disk = DiskBudget(output_folder, DISK_WARN_PCT)
+    schedule = BatchSchedule.plan(encodes, n_slots, f"compress_videos libx265 {preset} x{n_slots}")
+    ordered = schedule.jobs + [job for job in jobs if job.remux]
+
+    print(f"Encoder: libx265 (crf {crf}, preset {preset}), {n_slots} at a time sharing {TOTAL_THREADS} threads")
+    text = f"{len(encodes)} file(s) to compress"
+    if len(jobs) > len(encodes):
+        text += f", {len(jobs) - len(encodes)} to remux"
+    print(text)
+    print(schedule.describe() + "\n")
+
+    succeeded = remuxed = failed = skipped = elsewhere = 0
+    finished = []
     lock = threading.Lock()
-    with tempfile.TemporaryDirectory(prefix='.compress_videos_', dir=output_folder) as tmp_dir_str:
+    since = time.time()
+    with (profiling.stage('encode') as encode,
+          WorkQueue(output_folder, 'compress_videos') if worker else nullcontext() as queue,
+          tempfile.TemporaryDirectory(prefix='.compress_videos_', dir=output_folder) as tmp_dir_str):
+        encode.add_bytes(sum(job.path.stat().st_size for job in jobs))
         tmp_dir = Path(tmp_dir_str)
+        if queue is not None:
+            print(f"Worker {queue.worker}, sharing jobs through {queue.dir}\n")
         bar_format = "{l_bar}{bar}| {n:.1f}/{total} [{elapsed}<{remaining}, {rate_fmt}{postfix}]"
+        # Weighted by predicted encode time, so the ETA follows the work left
+        share = weights(encodes) | {job.index: 1.0 for job in jobs if job.remux}
         with tqdm(total=len(jobs), desc="Total", unit="file", position=0, bar_format=bar_format) as pbar:
-            n_slots = min(WORKERS, len(jobs))
             file_bars = FileBarPool(n_slots, base_position=1)
+            schedule.start()
             try:
                 with ThreadPoolExecutor(max_workers=n_slots) as pool:
-                    futures = [pool.submit(process_file, job, tmp_dir, crf, preset, pbar, file_bars, lock)
-                               for job in jobs]
-                    for future in as_completed(futures):
-                        if future.result():
-                            succeeded += 1
-                        else:
-                            failed += 1
+                    pending = ordered
+                    while pending:
+                        futures = {pool.submit(process_file, job, tmp_dir, crf, preset, budget, disk, journal,
+                                               queue, since, WeightedBar(pbar, share[job.index]), file_bars,
+                                               lock): job
+                                   for job in pending}
+                        held = set()
+                        for future in as_completed(futures):
+                            result = future.result()
+                            if result == HELD:
+                                held.add(futures[future].index)
+                            elif result == ELSEWHERE:
+                                elsewhere += 1
+                            elif result is None:
+                                skipped += 1
+                            elif result:
+                                finished.append(futures[future])
+                                if futures[future].remux:
+                                    remuxed += 1
+                                else:
+                                    succeeded += 1
+                            else:
+                                failed += 1
+                        # Jobs other workers hold: wait for them to finish, or to stop heartbeating
+                        pending = [job for job in ordered if job.index in held]
+                        if pending:
+                            time.sleep(POLL_SECONDS)
             finally:
                 file_bars.close()
 
-    print(f"\nDone: {succeeded} compressed, {failed} failed.")
+    summary = f"\nDone: {succeeded} compressed, {remuxed} remuxed, {failed} failed"
+    if skipped:
+        summary += f", {skipped} skipped"
+    if elsewhere:
+        summary += f", {elsewhere} done by other workers"
+    print(summary + '.')
+    print(schedule.finish(complete=not failed and not skipped and not elsewhere))
+    for line in savings_report(finished, schedule, threads):
+        print(line)
     if failed:
         sys.exit(1)
 
@@ -344,7 +638,32 @@ def main() -> None:
     parser.add_argument('--preset', default=DEFAULT_PRESET,
                         help=f'x265 encoding preset, trading encode time for compression '
                              f'efficiency (default: {DEFAULT_PRESET})')
+    parser.add_argument('--jobs', type=int, default=None,
+                        help='Files to encode at once, sharing the CPU threads between them '
+                             '(default: the --bench-threads result for these settings, '
+                             f'or {WORKERS} on this machine)')
+    parser.add_argument('--remux-bpp', type=float, default=DEFAULT_REMUX_BPP, metavar='BPP',
+                        help='Stream-copy, rather than re-encode, videos coded at this many bits per pixel '
+                             f'per frame or fewer; 0 to re-encode them all (default: {DEFAULT_REMUX_BPP})')
+    parser.add_argument('--remux-codecs', default=DEFAULT_REMUX_CODECS, metavar='CODECS',
+                        help='Comma-separated ffprobe codec names to stream-copy at up to '
+                             f'{REMUX_CODEC_BPP} bits per pixel per frame (a looser ceiling than '
+                             '--remux-bpp; above it they\'re re-encoded like anything else); '
+                             f'empty for --remux-bpp alone to decide (default: {DEFAULT_REMUX_CODECS})')
+    parser.add_argument('--bench-threads', action='store_true',
+                        help='Instead of compressing, time a sample of the longest file at every '
+                             'split of the CPU threads between concurrent encodes, and save the '
+                             'fastest as the default --jobs for these settings')
+    parser.add_argument('--worker', action='store_true',
+                        help='Share the batch with other compress_videos.py --worker processes, on this '
+                             'host or others sharing the output folder\'s filesystem, through leases in '
+                             '<output>/.compress_videos.queue (see work_queue.py)')
+    parser.add_argument('--no-sample', action='store_true',
+                        help='Skip encoding a few seconds of a few files beforehand to predict output '
+                             'sizes and encode times for the disk-space check, scheduling and ETA')
+    profiling.add_arguments(parser)
     args = parser.parse_args()
+    profiling.check_arguments(parser, args)
 
     input_folder = args.input.expanduser().resolve()
     if not input_folder.exists():
@@ -352,8 +671,12 @@ def main() -> None:
         sys.exit(1)
 
     output_folder = args.output.expanduser().resolve()
+    if args.jobs is not None and args.jobs < 1:
+        parser.error("--jobs must be at least 1")
 
-    run(input_folder, output_folder, args.crf, args.preset)
+    with profiling.profiled(args, 'compress_videos'):
+        run(input_folder, output_folder, args.crf, args.preset, args.jobs, args.bench_threads, not args.no_sample,
+            args.worker, args.remux_bpp, {codec.strip() for codec in args.remux_codecs.split(',') if codec.strip()})
 
 
 if __name__ == '__main__':
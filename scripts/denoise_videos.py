@@ -11,36 +11,58 @@ file path as a second argument to write there instead. With --overwrite
 (mutually exclusive with an output folder/file), each source file is replaced
 in place instead (there's no way to transcode a video into its own bytes, so
 this still encodes to a temp file first and swaps it in once validated — but
-only one file's worth of extra space is ever in use at a time, and files are
-processed one at a time rather than in parallel, instead of the whole batch's
-worth of extra space at once).
-
-Each video is encoded in a single ffmpeg pass — never split into chunks.
-An earlier version chunked long videos and encoded the chunks of a single
-file in parallel, then reassembled them; that was producing ~1/3 second
-audio glitches at some chunk boundaries, so chunking was removed entirely
-rather than just serialized, to rule out any splice-related cause along
-with the concurrency itself. Parallelism instead comes from encoding
-multiple files at once (in default mode only; --overwrite still processes
-one file at a time to bound extra disk usage).
+only the files being encoded at the time need extra space, instead of the
+whole batch's worth at once).
+
+By default each video is encoded in a single ffmpeg pass. An earlier
+version chunked long videos, audio included, and encoded the chunks of a
+single file in parallel, then reassembled them; that was producing ~1/3
+second audio glitches at some chunk boundaries. Parallelism instead comes
+from encoding multiple files at once. Each of those encodes is held to its
+share of the CPU threads (see thread_budget.py), and --bench-threads finds
+the fastest split. --chunked (below) brings back chunking for the video
+stream only, as described in chunked_encode.py.
+
+Before the batch starts, a few seconds of a few of its files are encoded
+with the real filter chain to predict each output's size and encode time
+(see sample_predict.py). The disk-space checks, the longest-first scheduling
+and the overall ETA all use those predictions. --no-sample skips this.
+
+--chunked brings splitting back for long files, for the video stream only:
+chunks are cut at keyframes, encoded in parallel with no audio, joined
+without re-encoding, and the original's audio is muxed in once, whole (see
+chunked_encode.py). Each result is checked against the original's frame
+count and A/V offset, and re-encoded in a single pass if it doesn't match.
+
+Each job's progress is journaled in the folder the outputs go to (see
+batch_journal.py), so a rerun after a crash or an overnight sleep resumes
+exactly the jobs that didn't finish, and checks the finished ones against
+the journal instead of re-probing them. That includes --overwrite, where a
+rerun would otherwise denoise the already-replaced files a second time.
 
 An overall progress bar tracks files completed across the whole batch, with
-ETA, plus one progress bar per file currently being encoded (in default mode).
+ETA, plus one progress bar per file currently being encoded.
 All bars are updated continuously from ffmpeg's own progress stream as each
 file encodes, not just when it finishes, so they won't look stalled on heavy
 footage.
 
-If the run looks likely to push disk usage past 90%, you'll be warned and
-asked to confirm, with a suggestion to use --overwrite if you aren't already.
+A file only starts encoding while the disk is projected to stay under 90%
+full, counting what the encodes already running have yet to write (see
+disk_budget.py). Otherwise it waits for one of them to finish, or is skipped
+if it wouldn't fit even on its own. With --overwrite, each finished file
+frees its original's space, so that bounds the extra space in use while
+still encoding several files at once whenever there's room. If the run
+looks likely to skip files, you'll be warned and asked to confirm up front,
+with a suggestion to use --overwrite if you aren't already.
 
 Usage: python3 denoise_videos.py <folder-or-file> [output_folder-or-file] [--mbps MBPS] [--overwrite]
+                                 [--jobs N] [--bench-threads] [--chunked [SECONDS]] [--no-sample]
 
 Requires ffmpeg on PATH. Uses hevc_videotoolbox hardware encoding when
 available (Apple Silicon), falling back to libx265.
 """
 
 import argparse
-import os
 import platform
 import shutil
 import subprocess
@@ -51,21 +73,35 @@ import time
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from dataclasses import dataclass
 from pathlib import Path
+from typing import TYPE_CHECKING
+
+import profiling
+from batch_journal import CHANGED, DONE, UNFINISHED, BatchJournal
+from chunked_encode import (CHUNK_SECONDS, THREADS_PER_CHUNK, Chunk, check_output, chunk_input_args,
+                            chunk_output_args, concat_and_mux, plan_chunks)
+from disk_budget import DiskBudget, Reservation
+from sample_predict import SIZE_MARGIN, WeightedBar, predict, weights
+from thread_budget import (TOTAL_THREADS, ThreadBudget, benchmark, default_concurrency, ffmpeg_thread_args,
+                           saved_concurrency)
+from video_probe import VIDEO_EXTS, ProbeCache, VideoInfo, is_valid_video
+from video_schedule import BatchSchedule, job_cost
+from work_files import cleanup_stale, commit, working_path
+
+if TYPE_CHECKING:  # tqdm is imported where it's used (see photosby.py)
+    from tqdm import tqdm
 
-from tqdm import tqdm
-
-VIDEO_EXTS = {'.mp4', '.mov', '.m4v', '.avi', '.mkv', '.mts', '.m2ts', '.wmv', '.flv', '.webm'}
 CONTAINER_PASSTHROUGH_EXTS = {'.mp4', '.mov', '.m4v', '.mts', '.m2ts'}  # can hold HEVC as-is
 
-WORKERS = max(1, (os.cpu_count() or 2) - 1)  # max files encoded concurrently; leave one core free
+# Files encoded at once, unless --jobs or a --bench-threads result for the encoder says otherwise
+WORKERS = default_concurrency()
 DISK_WARN_PCT = 90
 
 # The VideoToolbox media-encode engine only supports a couple of concurrent
 # hardware HEVC sessions (far fewer than the CPU core count, and it varies by
 # chip) — asking for more doesn't queue, it fails outright with "Could not open
 # encoder before EOF". Cap concurrent hardware-encode sessions well below
-# WORKERS regardless of how many cores are free.
-HARDWARE_ENCODE_CONCURRENCY = min(WORKERS, 2)
+# the core count regardless of how many cores are free.
+HARDWARE_ENCODE_CONCURRENCY = min(TOTAL_THREADS, 2)
 HARDWARE_ENCODER_BUSY_MARKERS = ('Could not open encoder before EOF',)
 HARDWARE_ENCODER_MAX_ATTEMPTS = 4
 
@@ -86,52 +122,22 @@ else:
 # vaguedenoiser: wavelet-based denoiser. These are "moderate" settings — enough
 # to clean sensor noise without visibly softening detail.
 DENOISE_FILTER = 'vaguedenoiser=threshold=2:method=soft:nsteps=6:percent=85'
+WORK_TAG = 'denoising'  # working files are .<name>.denoising.tmp<ext> (see work_files.py)
 
 
 @dataclass
 class FileJob:
     index: int
     path: Path
-    output: Path      # working path ffmpeg actually writes to
-    final_path: Path  # where `output` ends up once validated (== path itself when overwriting)
+    final_path: Path  # where the output ends up once validated (== path itself when overwriting)
     duration: float
+    start_time: float
     bit_rate: int | None
     pix_fmt: str | None
     timecode: str | None
-
-
-def _probe(path: Path, *entries: str, select_streams: str | None = None) -> str:
-    cmd = ['ffprobe', '-v', 'error']
-    if select_streams:
-        cmd += ['-select_streams', select_streams]
-    cmd += ['-show_entries', *entries, '-of', 'default=noprint_wrappers=1:nokey=1', str(path)]
-    result = subprocess.run(cmd, capture_output=True, text=True)
-    return result.stdout.strip()
-
-
-def get_duration(path: Path) -> float | None:
-    raw = _probe(path, 'format=duration')
-    try:
-        return float(raw)
-    except ValueError:
-        return None
-
-
-def get_bit_rate(path: Path) -> int | None:
-    raw = _probe(path, 'stream=bit_rate', select_streams='v:0')
-    return int(raw) if raw.isdigit() else None
-
-
-def get_pix_fmt(path: Path) -> str | None:
-    return _probe(path, 'stream=pix_fmt', select_streams='v:0') or None
-
-
-def get_timecode(path: Path) -> str | None:
-    return _probe(path, 'stream_tags=timecode', select_streams='d') or None
-
-
-def is_valid_video(path: Path) -> bool:
-    return path.exists() and path.stat().st_size > 0 and get_duration(path) is not None
+    cost: float  # see video_schedule.job_cost
+    predicted_bytes: int | None = None  # see sample_predict.py
+    predicted_seconds: float | None = None
 
 
 def pick_encoder() -> list[str]:
@@ -175,12 +181,13 @@ def discover_videos(folder: Path) -> list[Path]:
     )
 
 
-def cleanup_stale_temp_files(folder: Path, pattern: str = '.*.denoising.tmp*') -> None:
-    """Remove .*.denoising.tmp* files left behind by a previous run that got interrupted."""
-    for p in folder.rglob(pattern):
-        if p.is_file():
-            print(f"  Removing stale temp file from an interrupted run: {p.name}")
-            p.unlink(missing_ok=True)
+def cleanup_stale_temp_files(folder: Path) -> None:
+    """Remove working files and temp folders left behind by a previous run that got interrupted."""
+    cleanup_stale(folder, WORK_TAG)
+    for p in folder.glob('.denoise_videos_*'):
+        if p.is_dir():
+            print(f"  Removing stale temp folder from an interrupted run: {p.name}")
+            shutil.rmtree(p, ignore_errors=True)
 
 
 def _final_path_no_output(video: Path, overwrite: bool) -> Path:
@@ -213,15 +220,8 @@ def single_final_path_for(video: Path, output: Path | None, overwrite: bool) ->
     return output  # explicit output file path, used as-is
 
 
-def working_path_for(video: Path, final: Path, overwrite: bool) -> Path:
-    if not overwrite:
-        return final  # no name collision with the source, safe to encode directly into it
-    # Dot-prefixed temp name next to the source, guaranteeing the same filesystem
-    # so the final swap is an instant rename rather than a second copy.
-    return video.with_name(f".{video.stem}.denoising.tmp{final.suffix}")
-
-
 def estimate_output_bytes(duration: float, bit_rate: int | None, mbps: float | None, path: Path) -> int:
+    """The output size implied by the bitrate it's encoded at (see output_estimate)."""
     if mbps is not None:
         return int(duration * mbps * 1_000_000 / 8)
     if bit_rate:
@@ -229,54 +229,66 @@ def estimate_output_bytes(duration: float, bit_rate: int | None, mbps: float | N
     return path.stat().st_size  # best-effort fallback: assume similar size to the source
 
 
+def output_estimate(job: FileJob, mbps: float | None) -> int:
+    if job.predicted_bytes is not None:
+        return int(job.predicted_bytes * SIZE_MARGIN)
+    return estimate_output_bytes(job.duration, job.bit_rate, mbps, job.path)
+
+
+def _job(index: int, video: Path, final_path: Path, info: VideoInfo | None, overwrite: bool) -> FileJob | None:
+    if info is None or info.duration is None:
+        print(f"  SKIP (unreadable): {video.name}")
+        return None
+    return FileJob(
+        index=index,
+        path=video,
+        final_path=final_path,
+        duration=info.duration,
+        start_time=info.start_time,
+        bit_rate=info.bit_rate,
+        pix_fmt=info.pix_fmt,
+        timecode=info.timecode,
+        cost=job_cost(info),
+    )
+
+
+def already_denoised(video: Path, final_path: Path, overwrite: bool, journal: BatchJournal) -> bool:
+    """Whether final_path is a finished output, going by the journal where it can (see batch_journal.py)."""
+    state = journal.state(final_path)
+    if state == DONE or (state is None and not overwrite and final_path.exists()):
+        print(f"  SKIP (already denoised): {video.name}")
+        return True
+    if state == UNFINISHED:
+        print(f"  RESUME (unfinished in an earlier run): {video.name}")
+    elif state == CHANGED and not overwrite and final_path.exists():
+        print(f"  REDO (output changed since it was denoised): {video.name}")
+    return False
+
+
 def build_jobs(files: list[Path], input_folder: Path, output_folder: Path | None,
-               overwrite: bool) -> list[FileJob]:
-    jobs = []
+               overwrite: bool, journal: BatchJournal) -> list[FileJob]:
+    todo = []
     for i, video in enumerate(files):
         final_path = final_path_for(video, input_folder, output_folder, overwrite)
-        if not overwrite and final_path.exists():
-            print(f"  SKIP (already denoised): {video.name}")
-            continue
-
-        duration = get_duration(video)
-        if duration is None:
-            print(f"  SKIP (unreadable): {video.name}")
+        if already_denoised(video, final_path, overwrite, journal):
             continue
+        todo.append((i, video, final_path))
 
-        jobs.append(FileJob(
-            index=i,
-            path=video,
-            output=working_path_for(video, final_path, overwrite),
-            final_path=final_path,
-            duration=duration,
-            bit_rate=get_bit_rate(video),
-            pix_fmt=get_pix_fmt(video),
-            timecode=get_timecode(video),
-        ))
-    return jobs
+    with ProbeCache() as cache:
+        probes = cache.probe_all([video for _, video, _ in todo])
+    jobs = [_job(i, video, final_path, probes[video], overwrite) for i, video, final_path in todo]
+    return [job for job in jobs if job is not None]
 
 
-def build_single_job(video: Path, output: Path | None, overwrite: bool) -> list[FileJob]:
+def build_single_job(video: Path, output: Path | None, overwrite: bool, journal: BatchJournal) -> list[FileJob]:
     final_path = single_final_path_for(video, output, overwrite)
-    if not overwrite and final_path.exists():
-        print(f"  SKIP (already denoised): {video.name}")
-        return []
-
-    duration = get_duration(video)
-    if duration is None:
-        print(f"  SKIP (unreadable): {video.name}")
+    if already_denoised(video, final_path, overwrite, journal):
         return []
 
-    return [FileJob(
-        index=0,
-        path=video,
-        output=working_path_for(video, final_path, overwrite),
-        final_path=final_path,
-        duration=duration,
-        bit_rate=get_bit_rate(video),
-        pix_fmt=get_pix_fmt(video),
-        timecode=get_timecode(video),
-    )]
+    with ProbeCache() as cache:
+        info = cache.probe_all([video])[video]
+    job = _job(0, video, final_path, info, overwrite)
+    return [job] if job is not None else []
 
 
 def disk_usage_pct(folder: Path, extra_bytes: int) -> float:
@@ -285,9 +297,11 @@ def disk_usage_pct(folder: Path, extra_bytes: int) -> float:
 
 
 def confirm_disk_space(target_folder: Path, jobs: list[FileJob], mbps: float | None, overwrite: bool) -> None:
-    estimates = [estimate_output_bytes(j.duration, j.bit_rate, mbps, j.path) for j in jobs]
-    # Overwrite mode processes one file at a time and frees each original before
-    # starting the next, so the peak extra usage is one file's worth, not the batch's.
+    estimates = [output_estimate(j, mbps) for j in jobs]
+    # Overwrite mode frees each original as its replacement is saved, and the
+    # DiskBudget holds other encodes back while space is short, so a file is
+    # only skipped if it doesn't fit even on its own. Otherwise every output
+    # is kept alongside its source, so the whole batch's worth has to fit.
     peak_extra = max(estimates, default=0) if overwrite else sum(estimates)
 
     projected = disk_usage_pct(target_folder, peak_extra)
@@ -295,11 +309,11 @@ def confirm_disk_space(target_folder: Path, jobs: list[FileJob], mbps: float | N
         return
 
     print(f"\nWARNING: this run is projected to push disk usage to about {projected:.0f}% "
-          f"(threshold {DISK_WARN_PCT}%).")
+          f"(threshold {DISK_WARN_PCT}%). Files that would push it past that will be skipped.")
     if not overwrite:
         print("Re-run with --overwrite to replace each source file in place instead of "
-              "keeping both the original and the denoised copy — that needs roughly one "
-              "file's worth of extra space at a time instead of the whole batch's.")
+              "keeping both the original and the denoised copy — that only needs the extra "
+              "space of the files being encoded at the time, not the whole batch's.")
     answer = input("Continue anyway? [y/N]: ").strip().lower()
     if answer != 'y':
         print("Aborted.")
@@ -309,7 +323,7 @@ def confirm_disk_space(target_folder: Path, jobs: list[FileJob], mbps: float | N
 _hardware_encode_slots = threading.Semaphore(HARDWARE_ENCODE_CONCURRENCY)
 
 
-def _run_with_progress(cmd: list[str], duration_hint: float, pbars: list[tqdm],
+def _run_with_progress(cmd: list[str], duration_hint: float, pbars: list['tqdm'],
                         lock: threading.Lock) -> tuple[int, str, float]:
     """Run ffmpeg, nudging pbars continuously (by fraction of the file's duration) as
     -progress reports how far into duration_hint seconds of output it's gotten — rather
@@ -346,12 +360,11 @@ def _run_with_progress(cmd: list[str], duration_hint: float, pbars: list[tqdm],
     return proc.returncode, ''.join(stderr_chunks), last_frac
 
 
-def encode_file(job: FileJob, tmp_dir: Path, encoder: list[str], hardware: bool,
-                 mbps: float | None, pbars: list[tqdm], lock: threading.Lock) -> Path | None:
+def build_encode_command(job: FileJob, out: Path, encoder: list[str], hardware: bool,
+                         mbps: float | None, threads: int, chunk: Chunk | None = None) -> list[str]:
     fmt, profile = pixel_args(job.pix_fmt, hardware)
     vf = f"{DENOISE_FILTER},{fmt}" if fmt else DENOISE_FILTER
-
-    tmp_out = tmp_dir / f"{job.index:04d}.mp4"
+    input_threads, output_threads = ffmpeg_thread_args(threads, x265=encoder[1] == 'libx265')
 
     # Hardware (VideoToolbox) encode sessions are highly sensitive to the calling
     # process's scheduling priority: macOS treats the media-encode engine as a
@@ -360,21 +373,109 @@ def encode_file(job: FileJob, tmp_dir: Path, encoder: list[str], hardware: bool,
     # slowing it down proportionally. Software encoding doesn't have this problem,
     # so only nice/background that path.
     prefix = [] if hardware else BACKGROUND_PREFIX
+    source = ['-i', str(job.path)] if chunk is None else chunk_input_args(job.path, chunk)
     cmd = [*prefix, 'ffmpeg', '-y', '-nostdin', '-loglevel', 'error',
-           '-progress', 'pipe:1', '-nostats', '-i', str(job.path),
-           '-vf', vf, *encoder, *profile, *bitrate_args(mbps, job.bit_rate)]
+           '-progress', 'pipe:1', '-nostats', *input_threads, *source,
+           '-vf', vf, *encoder, *profile, *bitrate_args(mbps, job.bit_rate), *output_threads]
+    if chunk is not None:
+        return cmd + [*chunk_output_args(chunk), str(out)]
     if job.timecode:
         cmd += ['-timecode', job.timecode]
-    cmd += ['-c:a', 'copy', str(tmp_out)]
+    return cmd + ['-c:a', 'copy', str(out)]
+
+
+def chunk_dir_for(job: FileJob, tmp_dir: Path) -> Path:
+    """Where a --chunked encode of job keeps its encoded chunks."""
+    return tmp_dir / f"{job.index:04d}.chunks"
+
+
+def encode_chunked(job: FileJob, tmp_out: Path, tmp_dir: Path, encoder: list[str], hardware: bool,
+                   mbps: float | None, chunk_seconds: float, budget: ThreadBudget, journal: BatchJournal,
+                   pbars: list['tqdm'], lock: threading.Lock) -> tuple[bool, float]:
+    """Encode job into tmp_out as parallel video-only chunks (see chunked_encode.py).
+    Returns (succeeded, fraction of pbar credit given). Files too short to split,
+    and chunked encodes that fail or don't match the original, return False so
+    the caller can encode them in one pass instead.
+    """
+    from tqdm import tqdm
+    plan = plan_chunks(job.path, job.start_time, chunk_seconds)
+    if plan is None:
+        return False, 0.0
+    chunk_dir = chunk_dir_for(job, tmp_dir)
+    chunk_dir.mkdir()
+    try:
+        with budget.lease(job.index) as threads:
+            workers = max(1, min(len(plan.chunks), threads // THREADS_PER_CHUNK))
+            if hardware:
+                workers = min(workers, HARDWARE_ENCODE_CONCURRENCY)
+            chunk_threads = max(1, threads // workers)
+            # The first chunk's command stands for the rest in the journal
+            journal.started(job.final_path, job.path,
+                            build_encode_command(job, chunk_dir / f"0000{tmp_out.suffix}", encoder, hardware,
+                                                 mbps, chunk_threads, plan.chunks[0]))
+
+            def encode_chunk(chunk: Chunk) -> tuple[Path, int, str, float]:
+                out = chunk_dir / f"{chunk.index:04d}{tmp_out.suffix}"
+                cmd = build_encode_command(job, out, encoder, hardware, mbps, chunk_threads, chunk)
+                if hardware:
+                    with _hardware_encode_slots:
+                        return out, *_run_with_progress(cmd, job.duration, pbars, lock)
+                return out, *_run_with_progress(cmd, job.duration, pbars, lock)
+
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(encode_chunk, plan.chunks))
+        credited = sum(frac for _, _, _, frac in results)
+
+        failed = next((r for r in results if r[1] != 0), None)
+        if failed is not None:
+            problem = f"a chunk failed: {failed[2].strip()[-300:]}"
+        else:
+            returncode, stderr = concat_and_mux([out for out, _, _, _ in results], plan, job.path,
+                                                tmp_out, job.timecode)
+            if returncode != 0:
+                problem = f"joining failed: {stderr.strip()[-300:]}"
+            else:
+                problem = check_output(job.path, tmp_out, plan)
+        if problem:
+            tqdm.write(f"  Chunked encode of {job.path.name} doesn't match the original ({problem}); "
+                       "encoding it in one pass instead")
+            return False, credited
+        return True, credited
+    finally:
+        shutil.rmtree(chunk_dir, ignore_errors=True)
+
+
+def encode_file(job: FileJob, tmp_out: Path, tmp_dir: Path, encoder: list[str], hardware: bool,
+                 mbps: float | None, chunk_seconds: float | None, budget: ThreadBudget,
+                 journal: BatchJournal, pbars: list['tqdm'], lock: threading.Lock) -> Path | None:
+    from tqdm import tqdm
+    if chunk_seconds:
+        chunked, credited = encode_chunked(job, tmp_out, tmp_dir, encoder, hardware, mbps,
+                                           chunk_seconds, budget, journal, pbars, lock)
+        if chunked:
+            with lock:
+                for pbar in pbars:
+                    pbar.update(1.0 - credited)
+            return tmp_out
+        # Take back the chunks' progress before starting over in one pass
+        with lock:
+            for pbar in pbars:
+                pbar.update(-credited)
+
+    def attempt_encode() -> tuple[int, str, float]:
+        with budget.lease(job.index) as threads:
+            cmd = build_encode_command(job, tmp_out, encoder, hardware, mbps, threads)
+            journal.started(job.final_path, job.path, cmd)
+            return _run_with_progress(cmd, job.duration, pbars, lock)
 
     max_attempts = HARDWARE_ENCODER_MAX_ATTEMPTS if hardware else 1
     returncode, stderr, last_frac = -1, '', 0.0
     for attempt in range(1, max_attempts + 1):
         if hardware:
             with _hardware_encode_slots:
-                returncode, stderr, last_frac = _run_with_progress(cmd, job.duration, pbars, lock)
+                returncode, stderr, last_frac = attempt_encode()
         else:
-            returncode, stderr, last_frac = _run_with_progress(cmd, job.duration, pbars, lock)
+            returncode, stderr, last_frac = attempt_encode()
 
         if returncode == 0 and is_valid_video(tmp_out):
             break
@@ -396,24 +497,27 @@ def encode_file(job: FileJob, tmp_dir: Path, encoder: list[str], hardware: bool,
 
     if returncode != 0 or not is_valid_video(tmp_out):
         tqdm.write(f"  ERROR encoding {job.path.name}:\n{stderr.strip()[-500:]}")
+        journal.failed(job.final_path, stderr)
         tmp_out.unlink(missing_ok=True)
         return None
     return tmp_out
 
 
-def finalize(job: FileJob, tmp_out: Path | None, overwrite: bool) -> bool:
+def finalize(job: FileJob, tmp_out: Path | None, reservation: Reservation, overwrite: bool,
+             journal: BatchJournal) -> bool:
+    from tqdm import tqdm
     if tmp_out is None:
         tqdm.write(f"  FAILED: {job.path.name}")
         return False
 
-    shutil.move(str(tmp_out), str(job.output))
-
-    if overwrite:
-        # Atomic rename on the same filesystem — overwrites final_path if it already
-        # exists (the same-name case), and is a directory-entry swap, not a copy.
-        job.output.replace(job.final_path)
-        if job.final_path != job.path:
-            job.path.unlink(missing_ok=True)
+    # Atomic rename on the same filesystem — overwrites final_path if it already
+    # exists (the same-name case when overwriting), and is a directory-entry swap,
+    # not a copy.
+    commit(tmp_out, job.final_path)
+    reservation.committed()
+    if overwrite and job.final_path != job.path:
+        job.path.unlink(missing_ok=True)
+    journal.done(job.final_path)
 
     size_mb = job.final_path.stat().st_size / 1_048_576
     tqdm.write(f"  Saved: {job.final_path.name}  ({size_mb:.0f} MB)")
@@ -430,6 +534,7 @@ class FileBarPool:
     """
 
     def __init__(self, n: int, base_position: int):
+        from tqdm import tqdm
         bar_format = "  {desc}: {bar}| {percentage:3.0f}% [{elapsed}<{remaining}]"
         self._bars = [tqdm(total=1, position=base_position + i, leave=False, bar_format=bar_format)
                       for i in range(n)]
@@ -437,7 +542,7 @@ class FileBarPool:
         self._lock = threading.Lock()
         self._local = threading.local()
 
-    def acquire(self, job: 'FileJob') -> tqdm:
+    def acquire(self, job: 'FileJob') -> 'tqdm':
         if not hasattr(self._local, 'slot'):
             with self._lock:
                 self._local.slot = self._free.pop()
@@ -452,15 +557,39 @@ class FileBarPool:
 
 
 def process_file(job: FileJob, tmp_dir: Path, encoder: list[str], hardware: bool, mbps: float | None,
-                  overall_pbar: tqdm, file_bars: FileBarPool, lock: threading.Lock,
-                  overwrite: bool) -> bool:
-    job.output.parent.mkdir(parents=True, exist_ok=True)
-    file_pbar = file_bars.acquire(job)
-    tmp_out = encode_file(job, tmp_dir, encoder, hardware, mbps, [overall_pbar, file_pbar], lock)
-    return finalize(job, tmp_out, overwrite)
-
-
-def run(input_path: Path, output: Path | None, mbps: float | None, overwrite: bool) -> None:
+                  chunk_seconds: float | None, budget: ThreadBudget, disk: DiskBudget, journal: BatchJournal,
+                  overall_pbar: 'tqdm | WeightedBar', file_bars: FileBarPool, lock: threading.Lock,
+                  overwrite: bool) -> bool | None:
+    """Denoises one file once its output fits on disk. None if it never will (skipped)."""
+    from tqdm import tqdm
+    needed = output_estimate(job, mbps)
+    if chunk_seconds and job.duration > chunk_seconds:
+        # The encoded chunks and the output they're joined into are on disk at once
+        needed *= 2
+
+    def waiting() -> None:
+        tqdm.write(f"  Waiting for disk space: {job.path.name}")
+
+    with disk.reserve(needed, on_wait=waiting) as reservation:
+        if reservation is None:
+            tqdm.write(f"  SKIP (would exceed {DISK_WARN_PCT}% disk usage): {job.path.name}")
+            with lock:
+                overall_pbar.update(1)
+            return None
+        file_pbar = file_bars.acquire(job)
+        # Next to the final file, so finishing it is a rename rather than a copy
+        tmp_out = working_path(job.final_path, WORK_TAG, tmp_dir)
+        reservation.track(tmp_out, chunk_dir_for(job, tmp_dir))
+        tmp_out = encode_file(job, tmp_out, tmp_dir, encoder, hardware, mbps, chunk_seconds, budget, journal,
+                              [overall_pbar, file_pbar], lock)
+        # Held until the original is gone when overwriting, so the space it frees is seen
+        return finalize(job, tmp_out, reservation, overwrite, journal)
+
+
+def run(input_path: Path, output: Path | None, mbps: float | None, overwrite: bool,
+        concurrency: int | None = None, bench_threads: bool = False,
+        chunk_seconds: float | None = None, sample: bool = True) -> None:
+    from tqdm import tqdm
     if not shutil.which('ffmpeg') or not shutil.which('ffprobe'):
         print("ffmpeg/ffprobe not found on PATH. Install with: brew install ffmpeg")
         sys.exit(1)
@@ -468,89 +597,105 @@ def run(input_path: Path, output: Path | None, mbps: float | None, overwrite: bo
     single_file = input_path.is_file()
 
     if single_file:
-        # Tmp dir and stale-temp-file cleanup both need a directory to work with;
-        # `output` here is a specific target file, not a folder, so scan the
-        # source's own parent directory rather than mirroring the folder-mode path.
+        # The fallback tmp dir needs a directory to work with; `output` here is a
+        # specific target file, not a folder, so use the source's own parent
+        # directory rather than mirroring the folder-mode path. Only this file's
+        # own stale working file is cleaned up, next to where its output goes.
         scan_root = input_path.parent
-        cleanup_stale_temp_files(scan_root, pattern=f".{input_path.stem}.denoising.tmp*")
+        final = single_final_path_for(input_path, output, overwrite)
+        if final.parent.is_dir():
+            cleanup_stale(final.parent, WORK_TAG, final.stem)
         if output is not None and not overwrite:
             output.parent.mkdir(parents=True, exist_ok=True)
-        jobs = build_single_job(input_path, output, overwrite)
-        disk_target = jobs[0].final_path.parent if jobs else scan_root
+        disk_target = final.parent
+        journal = BatchJournal(disk_target, 'denoise_videos')
+        with profiling.stage('probe'):
+            jobs = build_single_job(input_path, output, overwrite, journal)
     else:
         scan_root = input_path
         cleanup_stale_temp_files(scan_root)
         if output is not None:
             output.mkdir(parents=True, exist_ok=True)
-        files = discover_videos(input_path)
+            cleanup_stale_temp_files(output)
+        with profiling.stage('discover'):
+            files = discover_videos(input_path)
         print(f"Found {len(files)} video file(s) in {input_path}\n")
         if not files:
             sys.exit(0)
-        jobs = build_jobs(files, input_path, output, overwrite)
         disk_target = output if output is not None else scan_root
+        journal = BatchJournal(disk_target, 'denoise_videos')
+        with profiling.stage('probe'):
+            jobs = build_jobs(files, input_path, output, overwrite, journal)
 
     if not jobs:
         print("\nNothing to do.")
         sys.exit(0)
 
-    # Smallest files first, so quick wins land early instead of queuing behind
-    # whatever huge file happened to sort alphabetically first.
-    jobs.sort(key=lambda j: j.path.stat().st_size)
+    encoder = pick_encoder()
+    hardware = encoder[1] == 'hevc_videotoolbox'
+    settings = f"denoise_videos {encoder[1]}"
+    if bench_threads:
+        longest = max(jobs, key=lambda j: j.cost)
+        print(f"Sample: {longest.path.name}")
+        benchmark(settings, lambda threads, out: build_encode_command(longest, out, encoder, hardware, mbps, threads))
+        return
+
+    n_slots = min(concurrency or saved_concurrency(settings) or WORKERS, len(jobs))
+    encoders = min(n_slots, HARDWARE_ENCODE_CONCURRENCY) if hardware else n_slots
+    if sample:
+        with profiling.stage('sample'):
+            predictions = predict(
+                jobs, lambda job, threads, out: build_encode_command(job, out, encoder, hardware, mbps, threads),
+                encoders, max(1, TOTAL_THREADS // encoders))
+        for job in jobs:
+            if job.index in predictions:
+                job.predicted_bytes = predictions[job.index].bytes
+                job.predicted_seconds = predictions[job.index].seconds
 
     confirm_disk_space(disk_target, jobs, mbps, overwrite)
 
-    encoder = pick_encoder()
-    hardware = encoder[1] == 'hevc_videotoolbox'
-    print(f"{len(jobs)} file(s) to denoise\n")
+    # Longest first, so a long clip doesn't start last and finish alone
+    budget = ThreadBudget(TOTAL_THREADS, encoders, len(jobs))
+    disk = DiskBudget(disk_target, DISK_WARN_PCT)
+    schedule = BatchSchedule.plan(jobs, encoders, f"denoise_videos {encoder[1]} x{encoders}")
+    print(f"{len(jobs)} file(s) to denoise, {encoders} at a time sharing {TOTAL_THREADS} threads")
+    print(schedule.describe() + "\n")
 
     succeeded = failed = skipped = 0
     lock = threading.Lock()
-    with tempfile.TemporaryDirectory(prefix='.denoise_videos_', dir=scan_root) as tmp_dir_str:
+    with (profiling.stage('encode') as encode,
+          tempfile.TemporaryDirectory(prefix='.denoise_videos_', dir=disk_target) as tmp_dir_str):
+        encode.add_bytes(sum(job.path.stat().st_size for job in jobs))
         tmp_dir = Path(tmp_dir_str)
         bar_format = "{l_bar}{bar}| {n:.1f}/{total} [{elapsed}<{remaining}, {rate_fmt}{postfix}]"
+        # Weighted by predicted encode time, so the ETA follows the work left
+        share = weights(jobs)
         with tqdm(total=len(jobs), desc="Total", unit="file", position=0, bar_format=bar_format) as pbar:
 
-            if overwrite:
-                # One file at a time, so at most one extra file's worth of disk
-                # space is ever in use. A single file-progress bar is enough since
-                # only one file is ever active.
-                file_bars = FileBarPool(1, base_position=1)
-                try:
-                    for job in jobs:
-                        needed = estimate_output_bytes(job.duration, job.bit_rate, mbps, job.path)
-                        if disk_usage_pct(job.path.parent, needed) > DISK_WARN_PCT:
-                            tqdm.write(f"  SKIP (would exceed {DISK_WARN_PCT}% disk usage): {job.path.name}")
-                            pbar.update(1)
+            schedule.start()
+            file_bars = FileBarPool(n_slots, base_position=1)
+            try:
+                with ThreadPoolExecutor(max_workers=n_slots) as pool:
+                    futures = [pool.submit(process_file, job, tmp_dir, encoder, hardware, mbps, chunk_seconds,
+                                            budget, disk, journal, WeightedBar(pbar, share[job.index]),
+                                            file_bars, lock, overwrite)
+                               for job in schedule.jobs]
+                    for future in as_completed(futures):
+                        result = future.result()
+                        if result is None:
                             skipped += 1
-                            continue
-
-                        if process_file(job, tmp_dir, encoder, hardware, mbps, pbar, file_bars, lock, overwrite):
+                        elif result:
                             succeeded += 1
                         else:
                             failed += 1
-                finally:
-                    file_bars.close()
-            else:
-                # Files run in parallel, one progress bar each.
-                n_slots = min(WORKERS, len(jobs))
-                file_bars = FileBarPool(n_slots, base_position=1)
-                try:
-                    with ThreadPoolExecutor(max_workers=n_slots) as pool:
-                        futures = [pool.submit(process_file, job, tmp_dir, encoder, hardware, mbps,
-                                                pbar, file_bars, lock, overwrite)
-                                   for job in jobs]
-                        for future in as_completed(futures):
-                            if future.result():
-                                succeeded += 1
-                            else:
-                                failed += 1
-                finally:
-                    file_bars.close()
+            finally:
+                file_bars.close()
 
     summary = f"\nDone: {succeeded} denoised, {failed} failed"
     if skipped:
         summary += f", {skipped} skipped (disk space)"
     print(summary + '.')
+    print(schedule.finish(complete=not failed and not skipped))
     if failed:
         sys.exit(1)
 
@@ -571,10 +716,34 @@ def main() -> None:
     parser.add_argument('--overwrite', action='store_true',
                         help='Replace each source file in place instead of writing a '
                              '_denoised copy alongside it. Cannot be combined with an output folder/file.')
+    parser.add_argument('--jobs', type=int, default=None,
+                        help='Files to encode at once, sharing the CPU threads between them '
+                             '(default: the --bench-threads result for the encoder, '
+                             f'or {WORKERS} on this machine). Fewer run at once while disk space is short')
+    parser.add_argument('--bench-threads', action='store_true',
+                        help='Instead of denoising, time a sample of the longest file at every '
+                             'split of the CPU threads between concurrent encodes, and save the '
+                             'fastest as the default --jobs for the encoder')
+    parser.add_argument('--chunked', type=float, nargs='?', const=CHUNK_SECONDS, default=None,
+                        metavar='SECONDS',
+                        help='Split the video (never the audio) of long files at keyframes about '
+                             f'SECONDS apart (default: {CHUNK_SECONDS}), encode the pieces in parallel '
+                             'and join them losslessly, muxing the original audio back in once. '
+                             'Each result is checked against the original, falling back to a '
+                             'single-pass encode if it doesn\'t match')
+    parser.add_argument('--no-sample', action='store_true',
+                        help='Skip encoding a few seconds of a few files beforehand to predict output '
+                             'sizes and encode times for the disk-space check, scheduling and ETA')
+    profiling.add_arguments(parser)
     args = parser.parse_args()
+    profiling.check_arguments(parser, args)
 
     if args.output is not None and args.overwrite:
         parser.error("argument output: not allowed with argument --overwrite")
+    if args.jobs is not None and args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+    if args.chunked is not None and args.chunked <= 0:
+        parser.error("--chunked must be a positive number of seconds")
 
     input_path = args.input.expanduser().resolve()
     if not input_path.exists():
@@ -586,7 +755,9 @@ def main() -> None:
         parser.error(f"argument output: {output} is a directory, but input is a single file — "
                       "pass the exact output file path instead")
 
-    run(input_path, output, args.mbps, args.overwrite)
+    with profiling.profiled(args, 'denoise_videos'):
+        run(input_path, output, args.mbps, args.overwrite, args.jobs, args.bench_threads, args.chunked,
+            not args.no_sample)
 
 
 if __name__ == '__main__':
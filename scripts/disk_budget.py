@@ -0,0 +1,111 @@
+"""Disk-space admission control for the video batch scripts.
+
+An encode only starts while the disk its output goes to is projected to stay
+at or under a usage threshold (DISK_WARN_PCT in compress_videos.py and
+denoise_videos.py). The projection is the disk's usage right now, plus the
+rest of the estimated output of every encode in flight: its estimate less
+what its working files already hold, and nothing once its output is
+committed (it's in the usage from then on). Usage is read afresh for every
+decision, so it takes in the space an --overwrite job frees by replacing
+its original, outputs that came out smaller than estimated, and anything
+else on the machine writing or deleting files.
+
+An encode that doesn't fit waits until one in flight finishes, then tries
+again. If nothing is in flight and it still doesn't fit, it never will, and
+it's skipped.
+"""
+
+import os
+import shutil
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+
+def _written(path: Path) -> int:
+    """Bytes in the file at path, or in the files directly in the folder at path."""
+    try:
+        if not path.is_dir():
+            return os.stat(path).st_size
+        with os.scandir(path) as entries:
+            return sum(entry.stat().st_size for entry in entries if entry.is_file())
+    except OSError:
+        return 0  # not created yet, or already cleaned up
+
+
+class Reservation:
+    """An admitted encode's share of the projection."""
+
+    def __init__(self, estimate: int):
+        self.estimate = estimate
+        self.working: list[Path] = []
+        self._committed = False
+
+    def track(self, *working: Path) -> None:
+        """
+        Counts what the encode has written to the `working` files (or folders
+        of them) against its estimate.
+        """
+        self.working += working
+
+    def committed(self) -> None:
+        """
+        The output is in place, so it's in the disk's usage already: nothing
+        more is pending, even while the reservation is held (say, until an
+        --overwrite original is removed).
+        """
+        self._committed = True
+
+    def remaining(self) -> int:
+        if self._committed:
+            return 0
+        return max(0, self.estimate - sum(_written(path) for path in self.working))
+
+
+class DiskBudget:
+    """
+    Admits encodes writing to `folder`'s disk while the projection (see the
+    module docstring) stays at or under `warn_pct` percent.
+    """
+
+    def __init__(self, folder: Path, warn_pct: float):
+        self.folder = folder
+        self.warn_pct = warn_pct
+        self._active: list[Reservation] = []
+        self._changed = threading.Condition()
+
+    def projected_pct(self, extra_bytes: int = 0) -> float:
+        """Projected usage once everything in flight, and extra_bytes more, is written."""
+        usage = shutil.disk_usage(self.folder)
+        pending = sum(r.remaining() for r in self._active)
+        return (usage.used + pending + extra_bytes) / usage.total * 100
+
+    @contextmanager
+    def reserve(self, estimate: int, on_wait=None):
+        """
+        Yields a Reservation once an output of `estimate` bytes fits, or None
+        if it never will. Hold it until the output is committed (and, when
+        overwriting, the original removed). on_wait() is called once if the
+        encode has to wait for another to finish first.
+        """
+        reservation = Reservation(estimate)
+        with self._changed:
+            while self.projected_pct(estimate) > self.warn_pct:
+                if not self._active:
+                    reservation = None
+                    break
+                if on_wait is not None:
+                    on_wait()
+                    on_wait = None
+                self._changed.wait()
+            else:
+                self._active.append(reservation)
+        if reservation is None:
+            yield None
+            return
+        try:
+            yield reservation
+        finally:
+            with self._changed:
+                self._active.remove(reservation)
+                self._changed.notify_all()
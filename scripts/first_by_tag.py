@@ -1,11 +1,12 @@
 #!/usr/bin/env python3
 """Copy the earliest-captured photo for each IPTC keyword tag into a subfolder.
 
-For every image under <folder> (searched recursively), reads its IPTC
-keywords (same convention as sort_by_tag.py) and EXIF capture date. For each
-distinct keyword found across all images, writes the earliest-captured image
-bearing that keyword into the output folder, named after the keyword (e.g.
-keyword "40" -> "40.jpg"). The output folder itself is flat, regardless of
+For every image under <folder> (searched recursively), takes its IPTC
+keywords (same convention as sort_by_tag.py) and EXIF capture date from the
+shared photo catalog (photo_catalog.py). For each distinct keyword found
+across all images, writes the earliest-captured image bearing that keyword
+into the output folder, named after the keyword (e.g. keyword "40" ->
+"40.jpg"). The output folder itself is flat, regardless of
 how deep the matching source images were nested. Thumbnails are downsized to
 roughly TARGET_MEGAPIXELS and saved as JPEG at JPEG_QUALITY, regardless of
 the source format.
@@ -14,20 +15,20 @@ Usage: python3 first_by_tag.py <folder> [output_folder]
 Default output_folder: <folder>/thumbnails
 """
 
+import argparse
 import sys
 from datetime import datetime
 from pathlib import Path
 
-from PIL import Image, ImageOps
-
-from sort_by_tag import IMAGE_EXTS, get_tagged_keywords
-from timelapse import get_capture_time
+from photo_catalog import Catalog
+from sort_by_tag import IMAGE_EXTS
 
 TARGET_MEGAPIXELS = 300_000
 JPEG_QUALITY = 75
 
 
 def save_thumbnail(src: Path, dest: Path) -> None:
+    from PIL import Image, ImageOps
     with Image.open(src) as img:
         img = ImageOps.exif_transpose(img)
         pixels = img.width * img.height
@@ -39,42 +40,44 @@ def save_thumbnail(src: Path, dest: Path) -> None:
 
 
 def main():
-    if len(sys.argv) < 2:
-        print("Usage: first_by_tag.py <folder> [output_folder]")
-        sys.exit(1)
-
-    folder = Path(sys.argv[1]).expanduser().resolve()
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('folder', type=Path, help='Folder of images (searched recursively)')
+    parser.add_argument('output_folder', type=Path, nargs='?', default=None,
+                        help='Where to write the thumbnails (default: <folder>/thumbnails)')
+    args = parser.parse_args()
+
+    folder = args.folder.expanduser().resolve()
     if not folder.exists():
         print(f"Folder does not exist: {folder}")
         sys.exit(1)
 
-    output_folder = (Path(sys.argv[2]).expanduser().resolve()
-                      if len(sys.argv) > 2 else folder / "thumbnails")
+    output_folder = (args.output_folder.expanduser().resolve()
+                      if args.output_folder is not None else folder / "thumbnails")
 
-    files = sorted(p for p in folder.rglob('*')
-                   if p.is_file() and p.suffix.lower() in IMAGE_EXTS
-                   and output_folder != p and output_folder not in p.parents)
-    print(f"Found {len(files)} image(s) under {folder}\n")
+    with Catalog() as catalog:
+        images = [img for img in catalog.scan(folder, IMAGE_EXTS)
+                  if output_folder != Path(img.directory) and output_folder not in Path(img.directory).parents]
+    print(f"Found {len(images)} image(s) under {folder}\n")
 
     earliest: dict[str, tuple[datetime, Path]] = {}
     untagged = no_timestamp = 0
 
-    for photo in files:
-        keywords = get_tagged_keywords(photo)
-        if not keywords:
+    for image in images:
+        if not image.keywords:
             untagged += 1
             continue
 
-        capture_time = get_capture_time(photo)
+        capture_time = image.captured_at
         if capture_time is None:
-            print(f"  WARN: no capture date, skipping — {photo.name}")
+            print(f"  WARN: no capture date, skipping — {image.name}")
             no_timestamp += 1
             continue
 
-        for tag in keywords:
+        for tag in image.keywords:
             current = earliest.get(tag)
             if current is None or capture_time < current[0]:
-                earliest[tag] = (capture_time, photo)
+                earliest[tag] = (capture_time, Path(image.path))
 
     if not earliest:
         print("No tagged, timestamped images found.")
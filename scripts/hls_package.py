@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""Package a video as adaptive-bitrate HLS for the private galleries.
+
+One ffmpeg pass decodes the source once and encodes every rendition of the
+ladder below that fits the source (by its short side as it plays, so portrait
+clips get the same treatment, including the ones a phone stores as landscape
+with a rotation flag), as H.264/AAC in 4-second MPEG-TS segments. Keyframes
+are forced every 2 seconds on every rendition, so segments line up across
+bitrates and the player can switch at any segment boundary. Short segments
+plus a low-bitrate rendition let playback start after a few hundred KB,
+and the player then steps up to whatever the connection sustains. A master
+playlist ties the renditions together, and a poster frame is grabbed for
+the gallery to show before playback.
+
+The output directory looks like:
+
+    master.m3u8
+    720p/index.m3u8, 720p/seg_00000.ts, ...
+    480p/...
+    poster.jpg
+    package.json        (duration, size and renditions; marks a finished package)
+
+A package is built in a temporary sibling directory and renamed into place,
+so an interrupted run never leaves a half-written package behind.
+
+sync_gcs.py calls package_video() for every video in the staging tree; this
+script packages a single file by hand.
+
+Usage: python3 hls_package.py <video> <output_dir>
+
+Requires ffmpeg and ffprobe on PATH.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import threading
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from compress_videos import _run_with_progress
+from video_probe import probe
+
+if TYPE_CHECKING:  # tqdm is imported where it's used (see photosby.py)
+    from tqdm import tqdm
+
+# (short side, video kbps, audio kbps), best first
+RENDITIONS = [
+    (1080, 5000, 128),
+    (720, 2800, 128),
+    (480, 1400, 96),
+    (360, 800, 96),
+]
+SEGMENT_SECONDS = 4
+KEYFRAME_SECONDS = 2
+POSTER_SHORT_SIDE = 720
+POSTER_AT_SECONDS = 1.0
+
+MASTER_PLAYLIST = 'master.m3u8'
+POSTER_NAME = 'poster.jpg'
+INFO_NAME = 'package.json'
+
+
+@dataclass
+class VideoPackage:
+    duration: float
+    width: int
+    height: int
+    renditions: list[str]
+
+    @classmethod
+    def load(cls, package_dir: Path) -> 'VideoPackage | None':
+        """The finished package in package_dir, or None if there isn't one."""
+        try:
+            with open(package_dir / INFO_NAME, 'r', encoding='utf-8') as f:
+                return cls(**json.load(f))
+        except (OSError, ValueError, TypeError):
+            return None
+
+
+def pick_renditions(width: int, height: int) -> list[tuple[int, int, int]]:
+    """The ladder entries that don't upscale the source (at least the smallest one)."""
+    short_side = min(width, height)
+    fitting = [r for r in RENDITIONS if r[0] <= short_side]
+    if fitting:
+        return fitting
+    # Smaller than the whole ladder: one rendition at the source's own size
+    _, video_kbps, audio_kbps = RENDITIONS[-1]
+    return [(short_side - short_side % 2, video_kbps, audio_kbps)]
+
+
+def _scale_filter(short_side: int, portrait: bool) -> str:
+    # -2 keeps the other side even (as H.264 needs) while preserving the aspect ratio
+    return f"scale={short_side}:-2" if portrait else f"scale=-2:{short_side}"
+
+
+def build_hls_command(src: Path, out_dir: Path, renditions: list[tuple[int, int, int]],
+                      portrait: bool, audio: bool) -> list[str]:
+    n = len(renditions)
+    filters = [f"[0:v]split={n}" + ''.join(f"[v{i}]" for i in range(n))]
+    filters += [f"[v{i}]{_scale_filter(short, portrait)}[v{i}out]" for i, (short, _, _) in enumerate(renditions)]
+
+    cmd = ['ffmpeg', '-y', '-nostdin', '-loglevel', 'error', '-progress', 'pipe:1', '-nostats',
+           '-i', str(src), '-filter_complex', ';'.join(filters)]
+    stream_map = []
+    for i, (short, video_kbps, audio_kbps) in enumerate(renditions):
+        cmd += ['-map', f'[v{i}out]',
+                f'-b:v:{i}', f'{video_kbps}k',
+                f'-maxrate:v:{i}', f'{video_kbps * 107 // 100}k',
+                f'-bufsize:v:{i}', f'{video_kbps * 2}k']
+        if audio:
+            cmd += ['-map', '0:a:0', f'-b:a:{i}', f'{audio_kbps}k']
+            stream_map.append(f"v:{i},a:{i},name:{short}p")
+        else:
+            stream_map.append(f"v:{i},name:{short}p")
+    cmd += ['-c:v', 'libx264', '-preset', 'veryfast', '-profile:v', 'high', '-pix_fmt', 'yuv420p',
+            '-force_key_frames', f'expr:gte(t,n_forced*{KEYFRAME_SECONDS})', '-sc_threshold', '0']
+    if audio:
+        cmd += ['-c:a', 'aac', '-ac', '2']
+    cmd += ['-f', 'hls',
+            '-hls_time', str(SEGMENT_SECONDS),
+            '-hls_playlist_type', 'vod',
+            '-hls_flags', 'independent_segments',
+            '-hls_segment_filename', str(out_dir / '%v' / 'seg_%05d.ts'),
+            '-master_pl_name', MASTER_PLAYLIST,
+            '-var_stream_map', ' '.join(stream_map),
+            str(out_dir / '%v' / 'index.m3u8')]
+    return cmd
+
+
+def grab_poster(src: Path, dest: Path, duration: float, portrait: bool, short_side: int) -> bool:
+    at = min(POSTER_AT_SECONDS, duration / 2)
+    size = min(POSTER_SHORT_SIDE, short_side)
+    cmd = ['ffmpeg', '-y', '-nostdin', '-loglevel', 'error', '-ss', f"{at:.3f}", '-i', str(src),
+           '-frames:v', '1', '-vf', _scale_filter(size - size % 2, portrait), '-q:v', '3', str(dest)]
+    return subprocess.run(cmd, capture_output=True).returncode == 0 and dest.exists()
+
+
+def package_video(src: Path, package_dir: Path, pbar: 'tqdm | None' = None) -> VideoPackage | None:
+    """
+    Packages src into package_dir (replacing anything there). Encoding
+    progress is added to `pbar` (one unit per video) if given. Returns the
+    VideoPackage, or None if the source can't be read or ffmpeg fails.
+    """
+    from tqdm import tqdm
+    info = probe(src)
+    if info is None or info.duration is None or info.display_size is None:
+        tqdm.write(f"  SKIP (unreadable video): {src.name}")
+        return None
+    duration = info.duration
+    width, height = info.display_size  # a phone's portrait clip is often stored landscape
+    portrait = height > width
+    renditions = pick_renditions(width, height)
+
+    tmp_dir = package_dir.with_name(f".{package_dir.name}.packaging")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    for short, _, _ in renditions:
+        (tmp_dir / f"{short}p").mkdir(parents=True)
+
+    cmd = build_hls_command(src, tmp_dir, renditions, portrait, info.has_audio)
+    returncode, stderr = _run_with_progress(cmd, duration, [pbar] if pbar is not None else [],
+                                            threading.Lock())
+    if returncode != 0 or not (tmp_dir / MASTER_PLAYLIST).exists():
+        tqdm.write(f"  ERROR packaging {src.name}:\n{stderr.strip()[-500:]}")
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        return None
+    if not grab_poster(src, tmp_dir / POSTER_NAME, duration, portrait, min(width, height)):
+        tqdm.write(f"  WARNING: no poster frame for {src.name}")
+
+    package = VideoPackage(duration=duration, width=width, height=height,
+                           renditions=[f"{short}p" for short, _, _ in renditions])
+    with open(tmp_dir / INFO_NAME, 'w', encoding='utf-8') as f:
+        json.dump(asdict(package), f)
+
+    shutil.rmtree(package_dir, ignore_errors=True)
+    os.replace(tmp_dir, package_dir)
+    return package
+
+
+def package_files(package_dir: Path) -> list[tuple[str, os.stat_result]]:
+    """Every file a client needs from a package, as sorted (relative path, stat) pairs."""
+    files = []
+    for root, dirs, names in os.walk(package_dir):
+        dirs.sort()
+        for name in sorted(names):
+            if name == INFO_NAME:
+                continue
+            path = os.path.join(root, name)
+            files.append((os.path.relpath(path, package_dir).replace(os.sep, '/'), os.stat(path)))
+    return files
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('video', type=Path)
+    parser.add_argument('output_dir', type=Path)
+    args = parser.parse_args()
+
+    if not shutil.which('ffmpeg') or not shutil.which('ffprobe'):
+        print("ERROR: ffmpeg and ffprobe must be on PATH.")
+        sys.exit(1)
+    if not args.video.is_file():
+        print(f"ERROR: '{args.video}' not found.")
+        sys.exit(1)
+
+    from tqdm import tqdm
+    with tqdm(total=1, desc=args.video.name, bar_format="{desc}: {bar}| {percentage:3.0f}% [{elapsed}<{remaining}]") as pbar:
+        package = package_video(args.video, args.output_dir.resolve(), pbar)
+    if package is None:
+        sys.exit(1)
+    print(f"Packaged {args.video.name} ({package.width}x{package.height}, {package.duration:.1f}s) "
+          f"as {', '.join(package.renditions)} in {args.output_dir}")
+
+
+if __name__ == '__main__':
+    main()
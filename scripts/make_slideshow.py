@@ -4,6 +4,8 @@
 Each image holds on screen until the next image's capture time, so the output
 can be synced against a video recorded at the same event. The final image holds
 for the same duration as the preceding interval, or --tail seconds if given.
+Capture dates come from the shared photo catalog (photo_catalog.py), so only
+images new or changed since any script last read them are opened.
 
 Usage: python3 make_slideshow.py <folder> [output.mp4] [--tail SECONDS]
 
@@ -18,50 +20,10 @@ import tempfile
 from datetime import datetime
 from pathlib import Path
 
-from PIL import Image
+from photo_catalog import Catalog
 
 IMAGE_EXTS = {'.jpg', '.jpeg', '.tif', '.tiff', '.png'}
 
-# EXIF tag IDs
-_EXIF_IFD = 0x8769       # pointer to the Exif sub-IFD inside the main IFD
-_TAG_DTO    = 36867  # DateTimeOriginal  — original shutter time, preserved by Lightroom
-_TAG_DTD    = 36868  # DateTimeDigitized
-_TAG_DT     = 306    # DateTime          — may reflect Lightroom export time
-_TAG_SSDTO  = 37521  # SubSecTimeOriginal
-_TAG_SSDTD  = 37522  # SubSecTimeDigitized
-
-
-def _parse_subsec(raw: str | None) -> int:
-    """Convert a SubSec string (e.g. '980', '75') to microseconds."""
-    if not raw:
-        return 0
-    return int(raw.ljust(6, '0')[:6])
-
-
-def get_capture_time(path: Path) -> datetime | None:
-    try:
-        with Image.open(path) as img:
-            exif = img.getexif()
-            exif_ifd = exif.get_ifd(_EXIF_IFD)
-
-        for dt_tag, subsec_tag in ((_TAG_DTO, _TAG_SSDTO), (_TAG_DTD, _TAG_SSDTD)):
-            raw = exif_ifd.get(dt_tag)
-            if raw:
-                try:
-                    dt = datetime.strptime(raw[:19], '%Y:%m:%d %H:%M:%S')
-                    return dt.replace(microsecond=_parse_subsec(exif_ifd.get(subsec_tag)))
-                except ValueError:
-                    pass
-
-        raw = exif.get(_TAG_DT)
-        if raw:
-            return datetime.strptime(raw[:19], '%Y:%m:%d %H:%M:%S')
-
-    except Exception as e:
-        print(f"  WARN: could not read EXIF from {path.name} — {e}")
-    return None
-
-
 def _pick_encoder() -> list[str]:
     result = subprocess.run(['ffmpeg', '-encoders', '-v', 'quiet'],
                             capture_output=True, text=True)
@@ -98,14 +60,16 @@ def make_slideshow(folder: Path, output: Path, tail: float | None, interval: flo
         durations[-1] = tail if tail is not None else interval
         entries = ordered
     else:
+        with Catalog() as catalog:
+            images = catalog.scan(folder, IMAGE_EXTS)
         entries: list[tuple[datetime, Path]] = []
-        for f in files:
-            ts = get_capture_time(f)
+        for img in images:
+            ts = img.captured_at
             if ts is None:
-                print(f"  SKIP (no timestamp): {f.name}")
+                print(f"  SKIP (no timestamp): {img.name}")
             else:
-                print(f"  {ts.strftime('%Y-%m-%d %H:%M:%S')}.{ts.microsecond // 1000:03d}  {f.name}")
-                entries.append((ts, f))
+                print(f"  {ts.strftime('%Y-%m-%d %H:%M:%S')}.{ts.microsecond // 1000:03d}  {img.name}")
+                entries.append((ts, Path(img.path)))
 
         if len(entries) < 2:
             print("\nNeed at least 2 images with readable timestamps.")
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""Find near-duplicate images in the private gallery staging folders.
+
+Burst shooting leaves albums holding near-identical frames. Every staged image
+gets a 64-bit difference hash (dHash), read from a 1/8-scale JPEG draft decode
+and kept in the sync cache next to its MD5, so only new or
+changed images are decoded on later runs. Within each album, pairs of images
+whose hashes differ in at most --threshold bits are found by multi-index
+hashing rather than comparing every pair. Pairs are then chained into groups.
+
+Each group is reported in capture order. With --exclude, every image of a group
+except one is moved into the album's .near_duplicates/ folder, which
+sync_gcs.py never uploads (move files back to restore them). The image kept is
+the largest file, which is usually the sharpest frame.
+
+Usage: python3 near_duplicates.py [--staging-dir DIR] [--threshold BITS] [--exclude]
+"""
+
+import argparse
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from photo_catalog import Catalog
+from sync_gcs import (LOCAL_STAGING_DIR, SYNC_CACHE_FILENAME, HashCache, discover_galleries,
+                      read_metadata, submit_bounded)
+
+HASH_BITS = 64
+HASH_SIZE = 8  # dHash compares HASH_SIZE + 1 columns across HASH_SIZE rows
+DEFAULT_THRESHOLD = 6
+MAX_THRESHOLD = 16
+EXCLUDED_DIRNAME = '.near_duplicates'
+HASH_WORKERS = os.cpu_count() or 4
+
+
+def dhash(local_path):
+    """
+    The image's difference hash: one bit per horizontally adjacent pair of
+    pixels in a (HASH_SIZE + 1) x HASH_SIZE greyscale thumbnail, set where the
+    brightness increases. JPEGs are decoded at 1/8 scale, which is all a
+    9x8 thumbnail needs.
+    """
+    import numpy as np
+    from PIL import Image, ImageOps
+    with Image.open(local_path) as img:
+        img.draft('L', (HASH_SIZE * 8, HASH_SIZE * 8))
+        small = ImageOps.exif_transpose(img).convert('L')
+    small = small.resize((HASH_SIZE + 1, HASH_SIZE), Image.LANCZOS, reducing_gap=2.0)
+    pixels = np.asarray(small, dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).ravel()
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+def hash_images(staged_files, hash_cache):
+    """Returns {local_path: dhash} for every readable image, decoding only those not cached."""
+    from tqdm import tqdm
+    hashes = {}
+    to_hash = []
+    for staged in staged_files:
+        cached = hash_cache.dhash(staged)
+        if cached is not None:
+            hashes[staged.local_path] = cached
+        else:
+            to_hash.append(staged)
+
+    if to_hash:
+        print(f"\nHashing {len(to_hash)} image(s)...")
+        with tqdm(total=len(to_hash), desc="Hashing images", unit="image") as pbar:
+            with ThreadPoolExecutor(max_workers=HASH_WORKERS) as pool:
+                for staged, future in submit_bounded(pool, lambda s: dhash(s.local_path),
+                                                     to_hash, HASH_WORKERS):
+                    try:
+                        value = future.result()
+                    except Exception as e:
+                        print(f"  WARN: could not hash {staged.local_path}: {e}", file=sys.stderr)
+                    else:
+                        hashes[staged.local_path] = value
+                        hash_cache.set_dhash(staged, value)
+                    pbar.update(1)
+        hash_cache.save()
+    return hashes
+
+
+def candidate_pairs(hashes, threshold):
+    """
+    Index pairs (i < j) of `hashes` (a uint64 array) that may be within
+    `threshold` bits of each other, by multi-index hashing. The bits are split
+    into threshold + 1 chunks. Two hashes that close must match exactly on at
+    least one chunk (pigeonhole), so only images sharing a chunk's value in
+    some chunk are paired. Each chunk is sorted once and equal neighbours are
+    paired at increasing distances until none are left.
+    """
+    import numpy as np
+    chunks = threshold + 1
+    bounds = [HASH_BITS * k // chunks for k in range(chunks + 1)]
+    found = []
+    for shift, end in zip(bounds, bounds[1:]):
+        width = end - shift
+        keys = (hashes >> np.uint64(shift)) & np.uint64((1 << width) - 1)
+        order = np.argsort(keys, kind='stable')
+        keys = keys[order]
+        # Sorted, so if no keys match at distance d none match further apart
+        d = 1
+        while d < len(keys):
+            same = np.flatnonzero(keys[d:] == keys[:-d])
+            if not len(same):
+                break
+            found.append(np.stack([order[same], order[same + d]], axis=1))
+            d += 1
+    if not found:
+        return np.empty((0, 2), dtype=np.intp)
+    pairs = np.sort(np.concatenate(found), axis=1)
+    return np.unique(pairs, axis=0)
+
+
+def near_duplicate_groups(hashes, threshold):
+    """
+    Groups of indices into `hashes` linked by pairs within `threshold` bits,
+    each sorted, in order of their first index. Groups chain: a slow pan
+    through a burst ends up as one group even if its ends have drifted apart.
+    """
+    import numpy as np
+    pairs = candidate_pairs(hashes, threshold)
+    if not len(pairs):
+        return []
+    distances = np.bitwise_count(hashes[pairs[:, 0]] ^ hashes[pairs[:, 1]])
+    pairs = pairs[distances <= threshold]
+
+    parent = list(range(len(hashes)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i, j in pairs.tolist():
+        root_i, root_j = find(i), find(j)
+        if root_i != root_j:
+            parent[max(root_i, root_j)] = min(root_i, root_j)
+
+    groups = {}
+    for i in np.unique(pairs).tolist():
+        groups.setdefault(find(i), []).append(i)
+    return [groups[root] for root in sorted(groups)]
+
+
+def find_near_duplicates(images_by_folder, hashes, threshold):
+    """Returns {album: [group of StagedFiles, in capture order]} for albums with near duplicates."""
+    import numpy as np
+    found = {}
+    for folder, images in images_by_folder.items():
+        images = [img for img in images if img.local_path in hashes]
+        if len(images) < 2:
+            continue
+        album_hashes = np.array([hashes[img.local_path] for img in images], dtype=np.uint64)
+        groups = near_duplicate_groups(album_hashes, threshold)
+        if groups:
+            found[folder] = [[images[i] for i in group] for group in groups]
+    return found
+
+
+def exclude_near_duplicates(found):
+    """Moves all but the largest image of each group into its album's EXCLUDED_DIRNAME folder."""
+    moved = 0
+    for groups in found.values():
+        for group in groups:
+            keep = max(group, key=lambda img: img.size)
+            for img in group:
+                if img is keep:
+                    continue
+                excluded_dir = os.path.join(img.directory, EXCLUDED_DIRNAME)
+                os.makedirs(excluded_dir, exist_ok=True)
+                os.replace(img.local_path, os.path.join(excluded_dir, img.name))
+                moved += 1
+    return moved
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--staging-dir', default=LOCAL_STAGING_DIR,
+                        help=f'Staging directory to check (default: {LOCAL_STAGING_DIR})')
+    parser.add_argument('--threshold', type=int, default=DEFAULT_THRESHOLD,
+                        help=f'Most differing hash bits (of {HASH_BITS}) for two images to count as '
+                             f'near duplicates (default: {DEFAULT_THRESHOLD})')
+    parser.add_argument('--exclude', action='store_true',
+                        help=f'Move all but the largest image of each group into {EXCLUDED_DIRNAME}/')
+    args = parser.parse_args()
+
+    if not 0 <= args.threshold <= MAX_THRESHOLD:
+        parser.error(f"--threshold must be between 0 and {MAX_THRESHOLD}")
+    staging_dir = os.path.abspath(args.staging_dir)
+    if not os.path.isdir(staging_dir):
+        print(f"ERROR: Staging directory '{staging_dir}' not found.", file=sys.stderr)
+        sys.exit(1)
+
+    try:
+        galleries, staged_files, _ = discover_galleries(staging_dir)
+    except ValueError as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        sys.exit(1)
+    if not staged_files:
+        print("No images found.")
+        return
+
+    # The same catalogued metadata pass sync uses, for capture order within albums
+    with Catalog() as catalog:
+        images_by_folder = read_metadata(staged_files, sorted(galleries), catalog)
+    hash_cache = HashCache(os.path.join(staging_dir, SYNC_CACHE_FILENAME))
+    hashes = hash_images(staged_files, hash_cache)
+    found = find_near_duplicates(images_by_folder, hashes, args.threshold)
+
+    if not found:
+        print(f"\nNo near duplicates within {args.threshold} bits.")
+        return
+    total = 0
+    for folder in sorted(found):
+        print(f"\n{folder}:")
+        for group in found[folder]:
+            keep = max(group, key=lambda img: img.size)
+            print("  " + ", ".join(img.name + (" (keep)" if img is keep else "") for img in group))
+            total += len(group) - 1
+    print(f"\n{total} near duplicate(s) in {len(found)} album(s).")
+
+    if args.exclude:
+        moved = exclude_near_duplicates(found)
+        print(f"Moved {moved} image(s) into {EXCLUDED_DIRNAME}/ folders; sync_gcs.py will skip them.")
+
+
+if __name__ == '__main__':
+    main()
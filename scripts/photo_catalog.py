@@ -0,0 +1,430 @@
+#!/usr/bin/env python3
+"""A shared on-disk catalog of image metadata for the photo scripts.
+
+An image's capture time, IPTC keywords, EXIF flash and displayed size are read
+from its headers once. They are kept in a SQLite database keyed by the file's
+absolute path, and trusted while the file's size and mtime are unchanged.
+sync_gcs.py, near_duplicates.py, timelapse.py, make_slideshow.py, sort_by_tag.py
+and first_by_tag.py all read metadata through it. So a timelapse of a folder
+that was just synced parses nothing, and neither does a second sync.
+
+The database lives at $PHOTOSBY_CATALOG, or photosby/catalog.sqlite in the user
+cache directory ($XDG_CACHE_HOME, default ~/.cache). Capture times and keywords
+are indexed, so query() answers "every image tagged X between these times"
+from the catalog alone.
+
+Usage: python3 photo_catalog.py <folder> [--keyword KW] [--since ISO] [--until ISO]
+Brings the catalog up to date for <folder>, then lists its matching images by
+capture time.
+"""
+
+import argparse
+import datetime
+import os
+import sqlite3
+import sys
+from dataclasses import dataclass
+from typing import NamedTuple
+
+CATALOG_ENV = 'PHOTOSBY_CATALOG'
+CATALOG_VERSION = 1
+COMMIT_EVERY = 1000
+KEYWORD_SEPARATOR = '\x1f'
+
+# Capture times are kept as integer microseconds since this (naive) moment
+CAPTURE_EPOCH = datetime.datetime(1970, 1, 1)
+
+EXIF_IFD = 0x8769
+ORIENTATION_TAG = 0x0112
+_TAG_DT = 306              # DateTime -- may reflect Lightroom export time
+_TAG_DTO = 36867           # DateTimeOriginal -- the shutter time, preserved by Lightroom
+_TAG_DTD = 36868           # DateTimeDigitized
+_TAG_SSDTO = 37521         # SubSecTimeOriginal
+_TAG_SSDTD = 37522         # SubSecTimeDigitized
+_FLASH_TAG = 37385         # ExifIFD.Flash
+
+_SCHEMA = """
+CREATE TABLE images (
+    dir TEXT NOT NULL,
+    name TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    capture INTEGER,            -- EXIF capture time, us since CAPTURE_EPOCH; NULL if none
+    keywords TEXT NOT NULL,     -- IPTC keywords joined with KEYWORD_SEPARATOR
+    flash INTEGER,              -- EXIF flash fired (1/0); NULL if not recorded
+    width INTEGER,              -- as displayed, i.e. after EXIF orientation
+    height INTEGER,
+    PRIMARY KEY (dir, name)
+) WITHOUT ROWID;
+CREATE INDEX images_capture ON images (capture);
+CREATE TABLE keywords (
+    keyword TEXT NOT NULL COLLATE NOCASE,
+    dir TEXT NOT NULL,
+    name TEXT NOT NULL,
+    PRIMARY KEY (keyword, dir, name)
+) WITHOUT ROWID;
+CREATE INDEX keywords_image ON keywords (dir, name);
+"""
+_COLUMNS = 'dir, name, size, mtime, capture, keywords, flash, width, height'
+
+
+def default_catalog_path():
+    if os.environ.get(CATALOG_ENV):
+        return os.environ[CATALOG_ENV]
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_home, 'photosby', 'catalog.sqlite')
+
+
+def get_exif_date(img):
+    """
+    Extracts the capture date from an opened image's EXIF data, checking
+    DateTimeOriginal, DateTimeDigitized and DateTime in that order, with
+    sub-second precision where the camera recorded it.
+    """
+    try:
+        exif = img.getexif()
+        exif_ifd = exif.get_ifd(EXIF_IFD)
+        candidates = ((exif_ifd.get(_TAG_DTO), exif_ifd.get(_TAG_SSDTO)),
+                      (exif_ifd.get(_TAG_DTD), exif_ifd.get(_TAG_SSDTD)),
+                      (exif.get(_TAG_DT), None))
+        for date_str, sub_sec_str in candidates:
+            if not date_str or not isinstance(date_str, str):
+                continue
+            date_str = date_str.strip().replace('\x00', '')
+            if not date_str:
+                continue
+            full_date_str = date_str
+            if sub_sec_str and isinstance(sub_sec_str, str):
+                # Ensure sub_sec_str is not empty and contains only digits
+                sub_sec_str = sub_sec_str.strip().replace('\x00', '')
+                if sub_sec_str.isdigit():
+                    full_date_str += '.' + sub_sec_str[:6]
+
+            # Try parsing with and without fractional seconds
+            for fmt in ('%Y:%m:%d %H:%M:%S.%f', '%Y:%m:%d %H:%M:%S'):
+                try:
+                    return datetime.datetime.strptime(full_date_str, fmt)
+                except ValueError:
+                    continue
+    except Exception:
+        # Unreadable EXIF just means no capture date
+        pass
+    return None
+
+
+def get_flash(img):
+    """Returns True if flash fired, False if not, None on failure."""
+    try:
+        flash = img.getexif().get_ifd(EXIF_IFD).get(_FLASH_TAG)
+        if flash is not None:
+            return bool(int(flash) & 0x01)
+    except Exception:
+        pass
+    return None
+
+
+def get_keywords(img):
+    """
+    Extracts IPTC keywords from an opened image.
+    Returns a list of keyword strings, or an empty list if none are found.
+    Lightroom writes keywords to IPTC dataset (2, 25).
+    """
+    from PIL import IptcImagePlugin
+    try:
+        iptc = IptcImagePlugin.getiptcinfo(img)
+        if not iptc:
+            return []
+        raw = iptc.get((2, 25), [])
+        if isinstance(raw, bytes):
+            raw = [raw]
+        keywords = []
+        for kw in raw:
+            if isinstance(kw, bytes):
+                keywords.append(kw.decode('utf-8', errors='replace').strip())
+            elif isinstance(kw, str):
+                keywords.append(kw.strip())
+        return [k for k in keywords if k]
+    except Exception:
+        return []
+
+
+def oriented_size(img):
+    """An opened image's (width, height) as displayed, i.e. after its EXIF orientation."""
+    width, height = img.size
+    if img.getexif().get(ORIENTATION_TAG) in (5, 6, 7, 8):
+        return height, width
+    return width, height
+
+
+def capture_micros(timestamp):
+    """A capture datetime as integer microseconds since CAPTURE_EPOCH (timezone dropped)."""
+    return (timestamp.replace(tzinfo=None) - CAPTURE_EPOCH) // datetime.timedelta(microseconds=1)
+
+
+def read_image_headers(path):
+    """
+    Returns (capture, keywords, flash, width, height) for an image file: capture
+    in microseconds since CAPTURE_EPOCH (None without an EXIF date), flash None
+    if not recorded, and the displayed size. The image is opened once, and only
+    its headers are read -- EXIF and IPTC sit ahead of the pixel data, which is
+    never loaded. An unreadable file gives (None, [], None, None, None).
+    """
+    from PIL import Image
+    try:
+        with Image.open(path) as img:
+            exif_date = get_exif_date(img)
+            keywords = get_keywords(img)
+            flash = get_flash(img)
+            width, height = oriented_size(img)
+    except Exception:
+        return None, [], None, None, None
+    return (capture_micros(exif_date) if exif_date else None), keywords, flash, width, height
+
+
+class FileStat(NamedTuple):
+    """A file to look up, with the stat results the catalog checks its row against."""
+    directory: str
+    name: str
+    size: int
+    mtime: float
+
+
+@dataclass(slots=True)
+class CatalogImage:
+    directory: str
+    name: str
+    size: int
+    mtime: float
+    capture: int | None  # EXIF capture time in microseconds since CAPTURE_EPOCH
+    keywords: tuple
+    flash: bool | None
+    width: int | None
+    height: int | None
+
+    @property
+    def path(self):
+        return os.path.join(self.directory, self.name)
+
+    @property
+    def captured_at(self):
+        """The EXIF capture time as a naive datetime, or None."""
+        if self.capture is None:
+            return None
+        return CAPTURE_EPOCH + datetime.timedelta(microseconds=self.capture)
+
+    @property
+    def orientation(self):
+        """'landscape', 'portrait' or 'square' as displayed, or None if unreadable."""
+        if self.width is None or self.height is None:
+            return None
+        if self.width > self.height:
+            return 'landscape'
+        if self.height > self.width:
+            return 'portrait'
+        return 'square'
+
+
+class Catalog:
+    """
+    The metadata catalog (see the module docstring). Use as a context manager,
+    or close() when done. One instance per thread.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or default_catalog_path()
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._db = sqlite3.connect(self.path)
+        # Readers (another script) don't wait on a refresh in progress
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        if self._db.execute('PRAGMA user_version').fetchone()[0] != CATALOG_VERSION:
+            # New, or an older layout: it's only a cache, so start afresh
+            self._db.executescript('DROP TABLE IF EXISTS keywords; DROP TABLE IF EXISTS images;'
+                                   + _SCHEMA + f'PRAGMA user_version = {CATALOG_VERSION};')
+        self._keyword_sets = {}
+
+    def close(self):
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _keywords(self, text):
+        # Every image with the same keywords shares one tuple
+        keywords = self._keyword_sets.get(text)
+        if keywords is None:
+            keywords = self._keyword_sets[text] = tuple(text.split(KEYWORD_SEPARATOR)) if text else ()
+        return keywords
+
+    def _image(self, row):
+        directory, name, size, mtime, capture, keywords, flash, width, height = row
+        return CatalogImage(directory, name, size, mtime, capture, self._keywords(keywords),
+                            None if flash is None else bool(flash), width, height)
+
+    def _store(self, images):
+        if not images:
+            return
+        with self._db:
+            self._db.executemany(f'INSERT OR REPLACE INTO images ({_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', [
+                (img.directory, img.name, img.size, img.mtime, img.capture,
+                 KEYWORD_SEPARATOR.join(img.keywords), img.flash, img.width, img.height)
+                for img in images
+            ])
+            self._delete_keywords([(img.directory, img.name) for img in images])
+            self._db.executemany('INSERT OR IGNORE INTO keywords VALUES (?, ?, ?)', [
+                (kw, img.directory, img.name) for img in images for kw in img.keywords
+            ])
+
+    def _delete_keywords(self, keys):
+        self._db.executemany('DELETE FROM keywords WHERE dir = ? AND name = ?', keys)
+
+    def lookup(self, files, progress=None):
+        """
+        Yields (file, CatalogImage) for each of `files` in order. Each file is
+        anything with directory, name, size and mtime attributes, such as a
+        FileStat or a sync_gcs.StagedFile. Only files new or changed since they
+        were catalogued have their headers read. Rows are fetched a directory at
+        a time, so files should come grouped by directory. `progress` (a tqdm
+        bar) ticks once per file.
+        """
+        pending = []
+        rows_dir, directory, rows = None, None, {}
+        try:
+            for f in files:
+                if f.directory != rows_dir:
+                    rows_dir = f.directory
+                    directory = os.path.abspath(rows_dir)
+                    rows = {row[1]: row for row in self._db.execute(
+                        f'SELECT {_COLUMNS} FROM images WHERE dir = ?', (directory,))}
+                row = rows.get(f.name)
+                if row is not None and row[2] == f.size and row[3] == f.mtime:
+                    image = self._image(row)
+                else:
+                    capture, keywords, flash, width, height = read_image_headers(
+                        os.path.join(directory, f.name))
+                    image = CatalogImage(directory, f.name, f.size, f.mtime, capture,
+                                         self._keywords(KEYWORD_SEPARATOR.join(keywords)),
+                                         flash, width, height)
+                    pending.append(image)
+                    if len(pending) >= COMMIT_EVERY:
+                        self._store(pending)
+                        pending = []
+                if progress is not None:
+                    progress.update(1)
+                yield f, image
+        finally:
+            self._store(pending)
+
+    def scan(self, folder, exts, recursive=True, desc="Reading metadata"):
+        """
+        Brings the catalog up to date for every file under `folder` (recursively
+        unless told otherwise) whose lowercased extension is in `exts`, and
+        returns their CatalogImages sorted by path. Rows for files that have
+        gone from the scanned directories are dropped.
+        """
+        from tqdm import tqdm
+        folder = os.path.abspath(folder)
+        dirs = []
+        files = []
+        for dirpath, dirnames, filenames in os.walk(folder):
+            dirnames.sort()
+            dirs.append(dirpath)
+            for name in sorted(filenames):
+                if os.path.splitext(name)[1].lower() in exts:
+                    st = os.stat(os.path.join(dirpath, name))
+                    files.append(FileStat(dirpath, name, st.st_size, st.st_mtime))
+            if not recursive:
+                break
+
+        with tqdm(total=len(files), desc=desc, unit="file") as pbar:
+            images = [image for _, image in self.lookup(files, pbar)]
+        self._prune(dirs, {(f.directory, f.name) for f in files})
+        images.sort(key=lambda img: img.path)
+        return images
+
+    def _prune(self, dirs, present):
+        gone = [
+            (directory, name)
+            for directory in dirs
+            for (name,) in self._db.execute('SELECT name FROM images WHERE dir = ?', (directory,))
+            # Files outside this scan's extensions are only dropped if they're gone too
+            if (directory, name) not in present and not os.path.exists(os.path.join(directory, name))
+        ]
+        if gone:
+            with self._db:
+                self._db.executemany('DELETE FROM images WHERE dir = ? AND name = ?', gone)
+                self._delete_keywords(gone)
+
+    def query(self, folder=None, keyword=None, since=None, until=None):
+        """
+        CatalogImages already in the catalog, by capture time: those under
+        `folder` (recursively), carrying `keyword` (in any case) and captured in
+        [since, until) (naive datetimes). Any left as None don't filter. The
+        catalog alone answers, through its indexes; scan() a folder first to
+        bring it up to date.
+        """
+        columns = ', '.join(f'i.{c.strip()}' for c in _COLUMNS.split(','))
+        sql = f'SELECT {columns} FROM images i'
+        where, params = [], []
+        if keyword is not None:
+            sql += ' JOIN keywords k ON k.dir = i.dir AND k.name = i.name'
+            where.append('k.keyword = ?')
+            params.append(keyword)
+        if folder is not None:
+            folder = os.path.abspath(folder)
+            # Everything under folder sorts between "folder/" and "folder0"
+            where.append('(i.dir = ? OR (i.dir >= ? AND i.dir < ?))')
+            params += [folder, folder + os.sep, folder + chr(ord(os.sep) + 1)]
+        if since is not None:
+            where.append('i.capture >= ?')
+            params.append(capture_micros(since))
+        if until is not None:
+            where.append('i.capture < ?')
+            params.append(capture_micros(until))
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        sql += ' ORDER BY i.capture, i.dir, i.name'
+        return [self._image(row) for row in self._db.execute(sql, params)]
+
+    def move(self, src, dest):
+        """Records that the file at src was renamed to dest, which keeps its size, mtime and row current."""
+        old = os.path.split(os.path.abspath(src))
+        new = os.path.split(os.path.abspath(dest))
+        with self._db:
+            self._db.execute('DELETE FROM images WHERE dir = ? AND name = ?', new)
+            self._delete_keywords([new])
+            self._db.execute('UPDATE images SET dir = ?, name = ? WHERE dir = ? AND name = ?', new + old)
+            self._db.execute('UPDATE keywords SET dir = ?, name = ? WHERE dir = ? AND name = ?', new + old)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('folder', help='Folder of images (searched recursively)')
+    parser.add_argument('--keyword', default=None, help='Only images with this keyword (any case)')
+    parser.add_argument('--since', type=datetime.datetime.fromisoformat, default=None,
+                        help='Only images captured at or after this time, e.g. 2026-03-14T18:00')
+    parser.add_argument('--until', type=datetime.datetime.fromisoformat, default=None,
+                        help='Only images captured before this time')
+    parser.add_argument('--catalog', default=None,
+                        help=f'Catalog database (default: ${CATALOG_ENV} or {default_catalog_path()})')
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.folder):
+        print(f"Folder does not exist: {args.folder}")
+        sys.exit(1)
+
+    with Catalog(args.catalog) as catalog:
+        catalog.scan(args.folder, ('.jpg', '.jpeg', '.png', '.gif', '.webp', '.tif', '.tiff'))
+        images = catalog.query(args.folder, keyword=args.keyword, since=args.since, until=args.until)
+    for image in images:
+        captured = image.captured_at.isoformat(sep=' ') if image.captured_at else '(no capture time)'
+        print(f"{captured:<26}  {image.path}  [{', '.join(image.keywords)}]")
+    print(f"\n{len(images)} image(s).")
+
+
+if __name__ == '__main__':
+    main()
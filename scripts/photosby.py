@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""One command for every photo and video tool in scripts/.
+
+    photosby <command> [args...]      run a tool (photosby <command> --help for its options)
+    photosby startup-bench [...]      time how long every command takes to start
+
+Each command is a script in this folder with a main(), run exactly as if it
+had been launched directly. Only the chosen command's module is imported.
+The scripts import Pillow, NumPy, tqdm, requests and the Google Cloud client
+inside the functions that use them rather than at the top of the module, so
+--help, usage errors and runs that never need them start on the standard
+library alone. Keep new imports of those packages out of module level, or
+every command that imports the module pays for them on startup (check with
+startup-bench).
+
+startup-bench runs `photosby <command> --help` for every command in a fresh
+interpreter, --repeat times, and reports the median and fastest wall time,
+the time over a bare `python -c pass`, and the slowest top-level import (from
+python -X importtime).
+"""
+
+import importlib
+import os
+import sys
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# command -> (module, summary)
+COMMANDS = {
+    'sync-gcs': ('sync_gcs', 'Sync the staging folders to the private gallery bucket'),
+    'near-duplicates': ('near_duplicates', 'Find near-duplicate images in the staging albums'),
+    'photo-catalog': ('photo_catalog', 'Refresh and query the shared photo metadata catalog'),
+    'sort-by-tag': ('sort_by_tag', 'Move Lightroom exports into subfolders by NN_ tag'),
+    'first-by-tag': ('first_by_tag', 'Copy the earliest photo for each keyword as a thumbnail'),
+    'watermark-proofs': ('watermark_proofs', 'Make watermarked preview proofs of a photo tree'),
+    'make-slideshow': ('make_slideshow', 'MP4 slideshow timed by EXIF capture time'),
+    'timelapse': ('timelapse', 'MP4 timelapse with a fixed interval per image'),
+    'stitch-gopro': ('stitch_gopro', 'Join GoPro chapter files into continuous videos'),
+    'denoise-videos': ('denoise_videos', 'Denoise a video or folder of videos'),
+    'compress-videos': ('compress_videos', 'Compress a folder of videos with libx265 for archival'),
+    'video-probe': ('video_probe', 'Probe videos through the shared ffprobe cache'),
+    'hls-package': ('hls_package', 'Package one video as adaptive-bitrate HLS'),
+    'bench-sync': ('bench_sync', 'Benchmark sync_gcs.py against a local target'),
+    'profile-compare': ('profiling', 'Compare --profile reports side by side'),
+}
+BENCH_COMMAND = 'startup-bench'
+DEFAULT_REPEAT = 10
+
+
+def print_usage(file=sys.stdout):
+    print("usage: photosby <command> [args...]\n\ncommands:", file=file)
+    width = max(len(name) for name in [*COMMANDS, BENCH_COMMAND])
+    for name, (_, summary) in COMMANDS.items():
+        print(f"  {name:<{width}}  {summary}", file=file)
+    print(f"  {BENCH_COMMAND:<{width}}  Time how long every command takes to start", file=file)
+    print("\nRun 'photosby <command> --help' for a command's options.", file=file)
+
+
+def run_command(name, args):
+    module = importlib.import_module(COMMANDS[name][0])
+    # argparse takes the program name from argv[0]
+    sys.argv = [f"photosby {name}", *args]
+    return module.main()
+
+
+def _top_level_imports(importtime_log):
+    """{module: cumulative ms} for the top-level imports in python -X importtime output."""
+    imports = {}
+    for line in importtime_log.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if name.startswith('  ') or not cumulative.strip().isdigit():
+            continue  # nested import, or the header
+        imports[name.strip()] = int(cumulative) / 1000
+    return imports
+
+
+def _importtime_log(args):
+    import subprocess
+    return subprocess.run([sys.executable, '-X', 'importtime', *args],
+                          stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True).stderr
+
+
+def _time_run(cmd, repeat):
+    import statistics
+    import subprocess
+    import time
+
+    times = []
+    returncode = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        times.append((time.perf_counter() - start) * 1000)
+        returncode = returncode or result.returncode
+    return statistics.median(times), min(times), returncode
+
+
+def startup_bench(args):
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(prog=f"photosby {BENCH_COMMAND}",
+                                     description="Time `photosby <command> --help` for every command.")
+    parser.add_argument('commands', nargs='*', metavar='COMMAND',
+                        help='Commands to time (default: all)')
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT,
+                        help=f'Runs per command (default: {DEFAULT_REPEAT})')
+    parser.add_argument('--json', default=None, help='Also write the results as JSON to this path')
+    args = parser.parse_args(args)
+    unknown = [name for name in args.commands if name not in COMMANDS]
+    if unknown:
+        parser.error(f"unknown command(s): {', '.join(unknown)}")
+    if args.repeat < 1:
+        parser.error("--repeat must be at least 1")
+
+    baseline, _, _ = _time_run([sys.executable, '-c', 'pass'], args.repeat)
+    # Whatever the bare interpreter loads (site and its .pth hooks) isn't the command's doing
+    preloaded = set(_top_level_imports(_importtime_log(['-c', 'pass'])))
+    print(f"Bare interpreter: {baseline:.1f} ms (median of {args.repeat})\n")
+    header = f"{'command':<18}{'median':>10}{'fastest':>10}{'over bare':>11}  slowest import"
+    print(header)
+    print('-' * (len(header) + 20))
+
+    results = {}
+    for name in args.commands or COMMANDS:
+        cmd = [sys.executable, os.path.join(SCRIPT_DIR, 'photosby.py'), name, '--help']
+        median, fastest, returncode = _time_run(cmd, args.repeat)
+        imports = {module: ms for module, ms in _top_level_imports(_importtime_log(cmd[1:])).items()
+                   if module not in preloaded}
+        slowest, slowest_ms = max(imports.items(), key=lambda item: item[1], default=(None, 0.0))
+        results[name] = {
+            'median_ms': round(median, 2),
+            'fastest_ms': round(fastest, 2),
+            'over_bare_ms': round(median - baseline, 2),
+            'slowest_import': slowest,
+            'slowest_import_ms': round(slowest_ms, 2),
+            'exit_code': returncode,
+        }
+        note = '' if returncode == 0 else f"  (exit {returncode})"
+        print(f"{name:<18}{median:>8.1f}ms{fastest:>8.1f}ms{median - baseline:>9.1f}ms  "
+              f"{slowest} ({slowest_ms:.1f} ms){note}")
+
+    if args.json is not None:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'python': sys.version.split()[0], 'repeat': args.repeat,
+                       'bare_ms': round(baseline, 2), 'commands': results}, f, indent=2)
+        print(f"\nSaved: {args.json}")
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] in ('-h', '--help'):
+        print_usage(sys.stdout if argv else sys.stderr)
+        sys.exit(0 if argv else 2)
+    name, args = argv[0], argv[1:]
+    if name == BENCH_COMMAND:
+        return startup_bench(args)
+    if name not in COMMANDS:
+        print(f"photosby: unknown command '{name}'\n", file=sys.stderr)
+        print_usage(sys.stderr)
+        sys.exit(2)
+    return run_command(name, args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+"""Profiling and stage timing for the photo and video scripts.
+
+Scripts that call add_arguments() take:
+
+    --profile PREFIX        write PREFIX.json (the run report) and PREFIX.pstats
+    --profile-sample MS     sample every thread's stack every MS ms instead of
+                            tracing with cProfile, writing PREFIX.collapsed
+
+cProfile traces every call, but only on the thread that started it and at a
+noticeable cost. Sampling is cheap enough for a run of several hours and
+sees the worker threads too. Its PREFIX.collapsed holds one "frame;frame;...
+count" line per distinct stack, which flamegraph.pl and speedscope read. A
+.pstats file opens in `python -m pstats` or snakeviz.
+
+While a profiled run is active, stage(name) blocks add wall time, CPU time
+and bytes to that stage. A stage's cpu_s is the whole process's CPU time
+(all its threads) while the stage ran, so stages that overlap, on different
+threads, are each charged all of it. stage(name, thread=True) counts only
+the calling thread's CPU time instead, for a stage that does all its work
+on that thread. children_cpu_s is the CPU time of child processes, such as
+ffmpeg, that finished during the stage. Outside a profiled run a stage does
+nothing. Stages may be entered from several threads at once.
+Every report has the same layout, so runs on different days, machines or
+branches line up:
+
+    python3 profiling.py before.json after.json [...]
+
+prints their totals and stages side by side, relative to the first.
+"""
+
+import datetime
+import json
+import os
+import platform
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+
+REPORT_FORMAT = 1
+HOTSPOTS = 25
+MAX_SAMPLE_DEPTH = 128
+
+_active = None  # the ProfiledRun in progress, if any
+
+
+@dataclass
+class StageStats:
+    calls: int = 0
+    wall_s: float = 0.0
+    cpu_s: float = 0.0           # process CPU during the stage, or thread CPU with stage(thread=True)
+    children_cpu_s: float = 0.0
+    bytes: int = 0
+
+    def __post_init__(self):
+        self._lock = threading.Lock()
+
+    def add_bytes(self, n):
+        """Counts n bytes against the stage; safe to call from worker threads."""
+        with self._lock:
+            self.bytes += n
+
+
+def _clock(thread=False):
+    t = os.times()
+    cpu = time.thread_time() if thread else time.process_time()
+    return time.perf_counter(), cpu, t.children_user + t.children_system
+
+
+@contextmanager
+def stage(name, thread=False):
+    """
+    Adds the enclosed block to stage `name` of the active profiled run, and
+    yields the stage's StageStats so the block can count the bytes it moves.
+    With `thread`, only this thread's CPU time counts (see the module
+    docstring). Without a profiled run, yields a throwaway StageStats and
+    records nothing.
+    """
+    run = _active
+    if run is None:
+        yield StageStats()
+        return
+    with run.lock:
+        stats = run.stages.setdefault(name, StageStats())
+    wall, cpu, children = _clock(thread)
+    try:
+        yield stats
+    finally:
+        end_wall, end_cpu, end_children = _clock(thread)
+        with stats._lock:
+            stats.calls += 1
+            stats.wall_s += end_wall - wall
+            stats.cpu_s += end_cpu - cpu
+            stats.children_cpu_s += end_children - children
+
+
+class StackSampler:
+    """Samples the stack of every other thread every `interval` seconds."""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profiling-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < MAX_SAMPLE_DEPTH:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                self.stacks[tuple(reversed(stack))] += 1
+            self.samples += 1
+
+    def write_collapsed(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{';'.join(frame.replace(';', ':') for frame in stack)} {count}\n")
+
+    def hotspots(self):
+        """The most sampled functions: samples with them on top (self) and anywhere in the stack (total)."""
+        own = Counter()
+        total = Counter()
+        for stack, count in self.stacks.items():
+            own[stack[-1]] += count
+            for frame in set(stack):
+                total[frame] += count
+        return [
+            {'function': frame, 'self_s': round(own[frame] * self.interval, 3),
+             'total_s': round(total[frame] * self.interval, 3)}
+            for frame, _ in total.most_common(HOTSPOTS)
+        ]
+
+
+def _peak_rss_mb():
+    try:
+        import resource
+    except ImportError:  # not on Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, KiB elsewhere
+    return round(peak / 2**20 if sys.platform == 'darwin' else peak / 2**10, 1)
+
+
+def _pstats_hotspots(profiler):
+    import pstats
+    stats = pstats.Stats(profiler)
+    rows = []
+    for (filename, line, name), (_, calls, own, cumulative, _) in stats.stats.items():
+        rows.append({'function': f"{name} ({os.path.basename(filename)}:{line})", 'calls': calls,
+                     'self_s': round(own, 3), 'total_s': round(cumulative, 3)})
+    rows.sort(key=lambda row: row['total_s'], reverse=True)
+    return rows[:HOTSPOTS]
+
+
+class ProfiledRun:
+    """One profiled run of a tool, writing its report files under `prefix` when finished."""
+
+    def __init__(self, tool, prefix, sample_ms=None):
+        self.tool = tool
+        self.prefix = prefix
+        self.sample_ms = sample_ms
+        self.stages = {}
+        self.lock = threading.Lock()
+        self._profiler = None
+        self._sampler = None
+
+    def start(self):
+        self.started = datetime.datetime.now().astimezone()
+        self._start = _clock()
+        if self.sample_ms:
+            self._sampler = StackSampler(self.sample_ms / 1000)
+            self._sampler.start()
+        else:
+            import cProfile
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+
+    def finish(self, exit_code):
+        """Stops profiling and writes the report; returns the paths written."""
+        wall, cpu, children = (end - start for end, start in zip(_clock(), self._start))
+        if self._profiler is not None:
+            self._profiler.disable()
+        else:
+            self._sampler.stop()
+
+        directory = os.path.dirname(os.path.abspath(self.prefix))
+        os.makedirs(directory, exist_ok=True)
+        written = []
+        if self._profiler is not None:
+            self._profiler.dump_stats(self.prefix + '.pstats')
+            written.append(self.prefix + '.pstats')
+            hotspots = _pstats_hotspots(self._profiler)
+        else:
+            self._sampler.write_collapsed(self.prefix + '.collapsed')
+            written.append(self.prefix + '.collapsed')
+            hotspots = self._sampler.hotspots()
+
+        report = {
+            'format': REPORT_FORMAT,
+            'tool': self.tool,
+            'argv': sys.argv[1:],
+            'started': self.started.isoformat(timespec='seconds'),
+            'host': platform.node(),
+            'platform': platform.platform(),
+            'python': platform.python_version(),
+            'cpu_count': os.cpu_count(),
+            'mode': 'sample' if self._sampler is not None else 'cprofile',
+            'sample_ms': self.sample_ms,
+            'exit_code': exit_code,
+            'wall_s': round(wall, 3),
+            'cpu_s': round(cpu, 3),
+            'children_cpu_s': round(children, 3),
+            'peak_rss_mb': _peak_rss_mb(),
+            'stages': {
+                name: {key: round(value, 3) if isinstance(value, float) else value
+                       for key, value in asdict(stats).items()}
+                for name, stats in self.stages.items()
+            },
+            'hotspots': hotspots,
+        }
+        with open(self.prefix + '.json', 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        written.insert(0, self.prefix + '.json')
+        return written
+
+
+def add_arguments(parser):
+    """Adds --profile and --profile-sample to an argparse parser."""
+    parser.add_argument('--profile', default=None, metavar='PREFIX',
+                        help='Profile the run, writing PREFIX.json (stage timings and hotspots) '
+                             'and PREFIX.pstats (see profiling.py)')
+    parser.add_argument('--profile-sample', type=float, default=None, metavar='MS',
+                        help='With --profile, sample all threads every MS ms instead of tracing '
+                             'with cProfile (for long runs; writes PREFIX.collapsed)')
+
+
+def check_arguments(parser, args):
+    """Rejects --profile-sample without --profile, or with a non-positive interval."""
+    if args.profile_sample is None:
+        return
+    if not args.profile:
+        parser.error("--profile-sample needs --profile")
+    if args.profile_sample <= 0:
+        parser.error("--profile-sample must be a positive number of milliseconds")
+
+
+@contextmanager
+def profiled(args, tool):
+    """
+    Profiles the enclosed block as a run of `tool` if args.profile is set
+    (see add_arguments), and does nothing otherwise. The report is written
+    even if the block exits through sys.exit() or an exception.
+    """
+    global _active
+    if not getattr(args, 'profile', None):
+        yield None
+        return
+    if _active is not None:
+        raise RuntimeError("a profiled run is already in progress")
+    run = ProfiledRun(tool, args.profile, args.profile_sample)
+    _active = run
+    run.start()
+    exit_code = 0
+    try:
+        yield run
+    except SystemExit as e:
+        exit_code = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+        raise
+    except BaseException:
+        exit_code = 1
+        raise
+    finally:
+        _active = None
+        written = run.finish(exit_code)
+        print(f"\nProfile written to {', '.join(written)}", file=sys.stderr)
+
+
+def _load_report(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        report = json.load(f)
+    if report.get('format') != REPORT_FORMAT:
+        raise ValueError(f"{path} is not a format {REPORT_FORMAT} profile report")
+    return report
+
+
+def _cell(value, base, unit):
+    if value is None:
+        return '-'
+    text = f"{value:.2f}{unit}" if isinstance(value, float) else f"{value}{unit}"
+    if base:
+        text += f" ({(value - base) / base * 100:+.0f}%)"
+    return text
+
+
+def compare_reports(reports, names):
+    """Prints reports' totals and stages side by side, each relative to the first."""
+    rows = [('tool', [r['tool'] for r in reports], None),
+            ('started', [r['started'] for r in reports], None),
+            ('host', [r['host'] for r in reports], None),
+            ('mode', [r['mode'] for r in reports], None)]
+    for key, unit in (('wall_s', 's'), ('cpu_s', 's'), ('children_cpu_s', 's'), ('peak_rss_mb', ' MB')):
+        rows.append((key, [r.get(key) for r in reports], unit))
+    stage_names = []
+    for report in reports:
+        stage_names += [name for name in report['stages'] if name not in stage_names]
+    for name in stage_names:
+        for key, unit in (('wall_s', 's'), ('cpu_s', 's'), ('children_cpu_s', 's')):
+            rows.append((f"{name}.{key}", [r['stages'].get(name, {}).get(key) for r in reports], unit))
+        sizes = [r['stages'].get(name, {}).get('bytes') for r in reports]
+        if any(sizes):
+            rows.append((f"{name}.MB", [None if b is None else b / 2**20 for b in sizes], ''))
+
+    cells = []
+    for label, values, unit in rows:
+        if unit is None:
+            cells.append((label, [str(v) for v in values]))
+        else:
+            cells.append((label, [_cell(v, values[0] if i else None, unit) for i, v in enumerate(values)]))
+    label_width = max(len(label) for label, _ in cells)
+    widths = [max(len(names[i]), *(len(row[i]) for _, row in cells)) for i in range(len(reports))]
+    print(' ' * label_width + ''.join(f"  {name:>{w}}" for name, w in zip(names, widths)))
+    for label, row in cells:
+        print(f"{label:<{label_width}}" + ''.join(f"  {cell:>{w}}" for cell, w in zip(row, widths)))
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('reports', nargs='+', help='Report .json files written by --profile')
+    args = parser.parse_args()
+    try:
+        reports = [_load_report(path) for path in args.reports]
+    except (OSError, ValueError) as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        sys.exit(1)
+    compare_reports(reports, [os.path.splitext(os.path.basename(p))[0] for p in args.reports])
+
+
+if __name__ == '__main__':
+    main()
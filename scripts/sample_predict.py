@@ -0,0 +1,153 @@
+"""Predict each video's encoded size and encode time from a few short samples.
+
+Before a batch starts, compress_videos.py and denoise_videos.py encode a few
+seconds from the start, middle and end of a handful of its files. The
+samples use the real command: the same encoder, filter chain and bitrate or
+CRF, and the same number of encodes at once with the same thread share as
+the batch will use. So they take in how hard each file's footage actually is
+to encode, which its duration and resolution alone can't.
+
+A sampled file's size and time are extrapolated from its own samples:
+output bytes and wall seconds per second of video, times its duration. The
+rest of the batch is extrapolated from the sampled files. Its output size
+is taken as a ratio of its source size, and its time from its cost (see
+video_schedule.job_cost). When the batch has more files than get sampled,
+the sampled ones are spread across the range of costs. Files too short to be
+worth sampling (not much longer than the samples themselves) are left out,
+and if that's all of them there's no prediction.
+
+The disk-space check and DiskBudget use the predicted sizes, with a margin.
+The scheduler orders jobs by predicted time and prints a predicted makespan.
+The overall progress bar weights each file by its predicted time, so its ETA
+tracks the work left rather than the number of files left.
+"""
+
+import statistics
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+
+SAMPLE_COUNT = 3          # per sampled file
+SAMPLE_SECONDS = 3.0      # of video per sample
+MAX_SAMPLED_FILES = 6
+SIZE_MARGIN = 1.1         # headroom on predicted sizes for the disk-space checks
+
+
+@dataclass
+class Prediction:
+    bytes: int
+    seconds: float        # wall time to encode, at the batch's concurrency
+
+
+def sample_starts(duration: float, count: int = SAMPLE_COUNT, seconds: float = SAMPLE_SECONDS) -> list[float]:
+    """Start times of `count` samples spread evenly through `duration` seconds."""
+    return [max(0.0, (i + 0.5) * duration / count - seconds / 2) for i in range(count)]
+
+
+def worth_sampling(duration: float) -> bool:
+    return duration > 4 * SAMPLE_COUNT * SAMPLE_SECONDS
+
+
+def sample_command(cmd: list[str], start: float, seconds: float) -> list[str]:
+    """An encode command (ending with its output path) cut down to one sample."""
+    i = cmd.index('-i')
+    return [*cmd[:i], '-ss', f"{start:.3f}", *cmd[i:-1], '-t', str(seconds), cmd[-1]]
+
+
+def representative(jobs: list, count: int = MAX_SAMPLED_FILES) -> list:
+    """Up to `count` jobs spread evenly across the range of costs, longest included."""
+    ordered = sorted(jobs, key=lambda job: job.cost)
+    if len(ordered) <= count:
+        return ordered
+    step = (len(ordered) - 1) / (count - 1)
+    return [ordered[round(i * step)] for i in range(count)]
+
+
+def predict(jobs: list, make_cmd, concurrency: int, threads: int) -> dict[int, Prediction]:
+    """
+    Predictions for jobs (with index, path, final_path, duration and cost),
+    keyed by job index; empty if none are worth sampling. make_cmd(job,
+    threads, out) is the job's full encode command, ending with the output
+    path. Samples run `concurrency` at a time with `threads` threads each.
+    """
+    sampled = representative([job for job in jobs if worth_sampling(job.duration)])
+    if not sampled:
+        return {}
+    print(f"Sampling {len(sampled)} file(s) to predict output sizes and encode times...")
+
+    with tempfile.TemporaryDirectory(prefix='.sample_predict_') as tmp:
+        def encode_sample(task: tuple) -> tuple[int, int, float] | None:
+            n, job, start = task
+            out = Path(tmp) / f"{n}{job.final_path.suffix}"
+            cmd = sample_command(make_cmd(job, threads, out), start, SAMPLE_SECONDS)
+            began = time.perf_counter()
+            result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            wall = time.perf_counter() - began
+            if result.returncode != 0 or not out.exists():
+                return None
+            size = out.stat().st_size
+            out.unlink()
+            return job.index, size, wall
+
+        tasks = [(len(sampled) * i + n, job, start)
+                 for n, job in enumerate(sampled)
+                 for i, start in enumerate(sample_starts(job.duration))]
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+            results = [r for r in pool.map(encode_sample, tasks) if r is not None]
+
+    per_job: dict[int, list[tuple[int, float]]] = {}
+    for index, size, wall in results:
+        per_job.setdefault(index, []).append((size, wall))
+    predictions = {}
+    for job in sampled:
+        samples = per_job.get(job.index)
+        if not samples:
+            continue
+        video_seconds = SAMPLE_SECONDS * len(samples)
+        predictions[job.index] = Prediction(
+            bytes=int(sum(size for size, _ in samples) / video_seconds * job.duration),
+            seconds=sum(wall for _, wall in samples) / video_seconds * job.duration,
+        )
+    if not predictions:
+        return {}
+
+    by_index = {job.index: job for job in jobs}
+    size_ratio = statistics.median(p.bytes / max(1, by_index[i].path.stat().st_size)
+                                   for i, p in predictions.items())
+    rates = [p.seconds / by_index[i].cost for i, p in predictions.items() if by_index[i].cost > 0]
+    seconds_per_cost = statistics.median(rates) if rates else 0.0
+    for job in jobs:
+        if job.index not in predictions:
+            predictions[job.index] = Prediction(bytes=int(job.path.stat().st_size * size_ratio),
+                                                seconds=job.cost * seconds_per_cost)
+    return predictions
+
+
+class WeightedBar:
+    """
+    Passes one job's progress (0 to 1) on to the batch's overall progress
+    bar, scaled by `weight`: its predicted time relative to the average job's.
+    """
+
+    def __init__(self, bar, weight: float):
+        self.bar = bar
+        self.weight = weight
+
+    def update(self, n: float) -> None:
+        self.bar.update(n * self.weight)
+
+
+def weights(jobs: list) -> dict[int, float]:
+    """Each job's predicted time relative to the average, keyed by index (1.0 without predictions)."""
+    if any(job.predicted_seconds is None for job in jobs):
+        return {job.index: 1.0 for job in jobs}
+    total = sum(job.predicted_seconds for job in jobs)
+    if total <= 0:
+        return {job.index: 1.0 for job in jobs}
+    # A hair under len(jobs) in all, so rounding in the many small updates
+    # can't carry the bar past its total
+    scale = len(jobs) / total * (1 - 1e-9)
+    return {job.index: job.predicted_seconds * scale for job in jobs}
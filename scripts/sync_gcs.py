@@ -1,20 +1,186 @@
 import os
 import sys
+import re
+import zlib
 import json
+import argparse
+import time
 import hashlib
-from google.cloud import storage
-from PIL import Image, IptcImagePlugin
+import mimetypes
+import threading
+import shutil
 from io import BytesIO
 import datetime
-from tqdm import tqdm
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from urllib.parse import quote
+
+from compress_videos import VIDEO_EXTS
+from hls_package import MASTER_PLAYLIST, POSTER_NAME, VideoPackage, package_files, package_video
+import profiling
+from photo_catalog import ORIENTATION_TAG, Catalog, capture_micros, oriented_size
+from sync_targets import open_target
 
 # --- Configuration ---
 GCS_BUCKET_NAME = "photos-by-logan-content"
 # Construct the absolute path to the staging directory relative to the script's location
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 LOCAL_STAGING_DIR = os.path.normpath(os.path.join(SCRIPT_DIR, "..", "backend", "gcs_local_staging"))
+SA_KEY_PATH = os.path.join(SCRIPT_DIR, '..', 'backend', 'gcp-sa-key.json')
 # ---------------------
 
+IMAGE_EXTS = ('.png', '.jpg', '.jpeg', '.gif', '.webp')
+IMAGE_CACHE_CONTROL = 'public, max-age=3600'
+
+# Videos in an album are packaged as HLS (see hls_package.py) into
+# HLS_CACHE_DIRNAME inside the staging directory, one package per source MD5,
+# so a video is only re-encoded when it changes. Packages are published under
+# <album>/videos/<md5>/ -- or with --dedupe, _objects/<md5>/hls/ -- and listed
+# in the album manifest's "videos".
+HLS_CACHE_DIRNAME = ".sync_hls"
+VIDEOS_DIRNAME = "videos"
+mimetypes.add_type('video/mp2t', '.ts')  # not TypeScript/Qt Linguist, whatever the system map says
+
+# Every image in a multiple-exposure sequence is also published as "levels":
+# JPEGs scaled so the sequence's base has each of OVERLAY_LEVEL_EDGES as its
+# long edge (smaller than the original only), with every overlay scaled to the
+# base's exact size. The viewer blends the smallest level that covers the
+# screen. Levels are rendered once into LEVELS_CACHE_DIRNAME, one folder per
+# source MD5, and published under <album>/levels/<md5>/ -- or with --dedupe,
+# _objects/<md5>/levels/. LEVELS_INDEX_NAME remembers each base's displayed
+# size, so planning levels for unchanged sequences opens no images.
+OVERLAY_LEVEL_EDGES = (640, 1280, 2048)
+OVERLAY_LEVEL_QUALITY = 82
+LEVELS_CACHE_DIRNAME = ".sync_levels"
+LEVELS_DIRNAME = "levels"
+LEVELS_INDEX_NAME = "index.json"
+LEVEL_WORKERS = os.cpu_count() or 4
+
+# --- Upload tuning ---
+# Files below RESUMABLE_UPLOAD_THRESHOLD go up in a single request. Larger files
+# use a resumable session sent in RESUMABLE_CHUNK_SIZE pieces (must be a multiple
+# of 256 KiB), whose session URI is persisted in UPLOAD_SESSIONS_FILENAME (inside
+# the staging directory) so an interrupted sync resumes from the last committed
+# byte rather than byte zero.
+# Files at or above COMPOSITE_UPLOAD_THRESHOLD are split into COMPOSITE_PART_SIZE
+# parts uploaded in parallel and composed server-side, so one large TIFF/video
+# isn't limited to a single TCP stream's throughput.
+RESUMABLE_UPLOAD_THRESHOLD = 8 * 1024 * 1024
+RESUMABLE_CHUNK_SIZE = 16 * 1024 * 1024
+RESUMABLE_CHUNK_ATTEMPTS = 5
+COMPOSITE_UPLOAD_THRESHOLD = 128 * 1024 * 1024
+COMPOSITE_PART_SIZE = 32 * 1024 * 1024
+COMPOSITE_UPLOAD_WORKERS = 8
+# GCS gives a composite (XML multipart) upload no md5Hash, so the local MD5 is
+# stored in the object's custom metadata under this key for later comparisons.
+COMPOSITE_MD5_METADATA_KEY = 'md5'
+UPLOAD_SESSIONS_FILENAME = ".sync_upload_sessions.json"
+
+# Local MD5s of staged files, reused across runs while a file's size and mtime
+# are unchanged -- so neither comparison nor dedupe re-reads unchanged images.
+SYNC_CACHE_FILENAME = ".sync_cache.json"
+SYNC_CACHE_FORMAT = 4
+
+# With --dedupe, image bytes live once under OBJECTS_PREFIX/<md5>/<filename>
+# and each album's manifest maps its filenames to those objects. The original
+# filename is kept as the object's leaf so gallery URLs still end in it.
+OBJECTS_PREFIX = "_objects/"
+
+# Manifests are published as compact, gzip-encoded JSON under a content-hashed
+# name (manifest.<hash>.json) that never changes once written, so it can be
+# cached for a year. A tiny pointer object names the current version (in both
+# its body and its metadata, so readers can follow it from a metadata fetch)
+# and is the only thing clients need to revalidate.
+MANIFEST_POINTER_NAME = "manifest-pointer.json"
+MANIFEST_VERSION_RE = re.compile(r'^manifest\.[0-9a-f]{16}\.json$')
+MANIFEST_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+MANIFEST_POINTER_CACHE_CONTROL = 'no-cache'
+# Manifests are serialized, hashed, written and compressed in pieces of about
+# this size, so even a 50k-image album's manifest is never held whole.
+MANIFEST_CHUNK_SIZE = 64 * 1024
+
+# Only these fields are requested when listing the bucket
+LISTING_FIELDS = 'items(name,size,md5Hash,cacheControl,metadata),nextPageToken'
+
+# Capture times are kept as integer microseconds since photo_catalog.CAPTURE_EPOCH
+CAPTURE_TICKS_PER_SECOND = 1_000_000
+
+# --- Upload concurrency ---
+# The number of files uploading at once is tuned live, AIMD-style: every
+# UPLOAD_ADJUST_INTERVAL seconds the measured throughput is compared with the
+# previous window's. Any upload error halves the concurrency; a throughput gain
+# of more than UPLOAD_GAIN_THRESHOLD adds one worker; a comparable drop (the
+# link is saturated and extra workers just contend) removes one.
+UPLOAD_INITIAL_WORKERS = 2
+UPLOAD_MAX_WORKERS = 32
+UPLOAD_ADJUST_INTERVAL = 3.0
+UPLOAD_GAIN_THRESHOLD = 0.05
+UPLOAD_ATTEMPTS = 3
+THROTTLE_READ_SIZE = 256 * 1024
+
+# --- Plan / apply ---
+# A plan lists every upload, patch, manifest write and delete a sync will make.
+# Applying one runs each kind of step on APPLY_WORKERS threads. Its duration
+# estimate assumes --max-mbps (or PLAN_ASSUMED_MBPS) for the bytes, plus
+# PLAN_REQUEST_SECONDS of latency per API call spread across the workers.
+PLAN_FORMAT = 1
+APPLY_WORKERS = 32
+PLAN_ASSUMED_MBPS = 50.0
+PLAN_REQUEST_SECONDS = 0.1
+
+
+@dataclass(slots=True)
+class StagedFile:
+    """
+    An image found in the staging tree, carrying the stat results taken during
+    discovery so later stages (metadata, comparison) never have to re-stat it --
+    on a network-mounted staging drive each stat is a full round trip.
+
+    It is also the image's only record for the rest of the sync: metadata and
+    the destination path are filled in on it rather than in a per-image dict.
+    The folder, directory and keyword tuple are shared by every image that has
+    them, and the capture time is a plain int, so a 50k-image sync stays small.
+    """
+    folder: str
+    name: str
+    directory: str
+    size: int
+    mtime: float
+    timestamp: int = 0  # capture time in microseconds since CAPTURE_EPOCH
+    keywords: tuple = ()
+    flash: bool | None = None
+    gcs_path: str | None = None
+
+    @property
+    def local_path(self):
+        return os.path.join(self.directory, self.name)
+
+
+@dataclass(slots=True)
+class RemoteObject:
+    """
+    The few properties of a listed bucket object the planner looks at. The
+    listing is boiled down to these as it streams in, rather than keeping a
+    full Blob (and its properties dict) alive for every object in the bucket.
+    """
+    name: str
+    size: int | None
+    md5_hash: str | None
+    cache_control: str | None
+    metadata: dict | None
+
+    @classmethod
+    def from_blob(cls, blob):
+        return cls(blob.name, blob.size, blob.md5_hash, blob.cache_control, blob.metadata or None)
+
+
+def list_remote_objects(bucket):
+    """Lists every object in the bucket as RemoteObjects, asking GCS for just those fields."""
+    return [RemoteObject.from_blob(blob) for blob in bucket.list_blobs(fields=LISTING_FIELDS)]
+
+
 def calculate_md5_hash(file_path):
     """
     Calculate MD5 hash of a local file.
@@ -25,26 +191,99 @@ def calculate_md5_hash(file_path):
             hash_md5.update(chunk)
     return hash_md5.hexdigest()
 
-def files_are_identical(local_file_path, gcs_blob):
+class HashCache:
+    """
+    MD5 hex digests and perceptual hashes (see near_duplicates.py) of staged
+    files, persisted to a JSON file and keyed by local path. An entry is only
+    trusted while the file's size and mtime (cached from discovery) still match,
+    so a file is read for hashing once per change. Image metadata lives in the
+    shared photo catalog instead (see photo_catalog.py).
+
+    Entries are kept as flat [size, mtime, md5, dhash] rows (on disk too)
+    rather than dicts -- at 50k images the cache is one of the largest things
+    a no-change sync holds.
+    """
+
+    _SIZE, _MTIME, _MD5, _DHASH = range(4)
+
+    def __init__(self, path):
+        self._path = path
+        self._dirty = False
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('format') in (2, 3):
+                # Rows from before metadata moved to the catalog keep their hashes
+                dhash_at = 6 if data['format'] == 3 else None
+                data['entries'] = {
+                    path: [row[0], row[1], row[2], row[dhash_at] if dhash_at else None]
+                    for path, row in data['entries'].items()
+                }
+                data['format'] = SYNC_CACHE_FORMAT
+                self._dirty = True
+            # Caches from older versions are simply rebuilt
+            self._entries = data['entries'] if data.get('format') == SYNC_CACHE_FORMAT else {}
+        except (OSError, ValueError, AttributeError, KeyError, IndexError, TypeError):
+            self._entries = {}
+
+    def _entry(self, staged_file):
+        entry = self._entries.get(staged_file.local_path)
+        if entry and entry[self._SIZE] == staged_file.size and entry[self._MTIME] == staged_file.mtime:
+            return entry
+        # Missing or stale: start afresh, dropping whatever the old file had cached
+        entry = [staged_file.size, staged_file.mtime, None, None]
+        self._entries[staged_file.local_path] = entry
+        self._dirty = True
+        return entry
+
+    def md5(self, staged_file):
+        entry = self._entry(staged_file)
+        if entry[self._MD5] is None:
+            entry[self._MD5] = calculate_md5_hash(staged_file.local_path)
+            self._dirty = True
+        return entry[self._MD5]
+
+    def dhash(self, staged_file):
+        """Returns the file's cached perceptual hash, or None."""
+        return self._entry(staged_file)[self._DHASH]
+
+    def set_dhash(self, staged_file, value):
+        self._entry(staged_file)[self._DHASH] = value
+        self._dirty = True
+
+    def save(self):
+        if not self._dirty:
+            return
+        tmp_path = self._path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'format': SYNC_CACHE_FORMAT, 'entries': self._entries}, f, separators=(',', ':'))
+        os.replace(tmp_path, self._path)
+        self._dirty = False
+
+
+def files_are_identical(staged_file, gcs_blob, hash_cache=None):
     """
     Compare local file with GCS blob to determine if they are identical.
     Uses MD5 hash comparison as primary method, with file size as a quick pre-check.
     
     Args:
-        local_file_path (str): Path to the local file
+        staged_file (StagedFile): The local file, with its size cached from discovery
         gcs_blob: Google Cloud Storage blob object
+        hash_cache (HashCache): Optional cache to take the local MD5 from
     
     Returns:
         bool: True if files are identical, False otherwise
     """
     try:
-        # Quick size check first
-        local_size = os.path.getsize(local_file_path)
-        if gcs_blob.size != local_size:
+        # Quick size check first, using the size already taken during discovery
+        if gcs_blob.size != staged_file.size:
             return False
         
         # If sizes match, compare MD5 hashes
-        local_md5 = calculate_md5_hash(local_file_path)
+        if hash_cache is not None:
+            local_md5 = hash_cache.md5(staged_file)
+        else:
+            local_md5 = calculate_md5_hash(staged_file.local_path)
         
         # GCS stores MD5 hash in base64, but we need hex format
         # Convert GCS MD5 from base64 to hex for comparison
@@ -53,7 +292,12 @@ def files_are_identical(local_file_path, gcs_blob):
             gcs_md5_bytes = base64.b64decode(gcs_blob.md5_hash)
             gcs_md5_hex = gcs_md5_bytes.hex()
             return local_md5 == gcs_md5_hex
-        
+
+        # Composite uploads have no md5Hash, but carry the MD5 they were sent with
+        stored_md5 = (gcs_blob.metadata or {}).get(COMPOSITE_MD5_METADATA_KEY)
+        if stored_md5:
+            return local_md5 == stored_md5
+
         # If no MD5 hash available from GCS, assume files are different
         # (this is a conservative approach to avoid skipping uploads when unsure)
         return False
@@ -63,93 +307,392 @@ def files_are_identical(local_file_path, gcs_blob):
         # to ensure we don't skip necessary uploads
         return False
 
-def get_exif_date(image_bytes):
+class TokenBucket:
     """
-    Extracts the creation date from image EXIF data by checking multiple tags.
-    It checks for DateTimeOriginal, DateTimeDigitized, and DateTime tags in that order.
-    It also attempts to get sub-second precision.
+    Thread-safe token-bucket rate limiter shared by every upload worker.
+    consume() lets a caller overdraw the bucket and then sleeps off its share
+    of the debt, so the aggregate rate across threads holds at `rate` bytes/s
+    with bursts of at most `burst` bytes.
     """
-    try:
-        img = Image.open(BytesIO(image_bytes))
-        exif_data = img._getexif()
-        if exif_data:
-            # EXIF tags for date/time, in order of preference.
-            # 36867: DateTimeOriginal, 37521: SubSecTimeOriginal
-            # 36868: DateTimeDigitized, 37522: SubSecTimeDigitized
-            # 306: DateTime
-            date_str = None
-            sub_sec_str = None
-
-            if 36867 in exif_data:
-                date_str = exif_data[36867]
-                if 37521 in exif_data:
-                    sub_sec_str = exif_data[37521]
-            elif 36868 in exif_data:
-                date_str = exif_data[36868]
-                if 37522 in exif_data:
-                    sub_sec_str = exif_data[37522]
-            elif 306 in exif_data:
-                date_str = exif_data[306]
-
-            if date_str and isinstance(date_str, str):
-                date_str = date_str.strip().replace('\x00', '')
-                if date_str:
-                    full_date_str = date_str
-                    if sub_sec_str and isinstance(sub_sec_str, str):
-                        # Ensure sub_sec_str is not empty and contains only digits
-                        sub_sec_str = sub_sec_str.strip().replace('\x00', '')
-                        if sub_sec_str.isdigit():
-                            full_date_str += '.' + sub_sec_str
-                    
-                    # Try parsing with and without fractional seconds
-                    for fmt in ('%Y:%m:%d %H:%M:%S.%f', '%Y:%m:%d %H:%M:%S'):
-                        try:
-                            return datetime.datetime.strptime(full_date_str, fmt)
-                        except ValueError:
-                            continue
-    except Exception:
-        # Suppressing EXIF read errors for a cleaner progress bar experience
-        pass
-    return None
 
-_FLASH_TAG = 37385  # ExifIFD.Flash
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
 
+    def consume(self, n):
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            self._tokens -= n
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait > 0:
+            time.sleep(wait)
 
-def get_flash(image_bytes):
-    """Returns True if flash fired, False if not, None on failure."""
-    try:
-        img = Image.open(BytesIO(image_bytes))
-        exif_data = img._getexif()
-        if exif_data and _FLASH_TAG in exif_data:
-            return bool(int(exif_data[_FLASH_TAG]) & 0x01)
-    except Exception:
-        pass
+
+class ThrottledReader:
+    """
+    Read-only file wrapper that draws from a TokenBucket (if any) and reports
+    bytes to a progress callback as the HTTP layer reads them. Exposes
+    __len__/tell/seek so requests and the storage client can size the body.
+    """
+
+    def __init__(self, fileobj, size, throttle=None, progress=None):
+        self._f = fileobj
+        self._size = size
+        self._start = fileobj.tell()
+        self._throttle = throttle
+        self._progress = progress
+
+    def __len__(self):
+        return self._start + self._size
+
+    def read(self, n=-1):
+        if n is None or n < 0:
+            n = self._start + self._size - self._f.tell()
+        # Short reads would be mistaken for EOF by the upload code, so a large
+        # read is still satisfied in full -- just drawn from the bucket in
+        # THROTTLE_READ_SIZE pieces to keep the pacing smooth.
+        pieces = []
+        while n > 0:
+            piece = self._f.read(min(n, THROTTLE_READ_SIZE))
+            if not piece:
+                break
+            if self._throttle is not None:
+                self._throttle.consume(len(piece))
+            if self._progress is not None:
+                self._progress(len(piece))
+            pieces.append(piece)
+            n -= len(piece)
+        return b''.join(pieces)
+
+    def tell(self):
+        return self._f.tell()
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        return self._f.seek(offset, whence)
+
+
+class AdaptiveConcurrency:
+    """
+    Gate on the number of uploads in flight, resized AIMD-style from measured
+    throughput and errors (see the Upload concurrency constants). Workers call
+    acquire() before an upload and release() after it; bytes are reported via
+    record_bytes() as they're sent so large files count toward every window.
+    """
+
+    def __init__(self, initial=UPLOAD_INITIAL_WORKERS, maximum=UPLOAD_MAX_WORKERS):
+        self.limit = min(initial, maximum)
+        self.maximum = maximum
+        self.rate = 0.0  # bytes/s over the last completed window
+        self._active = 0
+        self._cond = threading.Condition()
+        self._window_start = time.monotonic()
+        self._window_bytes = 0
+        self._window_errors = 0
+        self._last_rate = 0.0
+
+    def acquire(self):
+        with self._cond:
+            while self._active >= self.limit:
+                self._cond.wait()
+            self._active += 1
+
+    def release(self, error=False):
+        with self._cond:
+            self._active -= 1
+            if error:
+                self._window_errors += 1
+            self._maybe_adjust()
+            self._cond.notify_all()
+
+    def record_bytes(self, n):
+        with self._cond:
+            self._window_bytes += n
+            self._maybe_adjust()
+
+    def _maybe_adjust(self):
+        now = time.monotonic()
+        elapsed = now - self._window_start
+        if elapsed < UPLOAD_ADJUST_INTERVAL:
+            return
+        rate = self._window_bytes / elapsed
+        if self._window_errors:
+            self.limit = max(1, self.limit // 2)
+        elif rate > self._last_rate * (1 + UPLOAD_GAIN_THRESHOLD):
+            self.limit = min(self.maximum, self.limit + 1)
+        elif rate < self._last_rate * (1 - UPLOAD_GAIN_THRESHOLD):
+            self.limit = max(1, self.limit - 1)
+        self.rate = rate
+        self._last_rate = rate
+        self._window_start = now
+        self._window_bytes = 0
+        self._window_errors = 0
+        self._cond.notify_all()
+
+
+class UploadSessionStore:
+    """
+    Resumable upload session URIs, persisted to a JSON file so they survive a
+    process restart. Each session is keyed by GCS path and only reused if the
+    local file's size and mtime still match the file it was opened for.
+    GCS expires sessions after a week; a dead session is simply replaced.
+    """
+
+    def __init__(self, path):
+        self._path = path
+        self._lock = threading.Lock()
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                self._sessions = json.load(f)
+        except (OSError, ValueError):
+            self._sessions = {}
+
+    def get(self, gcs_path, staged_file):
+        with self._lock:
+            entry = self._sessions.get(gcs_path)
+        if entry and entry['size'] == staged_file.size and entry['mtime'] == staged_file.mtime:
+            return entry['url']
+        return None
+
+    def put(self, gcs_path, staged_file, url):
+        with self._lock:
+            self._sessions[gcs_path] = {'url': url, 'size': staged_file.size, 'mtime': staged_file.mtime}
+            self._save()
+
+    def discard(self, gcs_path):
+        with self._lock:
+            if self._sessions.pop(gcs_path, None) is not None:
+                self._save()
+
+    def _save(self):
+        tmp_path = self._path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._sessions, f)
+        os.replace(tmp_path, self._path)
+
+
+def _committed_offset(response):
+    """Returns the next byte to send, from a 308 response's Range header (e.g. 'bytes=0-1048575')."""
+    committed = response.headers.get('Range')
+    if not committed:
+        return 0
+    return int(committed.rsplit('-', 1)[1]) + 1
+
+
+def _query_resumable_offset(session_url, total_size):
+    """
+    Asks GCS how much of a resumable session has been committed. Returns the
+    next byte to send (total_size if already complete), or None if the session
+    no longer exists.
+    """
+    import requests
+    response = requests.put(
+        session_url,
+        headers={'Content-Length': '0', 'Content-Range': f'bytes */{total_size}'},
+        timeout=60,
+    )
+    if response.status_code in (200, 201):
+        return total_size
+    if response.status_code == 308:
+        return _committed_offset(response)
+    if response.status_code in (404, 410):
+        return None
+    response.raise_for_status()
     return None
 
 
-def get_keywords(image_bytes):
+def _upload_resumable(blob, staged_file, sessions, throttle=None, progress=None):
     """
-    Extracts IPTC keywords from image bytes.
-    Returns a list of keyword strings, or an empty list if none are found.
-    Lightroom writes keywords to IPTC dataset (2, 25).
+    Uploads a file through a resumable session in RESUMABLE_CHUNK_SIZE pieces,
+    resuming a persisted session for the same file if there is one. A failed
+    chunk is retried from the server's committed offset; if retries run out the
+    session is left in the store so the next sync picks up where this one stopped.
     """
-    try:
-        img = Image.open(BytesIO(image_bytes))
-        iptc = IptcImagePlugin.getiptcinfo(img)
-        if not iptc:
-            return []
-        raw = iptc.get((2, 25), [])
-        if isinstance(raw, bytes):
-            raw = [raw]
-        keywords = []
-        for kw in raw:
-            if isinstance(kw, bytes):
-                keywords.append(kw.decode('utf-8', errors='replace').strip())
-            elif isinstance(kw, str):
-                keywords.append(kw.strip())
-        return [k for k in keywords if k]
-    except Exception:
-        return []
+    import requests
+    total = staged_file.size
+    session_url = sessions.get(blob.name, staged_file)
+    offset = None
+    if session_url is not None:
+        offset = _query_resumable_offset(session_url, total)
+    if offset is None:
+        content_type = mimetypes.guess_type(staged_file.name)[0] or 'application/octet-stream'
+        session_url = blob.create_resumable_upload_session(content_type=content_type, size=total)
+        sessions.put(blob.name, staged_file, session_url)
+        offset = 0
+
+    attempt = 0
+    with open(staged_file.local_path, 'rb') as f:
+        while offset < total:
+            f.seek(offset)
+            chunk = f.read(RESUMABLE_CHUNK_SIZE)
+            content_range = f"bytes {offset}-{offset + len(chunk) - 1}/{total}"
+            body = ThrottledReader(BytesIO(chunk), len(chunk), throttle, progress)
+            try:
+                response = requests.put(session_url, data=body,
+                                        headers={'Content-Range': content_range}, timeout=300)
+                if response.status_code in (200, 201):
+                    offset = total
+                elif response.status_code == 308:
+                    offset = _committed_offset(response)
+                    attempt = 0
+                else:
+                    response.raise_for_status()
+                    raise requests.HTTPError(f"Unexpected status {response.status_code} for {blob.name}")
+            except requests.RequestException:
+                attempt += 1
+                if attempt >= RESUMABLE_CHUNK_ATTEMPTS:
+                    raise
+                time.sleep(2 ** attempt)
+                offset = _query_resumable_offset(session_url, total)
+                if offset is None:
+                    sessions.discard(blob.name)
+                    raise
+    sessions.discard(blob.name)
+
+
+def upload_file(blob, staged_file, sessions, throttle=None, progress=None):
+    """
+    Uploads a staged file, picking the transfer strategy by size (see the Upload
+    tuning constants). Bytes are drawn from `throttle` (a TokenBucket) if given,
+    and reported to `progress(nbytes)` as they're sent.
+    """
+    content_type = mimetypes.guess_type(staged_file.name)[0]
+    if not getattr(blob, 'chunked_uploads', True):
+        # Stand-in targets (sync_targets.LocalBucket) only take whole-file uploads
+        with open(staged_file.local_path, 'rb') as f:
+            reader = ThrottledReader(f, staged_file.size, throttle, progress)
+            blob.upload_from_file(reader, size=staged_file.size, content_type=content_type)
+        return
+    # Composite parts are read straight from disk by the transfer manager, where
+    # they can't be throttled -- and under a bandwidth cap parallel parts buy
+    # nothing anyway -- so capped runs send large files as resumable uploads.
+    if staged_file.size >= COMPOSITE_UPLOAD_THRESHOLD and throttle is None:
+        from google.cloud.storage import transfer_manager
+        # Sent as x-goog-meta-* headers with the upload (see files_are_identical)
+        blob.metadata = {**(blob.metadata or {}),
+                         COMPOSITE_MD5_METADATA_KEY: calculate_md5_hash(staged_file.local_path)}
+        transfer_manager.upload_chunks_concurrently(
+            staged_file.local_path,
+            blob,
+            chunk_size=COMPOSITE_PART_SIZE,
+            worker_type=transfer_manager.THREAD,
+            max_workers=COMPOSITE_UPLOAD_WORKERS,
+        )
+        if progress is not None:
+            progress(staged_file.size)
+    elif staged_file.size >= RESUMABLE_UPLOAD_THRESHOLD:
+        _upload_resumable(blob, staged_file, sessions, throttle, progress)
+    else:
+        with open(staged_file.local_path, 'rb') as f:
+            reader = ThrottledReader(f, staged_file.size, throttle, progress)
+            blob.upload_from_file(reader, size=staged_file.size, content_type=content_type)
+
+
+def submit_bounded(pool, fn, items, workers):
+    """
+    Runs fn(item) on `pool` for every item, yielding (item, future) as each
+    finishes. Only about two futures per worker exist at a time, so a run over
+    tens of thousands of files doesn't hold a Future (and its lock) for each.
+    """
+    items = iter(items)
+    pending = {}
+
+    def submit_next():
+        for item in items:
+            pending[pool.submit(fn, item)] = item
+            return
+
+    for _ in range(2 * workers):
+        submit_next()
+    while pending:
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            item = pending.pop(future)
+            submit_next()
+            yield item, future
+
+
+def upload_files(bucket, files_to_upload, sessions_path, max_mbps=None):
+    """
+    Uploads files concurrently under an AdaptiveConcurrency gate, optionally
+    capped at `max_mbps` megabits/s overall, showing the live rate and worker
+    count on the progress bar. Each file gets UPLOAD_ATTEMPTS tries; any that
+    still fail are reported and re-raised once everything else has finished.
+    """
+    from tqdm import tqdm
+    sessions = UploadSessionStore(sessions_path)
+    throttle = None
+    if max_mbps:
+        rate = max_mbps * 1_000_000 / 8
+        throttle = TokenBucket(rate, burst=max(THROTTLE_READ_SIZE, rate / 4))
+    gate = AdaptiveConcurrency()
+
+    def upload_one(staged):
+        gcs_path = staged.gcs_path
+        for attempt in range(1, UPLOAD_ATTEMPTS + 1):
+            gate.acquire()
+            try:
+                blob = bucket.blob(gcs_path)
+                blob.cache_control = IMAGE_CACHE_CONTROL
+                upload_file(blob, staged, sessions, throttle, gate.record_bytes)
+                blob.make_public()
+            except Exception:
+                gate.release(error=True)
+                if attempt == UPLOAD_ATTEMPTS:
+                    raise
+                time.sleep(2 ** attempt)
+            else:
+                gate.release()
+                return
+
+    failures = []
+    with tqdm(total=len(files_to_upload), desc="Uploading to GCS", unit="file") as pbar:
+        with ThreadPoolExecutor(max_workers=UPLOAD_MAX_WORKERS) as pool:
+            for staged, future in submit_bounded(pool, upload_one, files_to_upload, UPLOAD_MAX_WORKERS):
+                try:
+                    future.result()
+                except Exception as e:
+                    failures.append((staged, e))
+                pbar.set_postfix_str(f"{gate.rate * 8 / 1_000_000:.1f} Mbps, {gate.limit} workers")
+                pbar.update(1)
+
+    if failures:
+        for staged, e in failures:
+            print(f"  FAILED: {staged.folder}/{staged.name}: {e}", file=sys.stderr)
+        raise RuntimeError(f"{len(failures)} file(s) failed to upload")
+
+
+def versioned_manifest_name(digest):
+    """Returns the content-hashed object name, given a sha256 of the serialized manifest."""
+    return f"manifest.{digest.hexdigest()[:16]}.json"
+
+
+def is_versioned_manifest(gcs_path):
+    return MANIFEST_VERSION_RE.match(gcs_path.rsplit('/', 1)[-1]) is not None
+
+
+def publish_manifest(bucket, gcs_prefix, version_name, gzipped_content, upload_version):
+    """
+    Uploads a manifest version (already gzipped; gzip-encoded, immutable
+    caching) if it isn't already in the bucket, then repoints the album's
+    pointer object at it.
+    """
+    if upload_version:
+        version_blob = bucket.blob(f"{gcs_prefix}{version_name}")
+        version_blob.cache_control = MANIFEST_CACHE_CONTROL
+        version_blob.content_encoding = 'gzip'
+        version_blob.upload_from_string(gzipped_content, content_type='application/json')
+        version_blob.make_public()
+
+    pointer_blob = bucket.blob(f"{gcs_prefix}{MANIFEST_POINTER_NAME}")
+    pointer_blob.cache_control = MANIFEST_POINTER_CACHE_CONTROL
+    pointer_blob.metadata = {'manifest': version_name}
+    pointer_blob.upload_from_string(json.dumps({'manifest': version_name}), content_type='application/json')
+    pointer_blob.make_public()
 
 
 def get_flash_override(keywords):
@@ -165,10 +708,41 @@ def get_flash_override(keywords):
     return fired
 
 
+def _scan_dir(path):
+    """
+    Lists one directory with a single os.scandir call, returning (sorted
+    visible subdirectory paths, sorted [(name, stat_result)] for images, the
+    same for videos). Only image and video entries are stat'ed --
+    DirEntry.is_dir()/is_file() come from the directory listing itself on most
+    platforms, so nothing else costs a syscall.
+    """
+    subdirs = []
+    images = []
+    videos = []
+    with os.scandir(path) as it:
+        for entry in it:
+            if entry.is_dir():
+                # Like os.walk (followlinks=False): don't descend into symlinked dirs
+                if not entry.name.startswith('.') and not entry.is_symlink():
+                    subdirs.append(entry.path)
+            elif entry.name.lower().endswith(IMAGE_EXTS) and entry.is_file():
+                images.append((entry.name, entry.stat()))
+            elif (os.path.splitext(entry.name)[1].lower() in VIDEO_EXTS
+                  and not entry.name.startswith('.') and entry.is_file()):
+                videos.append((entry.name, entry.stat()))
+    subdirs.sort()
+    images.sort()
+    videos.sort()
+    return subdirs, images, videos
+
+
 def discover_galleries(staging_dir):
     """
-    Walks the staging directory recursively and returns {folder_name: local_path}
-    for every directory that directly contains image files.
+    Walks the staging directory recursively in a single os.scandir pass and
+    returns ({folder_name: local_path}, [StagedFile, ...] for images,
+    [StagedFile, ...] for videos) for every directory that directly contains
+    image or video files. Each StagedFile carries the size and mtime from that
+    pass, so no later stage needs to list or stat it again.
 
     Nesting (e.g. `event/person01`) is allowed purely for local organization --
     the gallery/album name is always the leaf directory's own name, not its
@@ -177,13 +751,17 @@ def discover_galleries(staging_dir):
     only the casing differs) would collide in GCS -- this is a fatal error.
     """
     galleries = {}
+    staged_files = []
+    staged_videos = []
     seen_lower = {}
-    for root, dirs, files in os.walk(staging_dir):
-        dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
-        if root == staging_dir:
-            continue
-        has_images = any(f.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.webp')) for f in files)
-        if not has_images:
+    # Depth-first, visiting subdirectories in sorted order -- the same order
+    # os.walk(topdown=True) with sorted dirs would, so clash reports are stable.
+    pending = [staging_dir]
+    while pending:
+        root = pending.pop()
+        subdirs, images, videos = _scan_dir(root)
+        pending.extend(reversed(subdirs))
+        if root == staging_dir or not (images or videos):
             continue
         name = os.path.basename(root)
         lower_name = name.lower()
@@ -197,335 +775,1118 @@ def discover_galleries(staging_dir):
             sys.exit(1)
         seen_lower[lower_name] = root
         galleries[name] = root
-    return galleries
+        for entries, staged_list in ((images, staged_files), (videos, staged_videos)):
+            for filename, st in entries:
+                staged_list.append(StagedFile(
+                    folder=name,
+                    name=filename,
+                    directory=root,
+                    size=st.st_size,
+                    mtime=st.st_mtime,
+                ))
+    return galleries, staged_files, staged_videos
 
 
-def build_sequences_for_folder(image_list):
+@dataclass(frozen=True)
+class SequenceRules:
     """
-    Builds multiple-exposure sequences for the multiple exposure viewer.
+    How build_sequences_for_folder groups an album into multiple-exposure
+    sequences. The defaults are the original keyword-and-flash rules.
 
-    If no image is tagged 'multiple_exposure', returns [] and the regular gallery
-    is shown instead.
+    keyword     images must carry this keyword (any case) to take part
+    flash_bases True: a tagged flash image starts a sequence, and tagged
+                non-flash images after it are its overlays. False: sequences
+                are bursts -- a tagged image starts one whenever the image
+                before it isn't tagged or is more than max_gap away
+    max_gap     seconds; a tagged image captured more than this after the
+                previous image can't continue that image's sequence (None:
+                no limit)
+    """
+    keyword: str = 'multiple_exposure'
+    flash_bases: bool = True
+    max_gap: float | None = None
+
+
+DEFAULT_SEQUENCE_RULES = SequenceRules()
 
-    If any image is tagged 'multiple_exposure', ALL photos in the folder are
-    included: tagged photos are grouped by flash (flash = base, subsequent
-    non-flash = overlays), while untagged photos appear as standalone entries.
-    A non-tagged photo resets the current sequence so it cannot absorb overlays.
+
+def build_sequences_for_folder(image_list, rules=DEFAULT_SEQUENCE_RULES):
     """
-    if not any(
-        any(kw.lower() == 'multiple_exposure' for kw in img.get('keywords', []))
-        for img in image_list
-    ):
-        return []
+    Builds multiple-exposure sequences for the multiple exposure viewer from an
+    album's images, sorted by capture time.
 
-    sequences = []
-    current = None
+    If no image is tagged with rules.keyword, returns [] and the regular
+    gallery is shown instead.
+
+    If any image is tagged, ALL photos in the folder are included: tagged
+    photos are grouped into sequences of a base and its overlays (see
+    SequenceRules), while untagged photos -- and tagged ones with no sequence
+    to join -- appear as standalone entries. A non-tagged photo, or a gap
+    longer than rules.max_gap, ends the current sequence so it cannot absorb
+    further overlays.
+
+    The rules are evaluated over the whole album at once with NumPy; the
+    keyword test runs once per distinct keyword set rather than per image.
+    """
+    import numpy as np
+    n = len(image_list)
+    keyword = rules.keyword.lower()
+    tagged_sets = {}
     for img in image_list:
-        is_me = any(kw.lower() == 'multiple_exposure' for kw in img.get('keywords', []))
-        if is_me and img.get('flash'):
-            current = {'id': img['name'].rsplit('.', 1)[0], 'base': img['name'], 'overlays': []}
-            sequences.append(current)
-        elif is_me and current is not None:
-            current['overlays'].append(img['name'])
+        if img.keywords not in tagged_sets:
+            tagged_sets[img.keywords] = any(kw.lower() == keyword for kw in img.keywords)
+    if not any(tagged_sets.values()):
+        return []
+
+    tagged = np.fromiter((tagged_sets[img.keywords] for img in image_list), dtype=bool, count=n)
+    # Where the image before can't be continued from: the first image, after
+    # an untagged one, or after too long a gap
+    breaks = np.ones(n, dtype=bool)
+    breaks[1:] = ~tagged[:-1]
+    if rules.max_gap is not None:
+        timestamps = np.fromiter((img.timestamp for img in image_list), dtype=np.int64, count=n)
+        breaks[1:] |= np.diff(timestamps) > rules.max_gap * CAPTURE_TICKS_PER_SECOND
+
+    if rules.flash_bases:
+        flash = np.fromiter((bool(img.flash) for img in image_list), dtype=bool, count=n)
+        bases = tagged & flash
+        # A tagged non-flash image is an overlay if a base came before it
+        # with no break since: count bases within each unbroken stretch
+        base_count = np.cumsum(bases)
+        stretch_start = np.maximum.accumulate(np.where(breaks, np.arange(n), 0))
+        bases_before_stretch = base_count[stretch_start] - bases[stretch_start]
+        overlays = tagged & ~bases & (base_count > bases_before_stretch)
+    else:
+        bases = tagged & breaks
+        overlays = tagged & ~breaks
+
+    # Every base or standalone image starts an entry; overlays join the one
+    # before them, which is always a base
+    names = [img.name for img in image_list]
+    starts = np.flatnonzero(~overlays).tolist()
+    return [
+        {'id': names[start].rsplit('.', 1)[0], 'base': names[start], 'overlays': names[start + 1:end]}
+        for start, end in zip(starts, starts[1:] + [n])
+    ]
+
+
+def overlay_level_sizes(width, height):
+    """The (width, height) of each level for a base image of that displayed size, smallest first."""
+    long_edge = max(width, height)
+    return [
+        (max(1, round(width * edge / long_edge)), max(1, round(height * edge / long_edge)))
+        for edge in OVERLAY_LEVEL_EDGES if edge < long_edge
+    ]
+
+
+def level_filename(size):
+    return f"{size[0]}x{size[1]}.jpg"
+
+
+def render_levels(local_path, out_dir, sizes):
+    """
+    Writes the image at local_path, upright, into out_dir once per (width,
+    height) in sizes. JPEGs are decoded at a reduced scale (draft mode) where
+    the largest size allows, and each smaller level is scaled from the one
+    before it rather than from the full image.
+    """
+    from PIL import Image, ImageOps
+    os.makedirs(out_dir, exist_ok=True)
+    sizes = sorted(sizes, key=lambda size: size[0] * size[1], reverse=True)
+    with Image.open(local_path) as img:
+        icc_profile = img.info.get('icc_profile')
+        width, height = sizes[0]
+        if img.getexif().get(ORIENTATION_TAG) in (5, 6, 7, 8):
+            width, height = height, width
+        img.draft('RGB', (width, height))
+        level = ImageOps.exif_transpose(img).convert('RGB')
+    for size in sizes:
+        level = level.resize(size, Image.LANCZOS, reducing_gap=3.0)
+        path = os.path.join(out_dir, level_filename(size))
+        tmp_path = path + '.tmp'
+        level.save(tmp_path, 'JPEG', quality=OVERLAY_LEVEL_QUALITY, progressive=True,
+                   icc_profile=icc_profile)
+        os.replace(tmp_path, path)
+
+
+def build_overlay_levels(images_by_folder, staging_dir, hash_cache, dedupe,
+                         sequence_rules=DEFAULT_SEQUENCE_RULES):
+    """
+    Builds every album's multiple-exposure sequences (by sequence_rules) and makes sure each image
+    in them has its levels in the local levels cache, rendering only missing
+    ones, then removes levels nothing uses any more. Returns (level_files,
+    sequences_by_folder): StagedFiles for every level to publish, and each
+    album's sequences. A sequence whose base is larger than the smallest level
+    gets a "levels" list, smallest first, of {width, height, images}, where
+    images holds the base's then each overlay's level path, relative to the
+    album's base URL like image filenames (the bucket root with --dedupe).
+    """
+    from PIL import Image
+    from tqdm import tqdm
+
+    sequences_by_folder = {}
+    members_by_sequence = []
+    for folder, image_list in images_by_folder.items():
+        sequences = build_sequences_for_folder(image_list, sequence_rules) if image_list else []
+        sequences_by_folder[folder] = sequences
+        if sequences:
+            by_name = {img.name: img for img in image_list}
+            for sequence in sequences:
+                members = [by_name[name] for name in [sequence['base'], *sequence['overlays']]]
+                members_by_sequence.append((folder, sequence, members,
+                                            [hash_cache.md5(img) for img in members]))
+    hash_cache.save()
+    if not members_by_sequence:
+        return [], sequences_by_folder
+
+    cache_dir = os.path.join(staging_dir, LEVELS_CACHE_DIRNAME)
+    index_path = os.path.join(cache_dir, LEVELS_INDEX_NAME)
+    try:
+        with open(index_path, 'r', encoding='utf-8') as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        index = {}
+    base_sizes = {}
+
+    wanted = {}  # md5 -> {size: a staged image with that content}
+    published = {}  # gcs_path -> (folder, md5, size)
+    for folder, sequence, members, md5s in members_by_sequence:
+        base_md5 = md5s[0]
+        if base_md5 not in index:
+            try:
+                with Image.open(members[0].local_path) as img:
+                    index[base_md5] = list(oriented_size(img))
+            except Exception as e:
+                print(f"WARNING: Could not read {members[0].local_path}: {e}", file=sys.stderr)
+                continue
+        base_sizes[base_md5] = index[base_md5]
+        sizes = overlay_level_sizes(*index[base_md5])
+        if not sizes:
+            continue
+        sequence['levels'] = [{'width': w, 'height': h, 'images': []} for w, h in sizes]
+        for img, md5 in zip(members, md5s):
+            prefix = (f"{OBJECTS_PREFIX}{md5}/{LEVELS_DIRNAME}/" if dedupe
+                      else f"{LEVELS_DIRNAME}/{md5}/")
+            for size, level in zip(sizes, sequence['levels']):
+                wanted.setdefault(md5, {}).setdefault(size, img)
+                path = f"{prefix}{level_filename(size)}"
+                level['images'].append(path)
+                gcs_path = path if dedupe else f"{folder.lower()}/{path}"
+                published.setdefault(gcs_path, (folder, md5, size))
+
+    # One listing per image's cache folder finds what is already rendered, and
+    # stats it for publishing
+    rendered = {}
+    for md5 in wanted:
+        try:
+            with os.scandir(os.path.join(cache_dir, md5)) as it:
+                rendered[md5] = {entry.name: entry.stat() for entry in it if entry.is_file()}
+        except FileNotFoundError:
+            rendered[md5] = {}
+    to_render = []
+    for md5, sizes in wanted.items():
+        missing = [size for size in sizes if level_filename(size) not in rendered[md5]]
+        if missing:
+            to_render.append((md5, sizes[missing[0]].local_path, missing))
+    if to_render:
+        print(f"\nRendering overlay levels for {len(to_render)} image(s)...")
+        with tqdm(total=len(to_render), desc="Rendering levels", unit="image") as pbar:
+            with ThreadPoolExecutor(max_workers=LEVEL_WORKERS) as pool:
+                def render_one(job):
+                    md5, local_path, sizes = job
+                    render_levels(local_path, os.path.join(cache_dir, md5), sizes)
+                for (md5, _, sizes), future in submit_bounded(pool, render_one, to_render, LEVEL_WORKERS):
+                    future.result()
+                    for size in sizes:
+                        rendered[md5][level_filename(size)] = os.stat(
+                            os.path.join(cache_dir, md5, level_filename(size)))
+                    pbar.update(1)
+
+    level_files = []
+    for gcs_path, (folder, md5, size) in published.items():
+        st = rendered[md5][level_filename(size)]
+        level_files.append(StagedFile(
+            folder=folder,
+            name=level_filename(size),
+            directory=os.path.join(cache_dir, md5),
+            size=st.st_size,
+            mtime=st.st_mtime,
+            gcs_path=gcs_path,
+        ))
+
+    # Drop levels nothing uses any more, and the sizes of bases that are gone
+    if os.path.isdir(cache_dir):
+        for entry in os.scandir(cache_dir):
+            if entry.name == LEVELS_INDEX_NAME:
+                continue
+            if entry.name not in wanted:
+                shutil.rmtree(entry.path, ignore_errors=True)
+                continue
+            # Including sizes a changed base no longer needs, and interrupted renders
+            keep = {level_filename(size) for size in wanted[entry.name]}
+            for name in set(rendered[entry.name]) - keep:
+                os.remove(os.path.join(entry.path, name))
+    if base_sizes != index or not os.path.exists(index_path):
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(index_path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(base_sizes, f, separators=(',', ':'))
+        os.replace(index_path + '.tmp', index_path)
+    return level_files, sequences_by_folder
+
+
+def _default_domain():
+    """The site's custom domain, from docs/CNAME if present."""
+    cname_path = os.path.join(SCRIPT_DIR, '..', 'docs', 'CNAME')
+    domain = "photosby.loganwu.co.nz"  # Default domain
+    if os.path.exists(cname_path):
+        with open(cname_path, 'r') as f:
+            domain = f.read().strip()
+    return domain
+
+
+@contextmanager
+def _timed(timings, stage):
+    """
+    Adds the wall time of the enclosed block to timings[stage], if timings is
+    a dict, and to the profiled run's stage of that name if there is one
+    (see profiling.py). Yields the profiling StageStats.
+    """
+    start = time.perf_counter()
+    try:
+        with profiling.stage(stage) as stats:
+            yield stats
+    finally:
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - start
+
+
+def read_metadata(staged_files, client_folders, catalog):
+    """
+    Fills in capture time, keywords and flash on every staged image with a
+    global progress bar, taking them from the photo catalog (see
+    photo_catalog.py) for files unchanged since any script last read them.
+    Images without an EXIF capture time fall back to their mtime. Returns
+    images_by_folder, with each folder's images sorted by capture time, then
+    filename.
+    """
+    from tqdm import tqdm
+    images_by_folder = {folder: [] for folder in client_folders}
+    print(f"\nReading metadata for {len(staged_files)} images...")
+    with tqdm(total=len(staged_files), desc="Reading metadata", unit="file") as pbar:
+        # Keyword tuples come back shared between every image with the same set
+        for staged, image in catalog.lookup(staged_files, pbar):
+            if image.capture is not None:
+                staged.timestamp = image.capture
+            else:
+                staged.timestamp = capture_micros(datetime.datetime.fromtimestamp(staged.mtime))
+            staged.keywords = image.keywords
+            flash_override = get_flash_override(image.keywords)
+            staged.flash = image.flash if flash_override is None else flash_override
+            images_by_folder[staged.folder].append(staged)
+
+    def get_filename_without_extension(filename):
+        """Strip file extension for alphabetical comparison."""
+        return os.path.splitext(filename)[0]
+    
+    for folder in images_by_folder:
+        images_by_folder[folder].sort(key=lambda x: (x.timestamp, get_filename_without_extension(x.name)))
+
+    return images_by_folder
+
+
+def assign_gcs_paths(staged_files, hash_cache, dedupe):
+    """
+    Sets each file's destination: its own album folder, or with dedupe the
+    shared content-addressed object (MD5s come from the sync cache, so
+    unchanged files cost no extra reads).
+    """
+    for staged in staged_files:
+        if dedupe:
+            md5 = hash_cache.md5(staged)
+            staged.gcs_path = f"{OBJECTS_PREFIX}{md5}/{staged.name}"
         else:
-            sequences.append({'id': img['name'].rsplit('.', 1)[0], 'base': img['name'], 'overlays': []})
-            current = None
-    return sequences
+            # Use lowercase folder name for the GCS path
+            staged.gcs_path = f"{staged.folder.lower()}/{staged.name}"
+    hash_cache.save()
 
 
-def main():
-    """Main function to discover all images, process them with a global progress bar, and sync."""
-    print("Starting GCS synchronization process...")
-    print(f"Local staging directory: '{os.path.abspath(LOCAL_STAGING_DIR)}'")
-    print(f"Target GCS Bucket: 'gs://{GCS_BUCKET_NAME}/'")
-    print("-" * 30)
+def package_videos(staged_videos, staging_dir, hash_cache, dedupe):
+    """
+    Makes sure every staged video has an up-to-date HLS package in the local
+    package cache, encoding only new or changed videos, and removes packages no
+    video uses any more. Returns (package_files, videos_by_folder): StagedFiles
+    for every packaged file to publish, and each album's manifest entries.
+    Playlist and poster paths in those entries are relative to the album's
+    base URL, like image filenames (the bucket root with --dedupe).
+    """
+    from tqdm import tqdm
+    videos_by_folder = {}
+    if not staged_videos:
+        return [], videos_by_folder
+
+    cache_dir = os.path.join(staging_dir, HLS_CACHE_DIRNAME)
+    if not shutil.which('ffmpeg') or not shutil.which('ffprobe'):
+        print(f"\nWARNING: ffmpeg/ffprobe not found on PATH; skipping {len(staged_videos)} video(s).",
+              file=sys.stderr)
+        return [], videos_by_folder
+
+    md5s = [hash_cache.md5(video) for video in staged_videos]
+    hash_cache.save()
+    packages = {}
+    for md5 in set(md5s):
+        package = VideoPackage.load(Path(cache_dir) / md5)
+        if package is not None:
+            packages[md5] = package
 
-    if GCS_BUCKET_NAME == "YOUR_GCS_BUCKET_NAME_HERE":
-        print("ERROR: Please update GCS_BUCKET_NAME in this script.", file=sys.stderr)
-        sys.exit(1)
+    to_encode = {}
+    for video, md5 in zip(staged_videos, md5s):
+        if md5 not in packages:
+            to_encode.setdefault(md5, video)
+    if to_encode:
+        print(f"\nPackaging {len(to_encode)} video(s) for streaming...")
+        with tqdm(total=len(to_encode), desc="Packaging videos", unit="video",
+                  bar_format="{l_bar}{bar}| {n:.1f}/{total_fmt} [{elapsed}<{remaining}]") as pbar:
+            for md5, video in to_encode.items():
+                package = package_video(Path(video.local_path), Path(cache_dir) / md5, pbar)
+                if package is not None:
+                    packages[md5] = package
+
+    package_files_out = []
+    published = set()
+    for video, md5 in zip(staged_videos, md5s):
+        package = packages.get(md5)
+        if package is None:
+            continue
+        if dedupe:
+            prefix = f"{OBJECTS_PREFIX}{md5}/hls/"
+        else:
+            prefix = f"{video.folder.lower()}/{VIDEOS_DIRNAME}/{md5}/"
+        if prefix not in published:
+            published.add(prefix)
+            package_dir = os.path.join(cache_dir, md5)
+            for rel_path, st in package_files(Path(package_dir)):
+                package_files_out.append(StagedFile(
+                    folder=video.folder,
+                    name=rel_path,
+                    directory=package_dir,
+                    size=st.st_size,
+                    mtime=st.st_mtime,
+                    gcs_path=f"{prefix}{rel_path}",
+                ))
+        # Relative to the album folder, or the bucket root for shared objects
+        base = prefix if dedupe else f"{VIDEOS_DIRNAME}/{md5}/"
+        videos_by_folder.setdefault(video.folder, []).append({
+            "name": video.name,
+            "playlist": f"{base}{MASTER_PLAYLIST}",
+            "poster": f"{base}{POSTER_NAME}",
+            "duration": round(package.duration, 3),
+            "width": package.width,
+            "height": package.height,
+        })
+
+    # Drop packages (and half-built ones from an interrupted run) nothing uses
+    if os.path.isdir(cache_dir):
+        for entry in os.scandir(cache_dir):
+            if entry.name not in packages:
+                shutil.rmtree(entry.path, ignore_errors=True)
+    return package_files_out, videos_by_folder
+
+
+def plan_deletes(gcs_blobs, client_folders, staged_files, dedupe):
+    """
+    Finds GCS folders with no local counterpart, and files within kept folders
+    that are no longer staged. Whole-folder deletes are expanded from the
+    listing, so applying them needs no further listing. Returns
+    (names_to_delete, folders_to_delete, gcs_files).
+    """
+    gcs_folders = set()
+    gcs_files = set()
+
+    for blob in gcs_blobs:
+        parts = blob.name.split('/')
+        if len(parts) > 1:
+            gcs_folders.add(parts[0])
+            gcs_files.add(blob.name)
+
+    local_client_folders_set_lower = {f.lower() for f in client_folders}
+    local_gcs_paths_set = {staged.gcs_path for staged in staged_files}
+    # The object store isn't an album, but must survive the stale-folder
+    # sweep -- unreferenced objects are still removed file by file below.
+    kept_folders = local_client_folders_set_lower | ({OBJECTS_PREFIX.rstrip('/')} if dedupe else set())
+    
+    # Add manifest pointers to local_gcs_paths_set for existing local folders.
+    # Versioned manifests are left alone here and only cleaned up once the
+    # pointer has moved past them, so a client never follows a dangling pointer.
+    for folder_name in local_client_folders_set_lower:
+        local_gcs_paths_set.add(f"{folder_name}/{MANIFEST_POINTER_NAME}")
 
-    if not os.path.isdir(LOCAL_STAGING_DIR):
-        print(f"ERROR: Local staging directory '{LOCAL_STAGING_DIR}' not found.", file=sys.stderr)
-        sys.exit(1)
+    # Identify folders to delete
+    folders_to_delete = gcs_folders - kept_folders
+    if folders_to_delete:
+        print(f"Found GCS folders to delete: {', '.join(sorted(folders_to_delete))}")
+    else:
+        print("No old GCS folders to delete.")
 
+    # Identify individual files to delete within existing folders
+    files_to_delete = gcs_files - local_gcs_paths_set
+    # Filter out files that are part of folders already marked for deletion
+    files_to_delete_filtered = sorted(
+        f for f in files_to_delete
+        if f.split('/')[0] not in folders_to_delete and not is_versioned_manifest(f)
+    )
+
+    if files_to_delete_filtered:
+        print(f"Found GCS files to delete: {', '.join(files_to_delete_filtered)}")
+    else:
+        print("No old GCS files to delete.")
+
+    names_to_delete = sorted(
+        set(files_to_delete_filtered)
+        | {blob.name for blob in gcs_blobs if blob.name.split('/')[0] in folders_to_delete}
+    )
+    return names_to_delete, folders_to_delete, gcs_files
+
+
+def compare_files(staged_files, gcs_blob_map, hash_cache, dedupe):
+    """Returns (files_to_upload, files_to_skip), checking each file against its existing blob."""
+    from tqdm import tqdm
+    print(f"\nChecking {len(staged_files)} images for changes...")
+    files_to_upload = []
+    files_to_skip = []
+    seen_gcs_paths = set()
+    
+    # Check each file to see if it needs uploading
+    with tqdm(total=len(staged_files), desc="Comparing files", unit="file") as pbar:
+        for staged in staged_files:
+            gcs_path = staged.gcs_path
+
+            if gcs_path in seen_gcs_paths:
+                # With --dedupe, another album already accounts for this object
+                files_to_skip.append(staged)
+            elif gcs_path in gcs_blob_map:
+                # File exists in GCS, check if it's identical
+                existing_blob = gcs_blob_map[gcs_path]
+                if files_are_identical(staged, existing_blob, hash_cache):
+                    files_to_skip.append(staged)
+                else:
+                    files_to_upload.append(staged)
+            else:
+                # File doesn't exist in GCS, needs uploading
+                files_to_upload.append(staged)
+            seen_gcs_paths.add(gcs_path)
+            
+            pbar.update(1)
+    hash_cache.save()
+    
+    # Report comparison results
+    print(f"Files to upload: {len(files_to_upload)} (new or changed)")
+    print(f"Files to skip: {len(files_to_skip)} (identical)")
+    if dedupe:
+        print(f"Unique objects: {len(seen_gcs_paths)} for {len(staged_files)} album images")
+    return files_to_upload, files_to_skip
+
+
+def plan_patches(gcs_blobs, names_to_delete):
+    """Names of existing image blobs (not about to be deleted) missing the image cache-control."""
+    deleting = set(names_to_delete)
+    return sorted(
+        blob.name for blob in gcs_blobs
+        if blob.name.lower().endswith(IMAGE_EXTS)
+        and blob.cache_control != IMAGE_CACHE_CONTROL
+        and blob.name not in deleting
+    )
+
+
+_compact_json = json.JSONEncoder(separators=(',', ':')).encode
+
+
+def _manifest_pieces(manifest):
+    """Yields a manifest's compact JSON a key, list item or mapping entry at a time."""
+    yield '{'
+    for i, (key, value) in enumerate(manifest.items()):
+        yield f"{',' if i else ''}{_compact_json(key)}:"
+        if isinstance(value, list):
+            yield '['
+            for j, item in enumerate(value):
+                yield f"{',' if j else ''}{_compact_json(item)}"
+            yield ']'
+        elif isinstance(value, dict):
+            yield '{'
+            for j, (k, v) in enumerate(value.items()):
+                yield f"{',' if j else ''}{_compact_json(k)}:{_compact_json(v)}"
+            yield '}'
+        else:
+            yield _compact_json(value)
+    yield '}'
+
+
+def iter_manifest_chunks(manifest):
+    """
+    Streams the compact serialization a manifest is published (and version-
+    hashed) as -- byte for byte json.dumps(manifest, separators=(',', ':')) --
+    in UTF-8 chunks of about MANIFEST_CHUNK_SIZE bytes.
+    """
+    pending = []
+    pending_size = 0
+    for piece in _manifest_pieces(manifest):
+        pending.append(piece)
+        pending_size += len(piece)
+        if pending_size >= MANIFEST_CHUNK_SIZE:
+            yield ''.join(pending).encode('utf-8')
+            pending = []
+            pending_size = 0
+    if pending:
+        yield ''.join(pending).encode('utf-8')
+
+
+def gzip_manifest(manifest):
+    """
+    Returns (gzipped serialization, version name, uncompressed size), built
+    chunk by chunk so only the compressed bytes are ever held in full.
+    """
+    digest = hashlib.sha256()
+    # wbits=31 writes a gzip container; zlib leaves its mtime at 0, so the
+    # compressed bytes are deterministic for identical content
+    compressor = zlib.compressobj(9, zlib.DEFLATED, 31)
+    parts = []
+    size = 0
+    for chunk in iter_manifest_chunks(manifest):
+        digest.update(chunk)
+        parts.append(compressor.compress(chunk))
+        size += len(chunk)
+    parts.append(compressor.flush())
+    return b''.join(parts), versioned_manifest_name(digest), size
+
+
+def plan_manifests(client_folders, images_by_folder, sequences_by_folder, videos_by_folder, galleries,
+                   gcs_blob_map, gcs_files, folders_to_delete, dedupe):
+    """
+    Generates every album's manifest (writing it locally for inspection) and
+    returns (manifest_writes, stale_versions): the manifests to publish, and
+    the manifest versions nothing will point to once they are.
+    """
+    from tqdm import tqdm
+    print(f"\nChecking manifests for {len(client_folders)} folders...")
+    manifests_to_upload = []
+    manifests_to_skip = []
+    
+    with tqdm(total=len(client_folders), desc="Comparing manifests", unit="folder") as pbar:
+        for folder_name in client_folders:
+            image_list = images_by_folder[folder_name]
+            gcs_prefix = f"{folder_name.lower()}/"
+            
+            # Generate the new manifest content.
+            # Format: {"images": [...], "sequences": [...]}
+            # The "sequences" key is only populated when sequence keywords are present;
+            # albums without sequence keywords get an empty list and behave identically
+            # to the old plain-array format on the frontend.
+            # With --dedupe, "objects" maps each filename to the shared
+            # content-addressed object holding its bytes.
+            sorted_filenames = [img.name for img in image_list] if image_list else []
+            sequences = sequences_by_folder.get(folder_name, [])
+            manifest = {"images": sorted_filenames, "sequences": sequences}
+            if dedupe:
+                manifest["objects"] = {img.name: img.gcs_path for img in image_list}
+            # Only albums with videos get the key, so image-only manifests (and
+            # their version hashes) are unchanged
+            if videos_by_folder.get(folder_name):
+                manifest["videos"] = videos_by_folder[folder_name]
+
+            # Write manifest locally so it can be inspected before/after sync,
+            # hashing it on the way through rather than serializing it whole
+            local_manifest_path = os.path.join(galleries[folder_name], "manifest.json")
+            digest = hashlib.sha256()
+            manifest_size = 0
+            with open(local_manifest_path, 'wb') as f:
+                for chunk in iter_manifest_chunks(manifest):
+                    digest.update(chunk)
+                    f.write(chunk)
+                    manifest_size += len(chunk)
+            version_name = versioned_manifest_name(digest)
+            
+            # The version name is a hash of the content, so comparing names
+            # (from the listing, and the pointer's metadata) replaces
+            # downloading and diffing the old manifest.
+            version_exists = f"{gcs_prefix}{version_name}" in gcs_blob_map
+            pointer_blob = gcs_blob_map.get(f"{gcs_prefix}{MANIFEST_POINTER_NAME}")
+            pointer_current = (
+                pointer_blob is not None
+                and (pointer_blob.metadata or {}).get('manifest') == version_name
+            )
+            if version_exists and pointer_current:
+                manifests_to_skip.append({'folder': folder_name, 'version': version_name})
+            else:
+                manifests_to_upload.append({
+                    'folder': folder_name,
+                    'prefix': gcs_prefix,
+                    'version': version_name,
+                    'upload_version': not version_exists,
+                    'size': manifest_size,
+                    'manifest': manifest,
+                })
+            
+            pbar.update(1)
+    
+    # Report manifest comparison results
+    print(f"Manifests to upload: {len(manifests_to_upload)} (new or changed)")
+    print(f"Manifests to skip: {len(manifests_to_skip)} (identical)")
+
+    # Once every pointer is current, manifest versions nothing points to any
+    # more (superseded ones, and any in albums that no longer exist locally) go.
+    current_versions = {
+        f"{info['folder'].lower()}/{info['version']}"
+        for info in manifests_to_upload + manifests_to_skip
+    }
+    stale_versions = sorted(
+        name for name in gcs_files
+        if is_versioned_manifest(name)
+        and name not in current_versions
+        and name.split('/')[0] not in folders_to_delete
+    )
+    return manifests_to_upload, stale_versions
+
+
+@dataclass
+class SyncPlan:
+    """
+    Everything one sync will change on the target, computed from local state
+    and a single bucket listing. Saved as indented JSON with stable ordering,
+    so two plans can be compared with an ordinary diff. `summary` holds the
+    counts, byte totals and estimated duration.
+    """
+    target: str
+    staging_dir: str
+    dedupe: bool
+    folders: list
+    uploads: list
+    patches: list
+    manifests: list
+    deletes: list
+    stale_manifests: list
+    summary: dict
+
+    def save(self, path):
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'format': PLAN_FORMAT, **asdict(self)}, f, indent=2)
+            f.write('\n')
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if data.pop('format', None) != PLAN_FORMAT:
+            raise ValueError(f"'{path}' is not a sync plan this version of sync_gcs.py can apply")
+        return cls(**data)
+
+
+def summarize_plan(uploads, patches, manifests, deletes, stale_manifests, delete_bytes, mbps):
+    """Counts, byte totals and an estimated wall time for a plan, at `mbps` megabits/s."""
+    upload_bytes = sum(u['size'] for u in uploads)
+    manifest_bytes_total = sum(m['size'] for m in manifests)
+    # Each upload and manifest version is an upload plus a make_public; a
+    # pointer is the same again. Patches and deletes are one call each.
+    requests_total = (
+        2 * len(uploads)
+        + sum(4 if m['upload_version'] else 2 for m in manifests)
+        + len(patches) + len(deletes) + len(stale_manifests)
+    )
+    transfer_seconds = (upload_bytes + manifest_bytes_total) * 8 / (mbps * 1_000_000)
+    request_seconds = requests_total * PLAN_REQUEST_SECONDS / APPLY_WORKERS
+    return {
+        'uploads': len(uploads),
+        'upload_bytes': upload_bytes,
+        'patches': len(patches),
+        'manifest_writes': len(manifests),
+        'manifest_bytes': manifest_bytes_total,
+        'deletes': len(deletes) + len(stale_manifests),
+        'delete_bytes': delete_bytes,
+        'requests': requests_total,
+        'assumed_mbps': mbps,
+        'estimated_seconds': round(transfer_seconds + request_seconds, 1),
+    }
+
+
+def _format_bytes(n):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if n < 1024 or unit == 'GB':
+            return f"{n:.0f} {unit}" if unit == 'B' else f"{n:.1f} {unit}"
+        n /= 1024
+
+
+def print_plan_summary(summary):
+    print("\n--- Sync plan ---")
+    print(f"  Uploads:         {summary['uploads']} ({_format_bytes(summary['upload_bytes'])})")
+    print(f"  Patches:         {summary['patches']}")
+    print(f"  Manifest writes: {summary['manifest_writes']} ({_format_bytes(summary['manifest_bytes'])})")
+    print(f"  Deletes:         {summary['deletes']} ({_format_bytes(summary['delete_bytes'])} freed)")
+    print(f"  Estimated time:  {summary['estimated_seconds']:g}s at {summary['assumed_mbps']:g} Mbps")
+    print("-----------------")
+
+
+def print_gallery_urls(client_folders):
+    print("\n--- Private Gallery URLs ---")
+    domain = _default_domain()
+    for folder_name in client_folders:
+        # URL encode the folder name to handle special characters, although GCS folders are lowercase
+        encoded_folder = quote(folder_name.lower())
+        gallery_url = f"https://{domain}/albums/?album={encoded_folder}"
+        print(f"  > {folder_name}: {gallery_url}")
+    print("----------------------------")
+
+
+def build_plan(staging_dir, bucket, target=None, dedupe=False, max_mbps=None, timings=None,
+               sequence_rules=DEFAULT_SEQUENCE_RULES):
+    """
+    Works out everything a sync of `staging_dir` to `bucket` (a GCS bucket or a
+    sync_targets.LocalBucket) would change, without changing anything remote.
+    Multiple-exposure sequences are grouped by `sequence_rules`.
+    If `timings` is a dict, each stage's wall time is added to it under
+    'discovery', 'metadata', 'levels', 'video' and 'diff'. Returns a SyncPlan,
+    or None if there is nothing to sync.
+    """
     # --- 1. Discover all image files across all client folders ---
     # Client folders may be nested arbitrarily deep for local organization
     # (e.g. `event/person01`) -- the gallery name is always the leaf
     # directory's own name, not its full relative path. discover_galleries()
     # already rejects leaf name clashes (e.g. event01/person01 vs
     # event02/person01), since GCS gallery paths are flat.
-    all_files_to_process = []
-    galleries = discover_galleries(LOCAL_STAGING_DIR)
+    # Discovery also stats every image once, so the stages below reuse those
+    # cached sizes/mtimes rather than listing or stat'ing anything again.
+    with _timed(timings, 'discovery'):
+        galleries, staged_files, staged_videos = discover_galleries(staging_dir)
     client_folders = sorted(galleries.keys())
 
     if not client_folders:
         print("No client folders found. Nothing to sync.")
-        sys.exit(0)
+        return None
 
     print(f"Found client folders: {', '.join(client_folders)}")
 
-    for folder_name in client_folders:
-        local_path = galleries[folder_name]
-        image_files = [f for f in os.listdir(local_path) if f.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.webp'))]
-        for filename in image_files:
-            all_files_to_process.append({
-                "folder": folder_name,
-                "name": filename,
-                "local_path": os.path.join(local_path, filename)
-            })
-
-    if not all_files_to_process:
-        print("No image files found in any client folder. Nothing to sync.")
-        sys.exit(0)
+    if not staged_files and not staged_videos:
+        print("No image or video files found in any client folder. Nothing to sync.")
+        return None
 
-    # --- 2. Read metadata for all files with a global progress bar ---
-    images_by_folder = {folder: [] for folder in client_folders}
-    print(f"\nReading metadata for {len(all_files_to_process)} images...")
-    with tqdm(total=len(all_files_to_process), desc="Reading metadata", unit="file") as pbar:
-        for file_info in all_files_to_process:
-            with open(file_info["local_path"], 'rb') as f:
-                image_bytes = f.read()
-            
-            exif_date = get_exif_date(image_bytes)
-            mod_time = datetime.datetime.fromtimestamp(os.path.getmtime(file_info["local_path"]))
-
-            file_info["timestamp"] = exif_date or mod_time
-            file_info["keywords"] = get_keywords(image_bytes)
-            flash_override = get_flash_override(file_info["keywords"])
-            file_info["flash"] = flash_override if flash_override is not None else get_flash(image_bytes)
-            images_by_folder[file_info["folder"]].append(file_info)
-            pbar.update(1)
+    if dedupe and OBJECTS_PREFIX.rstrip('/') in {f.lower() for f in client_folders}:
+        raise ValueError(f"A gallery folder named '{OBJECTS_PREFIX.rstrip('/')}' clashes with the "
+                         "--dedupe object store. Rename it and try again.")
 
+    # --- 2. Read metadata for all files with a global progress bar ---
     # --- 3. Sort images within each folder and prepare for upload ---
-    def get_filename_without_extension(filename):
-        """Strip file extension for alphabetical comparison."""
-        return os.path.splitext(filename)[0]
-    
-    for folder in images_by_folder:
-        images_by_folder[folder].sort(key=lambda x: (x["timestamp"], get_filename_without_extension(x["name"])))
+    with _timed(timings, 'metadata'):
+        hash_cache = HashCache(os.path.join(staging_dir, SYNC_CACHE_FILENAME))
+        with Catalog() as catalog:
+            images_by_folder = read_metadata(staged_files, client_folders, catalog)
+        assign_gcs_paths(staged_files, hash_cache, dedupe)
 
-    # --- 4. Upload all files with a global progress bar and generate manifests ---
-    try:
-        sa_key_path = os.path.join(SCRIPT_DIR, '..', 'backend', 'gcp-sa-key.json')
-        if not os.path.exists(sa_key_path):
-            print(f"ERROR: Service account key not found at '{sa_key_path}'", file=sys.stderr)
-            sys.exit(1)
-            
-        storage_client = storage.Client.from_service_account_json(sa_key_path)
-        bucket = storage_client.bucket(GCS_BUCKET_NAME)
-
-        # --- 4. Delete old folders/files from GCS ---
-        print("\nChecking GCS for old folders and files to delete...")
-        gcs_blobs = list(bucket.list_blobs())
-        gcs_folders = set()
-        gcs_files = set()
-
-        for blob in gcs_blobs:
-            parts = blob.name.split('/')
-            if len(parts) > 1:
-                gcs_folders.add(parts[0])
-                gcs_files.add(blob.name)
-
-        local_client_folders_set_lower = {f.lower() for f in client_folders}
-        local_gcs_paths_set = set()
-        for file_info in all_files_to_process:
-            # Use lowercase folder name for the GCS path
-            local_gcs_paths_set.add(f"{file_info['folder'].lower()}/{file_info['name']}")
-        
-        # Add manifests to local_gcs_paths_set for existing local folders
-        for folder_name in local_client_folders_set_lower:
-            local_gcs_paths_set.add(f"{folder_name}/manifest.json")
-
-        # Identify folders to delete
-        folders_to_delete = gcs_folders - local_client_folders_set_lower
-        if folders_to_delete:
-            print(f"Found GCS folders to delete: {', '.join(folders_to_delete)}")
-            with tqdm(total=len(folders_to_delete), desc="Deleting GCS folders", unit="folder") as pbar:
-                for folder_to_del in folders_to_delete:
-                    # List blobs with prefix and delete them
-                    blobs_to_delete_in_folder = list(bucket.list_blobs(prefix=f"{folder_to_del}/"))
-                    if blobs_to_delete_in_folder:
-                        bucket.delete_blobs(blobs_to_delete_in_folder)
-                    pbar.update(1)
-        else:
-            print("No old GCS folders to delete.")
-
-        # Identify individual files to delete within existing folders
-        files_to_delete = gcs_files - local_gcs_paths_set
-        # Filter out files that are part of folders already marked for deletion
-        files_to_delete_filtered = [
-            f for f in files_to_delete if f.split('/')[0] not in folders_to_delete
-        ]
-
-        if files_to_delete_filtered:
-            print(f"Found GCS files to delete: {', '.join(files_to_delete_filtered)}")
-            with tqdm(total=len(files_to_delete_filtered), desc="Deleting GCS files", unit="file") as pbar:
-                for file_to_del in files_to_delete_filtered:
-                    blob = bucket.blob(file_to_del)
-                    blob.delete()
-                    pbar.update(1)
-        else:
-            print("No old GCS files to delete.")
+    # --- 3b. Render overlay levels for multiple-exposure sequences (cached) ---
+    with _timed(timings, 'levels'):
+        level_files, sequences_by_folder = build_overlay_levels(images_by_folder, staging_dir,
+                                                                hash_cache, dedupe, sequence_rules)
 
-        # --- 5. Check existing files and upload only changed/new files ---
-        print(f"\nChecking {len(all_files_to_process)} images for changes...")
-        
+    # --- 3c. Package videos for streaming (cached, so usually a no-op) ---
+    with _timed(timings, 'video'):
+        video_files, videos_by_folder = package_videos(staged_videos, staging_dir, hash_cache, dedupe)
+    publish_files = staged_files + level_files + video_files
+
+    # --- 4. List GCS once and work out every change against it ---
+    with _timed(timings, 'diff'):
+        print("\nListing the target and planning changes...")
+        gcs_blobs = list_remote_objects(bucket)
         # Create a mapping of existing GCS blobs for quick lookup
-        gcs_blob_map = {}
-        for blob in gcs_blobs:
-            gcs_blob_map[blob.name] = blob
-        
-        files_to_upload = []
-        files_to_skip = []
-        
-        # Check each file to see if it needs uploading
-        with tqdm(total=len(all_files_to_process), desc="Comparing files", unit="file") as pbar:
-            for file_info in all_files_to_process:
-                gcs_path = f"{file_info['folder'].lower()}/{file_info['name']}"
-                
-                if gcs_path in gcs_blob_map:
-                    # File exists in GCS, check if it's identical
-                    existing_blob = gcs_blob_map[gcs_path]
-                    if files_are_identical(file_info['local_path'], existing_blob):
-                        files_to_skip.append(file_info)
-                    else:
-                        files_to_upload.append(file_info)
-                else:
-                    # File doesn't exist in GCS, needs uploading
-                    files_to_upload.append(file_info)
-                
+        gcs_blob_map = {blob.name: blob for blob in gcs_blobs}
+        deletes, folders_to_delete, gcs_files = plan_deletes(gcs_blobs, client_folders,
+                                                             publish_files, dedupe)
+        files_to_upload, _ = compare_files(publish_files, gcs_blob_map, hash_cache, dedupe)
+        patches = plan_patches(gcs_blobs, deletes)
+        manifests, stale_manifests = plan_manifests(client_folders, images_by_folder,
+                                                    sequences_by_folder, videos_by_folder,
+                                                    galleries, gcs_blob_map, gcs_files,
+                                                    folders_to_delete, dedupe)
+
+    uploads = sorted((
+        {
+            'gcs_path': staged.gcs_path,
+            'folder': staged.folder,
+            'name': staged.name,
+            'local_path': staged.local_path,
+            'size': staged.size,
+            'mtime': staged.mtime,
+        }
+        for staged in files_to_upload
+    ), key=lambda u: u['gcs_path'])
+    delete_bytes = sum(gcs_blob_map[name].size or 0 for name in deletes + stale_manifests)
+    summary = summarize_plan(uploads, patches, manifests, deletes, stale_manifests, delete_bytes,
+                             max_mbps or PLAN_ASSUMED_MBPS)
+    return SyncPlan(
+        target=target or _describe_target(bucket),
+        staging_dir=staging_dir,
+        dedupe=dedupe,
+        folders=client_folders,
+        uploads=uploads,
+        patches=patches,
+        manifests=manifests,
+        deletes=deletes,
+        stale_manifests=stale_manifests,
+        summary=summary,
+    )
+
+
+def _describe_target(bucket):
+    """The --target string that reopens `bucket`."""
+    return getattr(bucket, 'root', None) or f"gs://{bucket.name}"
+
+
+def _is_not_found(exc):
+    # LocalBucket raises FileNotFoundError, google.api_core.exceptions.NotFound has code 404
+    return isinstance(exc, FileNotFoundError) or getattr(exc, 'code', None) == 404
+
+
+def run_parallel(items, action, desc, unit):
+    """
+    Runs action(item) for every item on APPLY_WORKERS threads with a progress
+    bar. Failures are reported and re-raised once everything else has finished.
+    """
+    from tqdm import tqdm
+    if not items:
+        return
+    failures = []
+    with tqdm(total=len(items), desc=desc, unit=unit) as pbar:
+        with ThreadPoolExecutor(max_workers=APPLY_WORKERS) as pool:
+            for item, future in submit_bounded(pool, action, items, APPLY_WORKERS):
+                try:
+                    future.result()
+                except Exception as e:
+                    failures.append((item, e))
                 pbar.update(1)
-        
-        # Report comparison results
-        print(f"Files to upload: {len(files_to_upload)} (new or changed)")
-        print(f"Files to skip: {len(files_to_skip)} (identical)")
-        
-        # Upload only the files that need uploading
-        if files_to_upload:
-            print(f"\nUploading {len(files_to_upload)} images to GCS...")
-            with tqdm(total=len(files_to_upload), desc="Uploading to GCS", unit="file") as pbar:
-                for file_info in files_to_upload:
-                    gcs_path = f"{file_info['folder'].lower()}/{file_info['name']}"
-                    blob = bucket.blob(gcs_path)
-                    blob.cache_control = 'public, max-age=3600'
-                    blob.upload_from_filename(file_info['local_path'])
-                    blob.make_public()
-                    pbar.update(1)
+    if failures:
+        for item, e in failures:
+            print(f"  FAILED: {item}: {e}", file=sys.stderr)
+        raise RuntimeError(f"{len(failures)} {unit}(s) failed: {desc.lower()}")
+
+
+def check_plan_current(plan):
+    """
+    Raises ValueError if any file the plan uploads has changed or gone since it
+    was planned -- applying it would publish manifests that don't match.
+    """
+    changed = []
+    for upload in plan.uploads:
+        try:
+            st = os.stat(upload['local_path'])
+        except FileNotFoundError:
+            changed.append(upload['local_path'])
+            continue
+        if st.st_size != upload['size'] or st.st_mtime != upload['mtime']:
+            changed.append(upload['local_path'])
+    if changed:
+        shown = ', '.join(changed[:5]) + (f" and {len(changed) - 5} more" if len(changed) > 5 else '')
+        raise ValueError(f"{len(changed)} staged file(s) changed since the plan was made ({shown}). "
+                         "Plan again before applying.")
+
+
+def apply_plan(plan, bucket, max_mbps=None, timings=None):
+    """
+    Executes a SyncPlan against `bucket` without listing it again, running
+    every step as parallel as it allows. Images go up first and manifests
+    second, and deletes wait until the new manifests are live, so a client
+    never sees a manifest naming an object that isn't there. If `timings` is
+    a dict, wall times are added under 'upload', 'manifests' and 'cleanup'.
+    """
+    check_plan_current(plan)
+
+    # --- 5. Upload only changed/new files, and patch cache-control on the rest ---
+    with _timed(timings, 'upload') as upload_stage:
+        if plan.uploads:
+            print(f"\nUploading {len(plan.uploads)} files to GCS...")
+            if max_mbps:
+                print(f"Bandwidth capped at {max_mbps:g} Mbps")
+            files_to_upload = [
+                StagedFile(u['folder'], os.path.basename(u['local_path']), os.path.dirname(u['local_path']),
+                           u['size'], u['mtime'], gcs_path=u['gcs_path'])
+                for u in plan.uploads
+            ]
+            upload_stage.add_bytes(sum(u['size'] for u in plan.uploads))
+            upload_files(bucket, files_to_upload,
+                         os.path.join(plan.staging_dir, UPLOAD_SESSIONS_FILENAME), max_mbps=max_mbps)
         else:
             print("\nNo files need uploading - all are identical to GCS versions.")
 
-        # Patch cache-control on any existing image blobs that are missing it
-        TARGET_CACHE = 'public, max-age=3600'
-        blobs_to_patch = [
-            blob for blob in gcs_blobs
-            if blob.name.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.webp'))
-            and blob.cache_control != TARGET_CACHE
-        ]
-        if blobs_to_patch:
-            print(f"\nPatching cache-control on {len(blobs_to_patch)} existing image(s)...")
-            with tqdm(total=len(blobs_to_patch), desc="Patching cache-control", unit="file") as pbar:
-                for blob in blobs_to_patch:
-                    blob.cache_control = TARGET_CACHE
-                    blob.patch()
-                    pbar.update(1)
+        if plan.patches:
+            print(f"\nPatching cache-control on {len(plan.patches)} existing image(s)...")
 
-        # Generate and upload manifests for all folders (check for changes first)
-        print(f"\nChecking manifests for {len(client_folders)} folders...")
-        manifests_to_upload = []
-        manifests_to_skip = []
-        
-        with tqdm(total=len(client_folders), desc="Comparing manifests", unit="folder") as pbar:
-            for folder_name in client_folders:
-                image_list = images_by_folder[folder_name]
-                gcs_prefix = f"{folder_name.lower()}/"
-                manifest_path = f"{gcs_prefix}manifest.json"
-                
-                # Generate the new manifest content.
-                # Format: {"images": [...], "sequences": [...]}
-                # The "sequences" key is only populated when sequence keywords are present;
-                # albums without sequence keywords get an empty list and behave identically
-                # to the old plain-array format on the frontend.
-                sorted_filenames = [img["name"] for img in image_list] if image_list else []
-                sequences = build_sequences_for_folder(image_list) if image_list else []
-                new_manifest_content = json.dumps(
-                    {"images": sorted_filenames, "sequences": sequences},
-                    indent=2
-                )
-
-                # Write manifest locally so it can be inspected before/after sync
-                local_manifest_path = os.path.join(galleries[folder_name], "manifest.json")
-                with open(local_manifest_path, 'w', encoding='utf-8') as f:
-                    f.write(new_manifest_content)
-                
-                # Check if manifest exists and compare content
-                should_upload = True
-                if manifest_path in gcs_blob_map:
-                    existing_manifest_blob = gcs_blob_map[manifest_path]
-                    try:
-                        # Download existing manifest content
-                        existing_content = existing_manifest_blob.download_as_text()
-                        if existing_content.strip() == new_manifest_content.strip():
-                            should_upload = False
-                            manifests_to_skip.append({
-                                'folder': folder_name,
-                                'path': manifest_path
-                            })
-                    except Exception:
-                        # If we can't read the existing manifest, upload the new one
-                        pass
-                
-                if should_upload:
-                    manifests_to_upload.append({
-                        'folder': folder_name,
-                        'path': manifest_path,
-                        'content': new_manifest_content
-                    })
-                
-                pbar.update(1)
-        
-        # Report manifest comparison results
-        print(f"Manifests to upload: {len(manifests_to_upload)} (new or changed)")
-        print(f"Manifests to skip: {len(manifests_to_skip)} (identical)")
-        
-        # Upload only the manifests that need updating
-        if manifests_to_upload:
-            print(f"\nUploading {len(manifests_to_upload)} manifests...")
-            with tqdm(total=len(manifests_to_upload), desc="Updating manifests", unit="manifest") as pbar:
-                for manifest_info in manifests_to_upload:
-                    manifest_blob = bucket.blob(manifest_info['path'])
-                    manifest_blob.cache_control = 'no-store'
-                    manifest_blob.upload_from_string(
-                        manifest_info['content'],
-                        content_type='application/json'
-                    )
-                    manifest_blob.make_public()
-                    pbar.update(1)
+            def patch_one(name):
+                blob = bucket.blob(name)
+                blob.cache_control = IMAGE_CACHE_CONTROL
+                blob.patch()
+
+            run_parallel(plan.patches, patch_one, "Patching cache-control", "file")
+
+    # --- 6. Publish new or changed manifests ---
+    with _timed(timings, 'manifests') as manifests_stage:
+        if plan.manifests:
+            print(f"\nUploading {len(plan.manifests)} manifests...")
+
+            def publish_one(manifest_info):
+                gzipped, version_name, _ = gzip_manifest(manifest_info['manifest'])
+                if version_name != manifest_info['version']:
+                    raise ValueError(f"manifest for '{manifest_info['folder']}' doesn't match its version hash")
+                publish_manifest(bucket, manifest_info['prefix'], version_name,
+                                 gzipped, manifest_info['upload_version'])
+                manifests_stage.add_bytes(len(gzipped))
+
+            run_parallel(plan.manifests, publish_one, "Updating manifests", "manifest")
         else:
             print("\nNo manifests need updating - all are identical to GCS versions.")
 
-        # --- 6. Print Private Gallery URLs ---
-        print("\n--- Private Gallery URLs ---")
-        # Read the CNAME file to get the custom domain
-        cname_path = os.path.join(SCRIPT_DIR, '..', 'docs', 'CNAME')
-        domain = "photosby.loganwu.co.nz"  # Default domain
-        if os.path.exists(cname_path):
-            with open(cname_path, 'r') as f:
-                domain = f.read().strip()
-        
-        for folder_name in client_folders:
-            # URL encode the folder name to handle special characters, although GCS folders are lowercase
-            from urllib.parse import quote
-            encoded_folder = quote(folder_name.lower())
-            gallery_url = f"https://{domain}/albums/?album={encoded_folder}"
-            print(f"  > {folder_name}: {gallery_url}")
-        print("----------------------------")
-        
-        print("\nAll synchronizations completed successfully.")
-        sys.exit(0)
+    # --- 7. Delete what no album or manifest refers to any more ---
+    with _timed(timings, 'cleanup'):
+        to_delete = plan.deletes + plan.stale_manifests
+        if to_delete:
+            print(f"\nDeleting {len(plan.deletes)} old file(s) and "
+                  f"{len(plan.stale_manifests)} superseded manifest version(s)...")
+
+            def delete_one(name):
+                try:
+                    bucket.blob(name).delete()
+                except Exception as e:
+                    if not _is_not_found(e):  # already gone is as good as deleted
+                        raise
+
+            run_parallel(to_delete, delete_one, "Deleting GCS files", "file")
+        else:
+            print("\nNo old GCS files to delete.")
+
+
+def run_sync(staging_dir, bucket, dedupe=False, max_mbps=None, timings=None,
+             sequence_rules=DEFAULT_SEQUENCE_RULES):
+    """
+    Plans and immediately applies a sync of `staging_dir` to `bucket`. If
+    `timings` is a dict, each stage's wall time is added to it (see build_plan
+    and apply_plan). Returns the list of client folders synced (empty if there
+    was nothing to sync).
+    """
+    plan = build_plan(staging_dir, bucket, dedupe=dedupe, max_mbps=max_mbps, timings=timings,
+                      sequence_rules=sequence_rules)
+    if plan is None:
+        return []
+    print_plan_summary(plan.summary)
+    apply_plan(plan, bucket, max_mbps=max_mbps, timings=timings)
+    return plan.folders
+
+
+def main():
+    """Main function to discover all images, process them with a global progress bar, and sync."""
+    parser = argparse.ArgumentParser(
+        description="Sync the local staging folders to the private gallery GCS bucket. "
+                    "'plan PLAN.json' works out and saves every change without touching the bucket; "
+                    "'apply PLAN.json' then carries out a saved plan. With no command, a plan is "
+                    "made and applied straight away.")
+    parser.add_argument('command', nargs='?', choices=('sync', 'plan', 'apply'), default='sync',
+                        help='sync (default), plan or apply')
+    parser.add_argument('plan_file', nargs='?', default=None,
+                        help='The plan to write (plan) or carry out (apply)')
+    parser.add_argument('--max-mbps', type=float, default=None,
+                        help='Cap total upload bandwidth in megabits per second (default: uncapped). '
+                             'Upload concurrency is tuned automatically either way. When planning, '
+                             f'the duration estimate assumes this rate (or {PLAN_ASSUMED_MBPS:g} Mbps).')
+    parser.add_argument('--dedupe', action='store_true',
+                        help='Store each unique image once under a content-addressed path '
+                             f'({OBJECTS_PREFIX}<md5>/<filename>) shared by every album it appears in, '
+                             'with album manifests referencing those objects.')
+    parser.add_argument('--sequence-keyword', default=DEFAULT_SEQUENCE_RULES.keyword,
+                        help='Keyword marking images that belong to multiple-exposure sequences '
+                             f'(default: {DEFAULT_SEQUENCE_RULES.keyword})')
+    parser.add_argument('--sequence-bases', choices=('flash', 'burst'), default='flash',
+                        help='How a sequence starts: at each tagged flash image, with the non-flash '
+                             'images after it as overlays (flash, the default); or at each tagged '
+                             'image that follows an untagged one or a gap over --sequence-gap (burst)')
+    parser.add_argument('--sequence-gap', type=float, default=None, metavar='SECONDS',
+                        help='Longest capture-time gap within a sequence; a longer gap ends it '
+                             '(default: no limit)')
+    parser.add_argument('--staging-dir', default=LOCAL_STAGING_DIR,
+                        help=f'Local staging directory to sync from (default: {LOCAL_STAGING_DIR})')
+    parser.add_argument('--target', default=None,
+                        help='Where to sync to: gs://<bucket>, or a local directory that stands in '
+                             f'for the bucket, e.g. for offline testing (default: gs://{GCS_BUCKET_NAME}; '
+                             'apply uses the plan\'s target)')
+    profiling.add_arguments(parser)
+    args = parser.parse_args()
+    profiling.check_arguments(parser, args)
+
+    if args.command in ('plan', 'apply') and args.plan_file is None:
+        parser.error(f"{args.command} needs a plan file")
+    if args.sequence_gap is not None and args.sequence_gap < 0:
+        parser.error("--sequence-gap can't be negative")
+    sequence_rules = SequenceRules(keyword=args.sequence_keyword,
+                                   flash_bases=args.sequence_bases == 'flash',
+                                   max_gap=args.sequence_gap)
+    if args.command == 'sync' and args.plan_file is not None:
+        parser.error("a plan file is only used with plan or apply")
+
+    with profiling.profiled(args, 'sync_gcs'):
+        if GCS_BUCKET_NAME == "YOUR_GCS_BUCKET_NAME_HERE":
+            print("ERROR: Please update GCS_BUCKET_NAME in this script.", file=sys.stderr)
+            sys.exit(1)
+
+        if args.command == 'apply':
+            try:
+                plan = SyncPlan.load(args.plan_file)
+            except (OSError, ValueError, TypeError) as e:
+                print(f"ERROR: Could not read plan: {e}", file=sys.stderr)
+                sys.exit(1)
+            if args.target is not None and args.target != plan.target:
+                print(f"ERROR: The plan was made for '{plan.target}', not '{args.target}'.", file=sys.stderr)
+                sys.exit(1)
+            target = plan.target
+            staging_dir = plan.staging_dir
+        else:
+            target = args.target or f"gs://{GCS_BUCKET_NAME}"
+            staging_dir = os.path.abspath(args.staging_dir)
+
+        print("Starting GCS synchronization process..." if args.command != 'plan' else "Planning GCS synchronization...")
+        print(f"Local staging directory: '{staging_dir}'")
+        print(f"Target: '{target}'")
+        print("-" * 30)
 
-    except Exception as e:
-        print(f"\nAn unexpected error occurred during GCS synchronization: {e}", file=sys.stderr)
-        sys.exit(1)
+        if not os.path.isdir(staging_dir):
+            print(f"ERROR: Local staging directory '{staging_dir}' not found.", file=sys.stderr)
+            sys.exit(1)
+
+        try:
+            bucket = open_target(target, SA_KEY_PATH)
+        except FileNotFoundError as e:
+            print(f"ERROR: {e}", file=sys.stderr)
+            sys.exit(1)
+
+        try:
+            if args.command == 'apply':
+                print_plan_summary(plan.summary)
+            else:
+                plan = build_plan(staging_dir, bucket, target=target, dedupe=args.dedupe,
+                                  max_mbps=args.max_mbps, sequence_rules=sequence_rules)
+                if plan is None:
+                    sys.exit(0)
+                print_plan_summary(plan.summary)
+
+            if args.command == 'plan':
+                plan.save(args.plan_file)
+                print(f"\nPlan saved to '{args.plan_file}'. Nothing has been changed on the target; "
+                      f"run 'sync_gcs.py apply {args.plan_file}' to carry it out.")
+                sys.exit(0)
+
+            apply_plan(plan, bucket, max_mbps=args.max_mbps)
+
+            # --- 8. Print Private Gallery URLs ---
+            print_gallery_urls(plan.folders)
+
+            print("\nAll synchronizations completed successfully.")
+            sys.exit(0)
+
+        except Exception as e:
+            print(f"\nAn unexpected error occurred during GCS synchronization: {e}", file=sys.stderr)
+            sys.exit(1)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,223 @@
+"""Storage targets for sync_gcs.py.
+
+sync_gcs.py talks to its destination through a small, duck-typed subset of the
+google-cloud-storage Bucket/Blob API:
+
+    bucket.list_blobs(prefix=None, fields=None), bucket.blob(name), bucket.get_blob(name),
+    bucket.delete_blobs(blobs)
+    blob.name, .size, .md5_hash (base64), .cache_control, .content_type,
+    .content_encoding, .metadata
+    blob.upload_from_file(f, size=, content_type=), blob.upload_from_string(),
+    blob.download_as_bytes(), blob.make_public(), blob.patch(), blob.delete()
+
+open_target() returns either a real GCS bucket or a LocalBucket, which
+implements the same subset on a plain directory -- so a sync can be run,
+inspected and benchmarked entirely offline. Blobs that set
+`chunked_uploads = False` are always sent with a single upload_from_file call
+(resumable sessions and composite uploads are GCS-only).
+
+Objects are stored at <root>/<name>; their properties (size, MD5, cache
+control, ...) live in a JSON sidecar under <root>/.meta/. An optional
+per-call latency makes the local target behave more like a remote one, so
+concurrency effects show up in benchmarks.
+"""
+
+import base64
+import gzip
+import hashlib
+import json
+import os
+import time
+from io import BytesIO
+
+META_DIR = '.meta'
+COPY_BUFFER_SIZE = 1024 * 1024
+
+
+def open_target(target, sa_key_path=None):
+    """
+    Returns a bucket for `target`: 'gs://<bucket>' for Google Cloud Storage
+    (authenticated with the service account key at sa_key_path), or a local
+    directory path for a LocalBucket.
+    """
+    if target.startswith('gs://'):
+        from google.cloud import storage
+        if sa_key_path is None or not os.path.exists(sa_key_path):
+            raise FileNotFoundError(f"Service account key not found at '{sa_key_path}'")
+        storage_client = storage.Client.from_service_account_json(sa_key_path)
+        return storage_client.bucket(target[len('gs://'):].rstrip('/'))
+    return LocalBucket(target)
+
+
+class LocalBlob:
+    """A LocalBucket object, mirroring the google.cloud.storage.Blob attributes sync_gcs.py uses."""
+
+    chunked_uploads = False
+
+    def __init__(self, bucket, name, props=None):
+        self.bucket = bucket
+        self.name = name
+        props = props or {}
+        self.size = props.get('size')
+        self.md5_hash = props.get('md5_hash')
+        self.content_type = props.get('content_type')
+        self.content_encoding = props.get('content_encoding')
+        self.cache_control = props.get('cache_control')
+        self.metadata = props.get('metadata')
+
+    @property
+    def _path(self):
+        return os.path.join(self.bucket.root, *self.name.split('/'))
+
+    @property
+    def _meta_path(self):
+        return os.path.join(self.bucket.root, META_DIR, *self.name.split('/')) + '.json'
+
+    def _save_props(self):
+        props = {
+            'size': self.size,
+            'md5_hash': self.md5_hash,
+            'content_type': self.content_type,
+            'content_encoding': self.content_encoding,
+            'cache_control': self.cache_control,
+            'metadata': self.metadata,
+        }
+        os.makedirs(os.path.dirname(self._meta_path), exist_ok=True)
+        with open(self._meta_path, 'w', encoding='utf-8') as f:
+            json.dump(props, f)
+
+    def upload_from_file(self, file_obj, size=None, content_type=None):
+        self.bucket._round_trip()
+        os.makedirs(os.path.dirname(self._path), exist_ok=True)
+        # Written under a dot-prefixed name (never listed) and renamed into
+        # place, so a reader never sees a half-written object.
+        tmp_path = os.path.join(os.path.dirname(self._path), f".{os.path.basename(self._path)}.uploading")
+        md5 = hashlib.md5()
+        written = 0
+        with open(tmp_path, 'wb') as out:
+            while size is None or written < size:
+                want = COPY_BUFFER_SIZE if size is None else min(COPY_BUFFER_SIZE, size - written)
+                data = file_obj.read(want)
+                if not data:
+                    break
+                out.write(data)
+                md5.update(data)
+                written += len(data)
+        if size is not None and written != size:
+            os.remove(tmp_path)
+            raise ValueError(f"Size {size} was specified but the file-like object only had {written} bytes remaining.")
+        os.replace(tmp_path, self._path)
+        self.size = written
+        self.md5_hash = base64.b64encode(md5.digest()).decode('ascii')
+        self.content_type = content_type or self.content_type
+        self._save_props()
+
+    def upload_from_filename(self, filename, content_type=None):
+        with open(filename, 'rb') as f:
+            self.upload_from_file(f, size=os.path.getsize(filename), content_type=content_type)
+
+    def upload_from_string(self, data, content_type='text/plain'):
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        self.upload_from_file(BytesIO(data), size=len(data), content_type=content_type)
+
+    def download_as_bytes(self):
+        self.bucket._round_trip()
+        with open(self._path, 'rb') as f:
+            data = f.read()
+        # Like GCS's decompressive transcoding for clients that don't ask for gzip
+        if self.content_encoding == 'gzip':
+            data = gzip.decompress(data)
+        return data
+
+    def download_as_text(self, encoding='utf-8'):
+        return self.download_as_bytes().decode(encoding)
+
+    def exists(self):
+        self.bucket._round_trip()
+        return os.path.exists(self._path)
+
+    def make_public(self):
+        self.bucket._round_trip()  # local objects are always readable
+
+    def patch(self):
+        self.bucket._round_trip()
+        self._save_props()
+
+    def delete(self):
+        self.bucket._round_trip()
+        os.remove(self._path)
+        try:
+            os.remove(self._meta_path)
+        except FileNotFoundError:
+            pass
+        # GCS has no directories, so don't leave empty "folders" behind either
+        for path in (self._path, self._meta_path):
+            self.bucket._prune_empty_dirs(os.path.dirname(path))
+
+
+class LocalBucket:
+    """A directory standing in for a GCS bucket (see the module docstring)."""
+
+    def __init__(self, root, latency=0.0):
+        self.root = os.path.abspath(root)
+        self.name = self.root
+        self.latency = latency
+        os.makedirs(self.root, exist_ok=True)
+
+    def _round_trip(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _load(self, name):
+        blob = LocalBlob(self, name)
+        try:
+            with open(blob._meta_path, 'r', encoding='utf-8') as f:
+                props = json.load(f)
+        except (OSError, ValueError):
+            props = {'size': os.path.getsize(blob._path)}
+        return LocalBlob(self, name, props)
+
+    def _prune_empty_dirs(self, path):
+        """Removes `path` and its parents while they are empty, stopping at the root."""
+        stop = {self.root, os.path.join(self.root, META_DIR)}
+        while path not in stop and path.startswith(self.root + os.sep):
+            try:
+                os.rmdir(path)
+            except OSError:
+                return  # not empty
+            path = os.path.dirname(path)
+
+    def blob(self, name):
+        return LocalBlob(self, name)
+
+    def get_blob(self, name):
+        self._round_trip()
+        if not os.path.isfile(os.path.join(self.root, *name.split('/'))):
+            return None
+        return self._load(name)
+
+    def list_blobs(self, prefix=None, max_results=None, fields=None):
+        # `fields` (a GCS partial-response selector) is accepted and ignored.
+        # Like the GCS client's iterator, objects are produced lazily.
+        self._round_trip()
+        listed = 0
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            if dirpath == self.root:
+                dirnames[:] = [d for d in dirnames if d != META_DIR]
+            dirnames.sort()
+            rel_dir = os.path.relpath(dirpath, self.root)
+            for filename in sorted(filenames):
+                if filename.startswith('.'):
+                    continue
+                name = filename if rel_dir == '.' else f"{rel_dir.replace(os.sep, '/')}/{filename}"
+                if prefix and not name.startswith(prefix):
+                    continue
+                yield self._load(name)
+                listed += 1
+                if max_results is not None and listed >= max_results:
+                    return
+
+    def delete_blobs(self, blobs):
+        for blob in blobs:
+            blob.delete()
@@ -0,0 +1,54 @@
+"""Checks that hls_package.py packages a rotated phone clip by the size it plays at.
+
+Phones often store a portrait clip as landscape frames plus a display
+rotation; VideoInfo.display_size turns that back upright. The packaging case
+needs ffmpeg and ffprobe on PATH and is skipped otherwise. Run with:
+
+    python -m pytest scripts/test_hls_package.py
+"""
+
+import shutil
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from hls_package import MASTER_PLAYLIST, POSTER_NAME, package_video
+from video_probe import VideoInfo, probe
+
+
+def _info(**stream) -> VideoInfo:
+    return VideoInfo.from_ffprobe({'format': {'duration': '2.0'},
+                                   'streams': [{'codec_type': 'video', 'width': 1920, 'height': 1080, **stream}]})
+
+
+def test_display_matrix_rotation_swaps_the_size():
+    for angle in (90, -90, 270):
+        info = _info(side_data_list=[{'side_data_type': 'Display Matrix', 'rotation': angle}])
+        assert info.size == (1920, 1080)
+        assert info.display_size == (1080, 1920)
+    info = _info(side_data_list=[{'side_data_type': 'Display Matrix', 'rotation': -180}])
+    assert info.rotation == 180 and info.display_size == (1920, 1080)
+
+
+def test_rotate_tag_and_no_rotation():
+    assert _info(tags={'rotate': '90'}).display_size == (1080, 1920)
+    assert _info().rotation == 0 and _info().display_size == (1920, 1080)
+
+
+@pytest.mark.skipif(not shutil.which('ffmpeg') or not shutil.which('ffprobe'),
+                    reason='needs ffmpeg and ffprobe on PATH')
+def test_rotated_clip_is_packaged_portrait(tmp_path: Path):
+    stored = tmp_path / 'stored.mp4'
+    clip = tmp_path / 'clip.mp4'
+    subprocess.run(['ffmpeg', '-v', 'error', '-f', 'lavfi', '-i', 'testsrc=size=640x360:rate=10:duration=2',
+                    '-c:v', 'libx264', str(stored)], check=True)
+    subprocess.run(['ffmpeg', '-v', 'error', '-display_rotation', '90', '-i', str(stored), '-c', 'copy', str(clip)],
+                   check=True)
+
+    package = package_video(clip, tmp_path / 'package')
+    assert package is not None
+    assert (package.width, package.height) == (360, 640)
+    assert package.renditions == ['360p']
+    assert 'RESOLUTION=360x640' in (tmp_path / 'package' / MASTER_PLAYLIST).read_text()
+    assert probe(tmp_path / 'package' / POSTER_NAME).display_size == (360, 640)
@@ -0,0 +1,99 @@
+"""Checks sync_gcs.build_sequences_for_folder's grouping of albums into multiple-exposure sequences.
+
+The default-rules cases expect what the original loop-based builder returned
+for the same albums. Run with:
+
+    python -m pytest scripts/test_sync_sequences.py
+"""
+
+from sync_gcs import StagedFile, SequenceRules, build_sequences_for_folder
+
+ME = ('multiple_exposure',)
+
+
+def _album(*images):
+    """StagedFiles from (name, capture seconds, keywords, flash) tuples, in capture order."""
+    return [StagedFile(folder='album', name=name, directory='/staging/album', size=0, mtime=0.0,
+                       timestamp=seconds * 1_000_000, keywords=keywords, flash=flash)
+            for name, seconds, keywords, flash in images]
+
+
+def _groups(sequences):
+    return [(s['base'], s['overlays']) for s in sequences]
+
+
+def test_no_tagged_images_gives_no_sequences():
+    album = _album(('a.jpg', 0, (), True), ('b.jpg', 1, ('other',), False))
+    assert build_sequences_for_folder(album) == []
+
+
+def test_flash_bases_and_overlays():
+    album = _album(
+        ('a.jpg', 0, (), False),
+        ('b.jpg', 1, ME, True),
+        ('c.jpg', 2, ME, False),
+        ('d.jpg', 3, ('Multiple_Exposure', 'x'), False),  # any case, among other keywords
+        ('e.jpg', 4, ME, True),
+        ('f.jpg', 5, ME, False),
+        ('g.jpg', 6, (), False),                          # ends e's sequence
+        ('h.jpg', 7, ME, False),                          # no base to join
+        ('i.jpg', 8, ME, None),
+        ('j.jpg', 9, ME, True),
+        ('k.jpg', 10, ('MULTIPLE_EXPOSURE',), True),      # a flash starts a new sequence
+        ('l.jpg', 11, ME, False),
+    )
+    assert _groups(build_sequences_for_folder(album)) == [
+        ('a.jpg', []), ('b.jpg', ['c.jpg', 'd.jpg']), ('e.jpg', ['f.jpg']), ('g.jpg', []), ('h.jpg', []),
+        ('i.jpg', []), ('j.jpg', []), ('k.jpg', ['l.jpg']),
+    ]
+
+
+def test_overlays_before_any_base_stand_alone():
+    album = _album(('a.jpg', 0, ME, False), ('b.jpg', 1, ME, False), ('c.jpg', 2, ME, True),
+                   ('d.tif', 3, ME, False))
+    sequences = build_sequences_for_folder(album)
+    assert _groups(sequences) == [('a.jpg', []), ('b.jpg', []), ('c.jpg', ['d.tif'])]
+    assert [s['id'] for s in sequences] == ['a', 'b', 'c']
+
+
+def test_custom_keyword():
+    album = _album(('a.jpg', 0, ME, True), ('b.jpg', 1, ('Layered',), True), ('c.jpg', 2, ('layered',), False))
+    assert _groups(build_sequences_for_folder(album, SequenceRules(keyword='layered'))) == [
+        ('a.jpg', []), ('b.jpg', ['c.jpg']),
+    ]
+
+
+def test_gap_ends_a_flash_sequence():
+    album = _album(
+        ('a.jpg', 0, ME, True),
+        ('b.jpg', 1, ME, False),
+        ('c.jpg', 5, ME, False),   # 4 s after b: can't join a's sequence
+        ('d.jpg', 6, ME, False),   # nor can anything after it without a new base
+        ('e.jpg', 20, ME, True),
+        ('f.jpg', 22, ME, False),  # exactly max_gap: still joins
+    )
+    assert _groups(build_sequences_for_folder(album, SequenceRules(max_gap=2))) == [
+        ('a.jpg', ['b.jpg']), ('c.jpg', []), ('d.jpg', []), ('e.jpg', ['f.jpg']),
+    ]
+    # Without a limit the gaps don't matter
+    assert _groups(build_sequences_for_folder(album)) == [
+        ('a.jpg', ['b.jpg', 'c.jpg', 'd.jpg']), ('e.jpg', ['f.jpg']),
+    ]
+
+
+def test_bursts_split_on_untagged_images_and_gaps():
+    album = _album(
+        ('a.jpg', 0, (), True),
+        ('b.jpg', 1, ME, False),   # after an untagged image: starts a burst, flash or not
+        ('c.jpg', 2, ME, True),
+        ('d.jpg', 10, ME, False),  # after a gap: starts another
+        ('e.jpg', 11, ME, False),
+        ('f.jpg', 12, (), False),
+        ('g.jpg', 13, ME, False),
+    )
+    assert _groups(build_sequences_for_folder(album, SequenceRules(flash_bases=False, max_gap=3))) == [
+        ('a.jpg', []), ('b.jpg', ['c.jpg']), ('d.jpg', ['e.jpg']), ('f.jpg', []), ('g.jpg', []),
+    ]
+    assert _groups(build_sequences_for_folder(album, SequenceRules(flash_bases=False))) == [
+        ('a.jpg', []), ('b.jpg', ['c.jpg', 'd.jpg', 'e.jpg']), ('f.jpg', []), ('g.jpg', []),
+    ]
@@ -0,0 +1,60 @@
+"""Checks that sync_gcs recognises its own composite uploads as unchanged on the next sync.
+
+GCS gives an object uploaded in parallel parts no md5Hash, so upload_file
+stores the local MD5 in the object's metadata and files_are_identical falls
+back to it. Run with:
+
+    python -m pytest scripts/test_sync_uploads.py
+"""
+
+import hashlib
+from types import SimpleNamespace
+
+import google.cloud.storage.transfer_manager as transfer_manager
+
+import sync_gcs
+from sync_gcs import COMPOSITE_MD5_METADATA_KEY, RemoteObject, StagedFile, files_are_identical, upload_file
+
+
+def _staged(tmp_path, content):
+    path = tmp_path / 'big.tif'
+    path.write_bytes(content)
+    return StagedFile(folder='album', name=path.name, directory=str(tmp_path), size=len(content),
+                      mtime=path.stat().st_mtime)
+
+
+def _composite(size, metadata):
+    """A listed object as a composite upload leaves it: no md5Hash."""
+    return RemoteObject(name='album/big.tif', size=size, md5_hash=None, cache_control=None, metadata=metadata)
+
+
+def test_composite_upload_with_stored_md5_is_identical(tmp_path):
+    content = b'tiff' * 1000
+    staged = _staged(tmp_path, content)
+    blob = _composite(len(content), {COMPOSITE_MD5_METADATA_KEY: hashlib.md5(content).hexdigest()})
+    assert files_are_identical(staged, blob)
+
+
+def test_composite_upload_with_other_md5_differs(tmp_path):
+    content = b'tiff' * 1000
+    staged = _staged(tmp_path, content)
+    assert not files_are_identical(staged, _composite(len(content), {COMPOSITE_MD5_METADATA_KEY: '0' * 32}))
+    assert not files_are_identical(staged, _composite(len(content), None))
+
+
+def test_composite_upload_stores_its_md5(tmp_path, monkeypatch):
+    content = b'tiff' * 1000
+    staged = _staged(tmp_path, content)
+    monkeypatch.setattr(sync_gcs, 'COMPOSITE_UPLOAD_THRESHOLD', 1)
+    sent = {}
+
+    def upload_chunks_concurrently(filename, blob, **kwargs):
+        sent['metadata'] = dict(blob.metadata)
+
+    monkeypatch.setattr(transfer_manager, 'upload_chunks_concurrently', upload_chunks_concurrently)
+    blob = SimpleNamespace(name='album/big.tif', metadata=None)
+    upload_file(blob, staged, sessions=None)
+
+    assert sent['metadata'] == {COMPOSITE_MD5_METADATA_KEY: hashlib.md5(content).hexdigest()}
+    # And the next sync's listing of it compares as unchanged
+    assert files_are_identical(staged, _composite(len(content), sent['metadata']))
@@ -0,0 +1,81 @@
+"""Checks work_queue.WorkQueue's leases: one claimer per job, and reclaiming only stale leases.
+
+Run with:
+
+    python -m pytest scripts/test_work_queue.py
+"""
+
+import multiprocessing
+import os
+import time
+from pathlib import Path
+
+import pytest
+
+from work_queue import LEASE_SECONDS, WorkQueue
+
+WORKERS = 4
+JOBS = 50
+
+
+def _jobs(folder: Path) -> list[Path]:
+    return [folder / f"clip{i:03}.mp4" for i in range(JOBS)]
+
+
+def _claim_all(folder: Path, barrier, claims) -> None:
+    with WorkQueue(folder, 'test') as queue:
+        barrier.wait()  # start claiming together
+        claims.put([job.name for job in _jobs(folder) if queue.claim(job) is not None])
+        barrier.wait()  # and keep every lease until all the workers are done claiming
+
+
+def _age(path: Path, seconds: float) -> None:
+    then = time.time() - seconds
+    os.utime(path, (then, then))
+
+
+def test_each_job_is_claimed_once(tmp_path: Path):
+    ctx = multiprocessing.get_context()
+    barrier, claims = ctx.Barrier(WORKERS), ctx.Queue()
+    workers = [ctx.Process(target=_claim_all, args=(tmp_path, barrier, claims)) for _ in range(WORKERS)]
+    for worker in workers:
+        worker.start()
+    claimed = [name for _ in workers for name in claims.get(timeout=60)]
+    for worker in workers:
+        worker.join(timeout=60)
+        assert worker.exitcode == 0
+    assert sorted(claimed) == [job.name for job in _jobs(tmp_path)]
+
+
+@pytest.mark.parametrize('lease', [None, b'', b'{"output": "/out/clip.mp4", "wor'],
+                         ids=['dead worker', 'empty', 'half-written'])
+def test_stale_lease_is_reclaimed(tmp_path: Path, lease: bytes | None):
+    job = tmp_path / 'clip.mp4'
+    with WorkQueue(tmp_path, 'test') as first, WorkQueue(tmp_path, 'test') as second:
+        assert first.claim(job) == {}
+        path = first._lease_path(job)
+        if lease is not None:
+            path.write_bytes(lease)  # as a worker that died while writing it left it
+        _age(path, LEASE_SECONDS + 5)
+
+        previous = second.claim(job)
+        assert previous is not None
+        if lease is None:
+            assert previous['worker'] == first.worker
+        else:
+            assert previous == {}
+        assert second.holds(job)
+        assert not first.holds(job)
+        first.release(job)  # must not remove the new owner's lease
+        assert second.holds(job)
+
+
+def test_fresh_lease_is_not_reclaimed(tmp_path: Path):
+    job = tmp_path / 'clip.mp4'
+    with WorkQueue(tmp_path, 'test') as first, WorkQueue(tmp_path, 'test') as second:
+        assert first.claim(job) == {}
+        _age(first._lease_path(job), LEASE_SECONDS - 30)
+        assert second.claim(job) is None
+        first._lease_path(job).write_bytes(b'')  # one still being written
+        assert second.claim(job) is None
+        assert not second.holds(job)
@@ -0,0 +1,163 @@
+"""CPU thread budgeting between concurrent ffmpeg encodes.
+
+Left to itself, every libx265 or vaguedenoiser ffmpeg process sizes its
+frame, WPP and filter thread pools for the whole machine. A batch encoding
+several files at once then runs many times more threads than there are
+cores, and they thrash each other's caches. Instead a batch runs at a fixed
+concurrency, and each encode gets an explicit share of the cores. The share
+is given as `-threads` (decoder and encoder), `-filter_threads` and, for
+libx265, `-x265-params pools=N`. It is worked out as each encode starts,
+from the threads the running encodes aren't using. So once the queue runs
+dry, the last few encodes pick up the cores the finished ones gave back.
+
+The default split is DEFAULT_THREADS_PER_JOB threads per encode. The best
+split depends on the machine, the encoder and the footage, though. A
+benchmark (--bench-threads in compress_videos.py and denoise_videos.py)
+encodes a sample of the batch at every (concurrency × threads) split. It
+saves the fastest split for those settings on this machine, and later
+batches use it.
+"""
+
+import json
+import os
+import subprocess
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+CPU_COUNT = os.cpu_count() or 2
+TOTAL_THREADS = max(1, CPU_COUNT - 1)  # leave one core free
+DEFAULT_THREADS_PER_JOB = 4
+BENCH_SECONDS = 20
+SPLITS_NAME = 'thread_splits.json'
+
+
+def default_concurrency() -> int:
+    return max(1, TOTAL_THREADS // DEFAULT_THREADS_PER_JOB)
+
+
+def ffmpeg_thread_args(threads: int, x265: bool) -> tuple[list[str], list[str]]:
+    """
+    (options for before -i, options for before the output) that hold one
+    ffmpeg encode to `threads` threads.
+    """
+    output = ['-threads', str(threads)]
+    if x265:
+        output += ['-x265-params', f'pools={threads}']
+    return ['-filter_threads', str(threads), '-threads', str(threads)], output
+
+
+class ThreadBudget:
+    """
+    Shares `total` threads between up to `concurrency` encodes at a time, out
+    of a batch of `jobs`. lease() gives each starting encode an even share of
+    the threads not in use, split across the slots about to fill. Slots the
+    rest of the batch can't fill don't take a share.
+    """
+
+    def __init__(self, total: int, concurrency: int, jobs: int):
+        self.total = total
+        self.concurrency = max(1, concurrency)
+        self._unstarted = jobs
+        self._started = set()
+        self._active = 0
+        self._in_use = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def lease(self, key):
+        """
+        Yields the number of threads for one run of job `key`. Leasing again
+        for the same key (a retry) doesn't count as another job starting.
+        """
+        with self._lock:
+            if key not in self._started:
+                self._started.add(key)
+                self._unstarted -= 1
+            filling = max(1, min(self.concurrency - self._active, self._unstarted + 1))
+            threads = max(1, (self.total - self._in_use) // filling)
+            self._active += 1
+            self._in_use += threads
+        try:
+            yield threads
+        finally:
+            with self._lock:
+                self._active -= 1
+                self._in_use -= threads
+
+
+def candidate_splits(total: int = TOTAL_THREADS) -> list[tuple[int, int]]:
+    """
+    (concurrency, threads per encode) pairs, fewest encodes first: for each
+    distinct share of `total`, as many encodes as get that share.
+    """
+    return sorted({(total // (total // concurrency), total // concurrency)
+                   for concurrency in range(1, total + 1)})
+
+
+def _splits_path() -> str:
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_home, 'photosby', SPLITS_NAME)
+
+
+def _split_key(settings: str) -> str:
+    return f"{settings} on {CPU_COUNT} cpus"
+
+
+def _load_splits() -> dict:
+    try:
+        with open(_splits_path(), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def saved_concurrency(settings: str) -> int | None:
+    """The concurrency --bench-threads found fastest for `settings` on this machine, if any."""
+    split = _load_splits().get(_split_key(settings))
+    return split['concurrency'] if split else None
+
+
+def benchmark(settings: str, make_cmd, seconds: int = BENCH_SECONDS) -> tuple[int, int]:
+    """
+    Times every split in candidate_splits(): `concurrency` copies of the
+    command make_cmd(threads, output_path) at once, each encoding the first
+    `seconds` of its input. make_cmd's command must end with the output
+    path. Prints a row per split and saves the fastest for `settings`.
+    Returns that (concurrency, threads).
+    """
+    print(f"Benchmarking thread splits over {TOTAL_THREADS} threads, {seconds}s of video per encode\n")
+    print(f"{'encodes':>8}{'threads':>9}{'wall':>9}{'video s/s':>11}")
+    results = []
+    with tempfile.TemporaryDirectory(prefix='.thread_bench_') as tmp:
+        for concurrency, threads in candidate_splits():
+            cmds = []
+            for i in range(concurrency):
+                cmd = make_cmd(threads, Path(tmp) / f"{concurrency}_{i}.mp4")
+                cmds.append([*cmd[:-1], '-t', str(seconds), cmd[-1]])
+            start = time.perf_counter()
+            procs = [subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE) for cmd in cmds]
+            failed = [p for p in procs if p.wait() != 0]
+            wall = time.perf_counter() - start
+            if failed:
+                print(f"{concurrency:>8}{threads:>9}   failed: {failed[0].stderr.read().decode(errors='replace').strip()[-200:]}")
+                continue
+            throughput = concurrency * seconds / wall
+            results.append((throughput, concurrency, threads))
+            print(f"{concurrency:>8}{threads:>9}{wall:>8.1f}s{throughput:>11.2f}")
+    if not results:
+        raise RuntimeError("every benchmark encode failed")
+
+    throughput, concurrency, threads = max(results)
+    splits = _load_splits()
+    splits[_split_key(settings)] = {'concurrency': concurrency, 'threads': threads,
+                                    'video_seconds_per_second': round(throughput, 3)}
+    path = _splits_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(splits, f, indent=2, sort_keys=True)
+    os.replace(path + '.tmp', path)
+    print(f"\nFastest: {concurrency} encode(s) × {threads} thread(s); saved as the default for {settings}")
+    return concurrency, threads
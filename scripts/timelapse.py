@@ -2,7 +2,9 @@
 """Create an MP4 from a folder of images, each held for a fixed interval.
 
 Images are sorted by EXIF capture date (DateTimeOriginal). Each photo is
-displayed for the given interval in decimal seconds.
+displayed for the given interval in decimal seconds. Capture dates and
+orientations come from the shared photo catalog (photo_catalog.py), so only
+images new or changed since any script last read them are opened.
 
 Usage: python3 timelapse.py <folder> [output.mp4] (--interval SECONDS | --duration SECONDS | --bpm BPM)
 
@@ -17,65 +19,13 @@ import tempfile
 from datetime import datetime
 from pathlib import Path
 
-from PIL import Image
+import profiling
+from photo_catalog import Catalog
 
 IMAGE_EXTS = {'.jpg', '.jpeg', '.tif', '.tiff', '.png'}
 
 LAST_HOLD_SECONDS = 3.0
 
-_EXIF_IFD   = 0x8769
-_TAG_DTO    = 36867
-_TAG_DTD    = 36868
-_TAG_DT     = 306
-_TAG_SSDTO  = 37521
-_TAG_SSDTD  = 37522
-
-
-def _parse_subsec(raw: str | None) -> int:
-    if not raw:
-        return 0
-    return int(raw.ljust(6, '0')[:6])
-
-
-def get_capture_time(path: Path) -> datetime | None:
-    try:
-        with Image.open(path) as img:
-            exif = img.getexif()
-            exif_ifd = exif.get_ifd(_EXIF_IFD)
-
-        for dt_tag, subsec_tag in ((_TAG_DTO, _TAG_SSDTO), (_TAG_DTD, _TAG_SSDTD)):
-            raw = exif_ifd.get(dt_tag)
-            if raw:
-                try:
-                    dt = datetime.strptime(raw[:19], '%Y:%m:%d %H:%M:%S')
-                    return dt.replace(microsecond=_parse_subsec(exif_ifd.get(subsec_tag)))
-                except ValueError:
-                    pass
-
-        raw = exif.get(_TAG_DT)
-        if raw:
-            return datetime.strptime(raw[:19], '%Y:%m:%d %H:%M:%S')
-
-    except Exception as e:
-        print(f"  WARN: could not read EXIF from {path.name} — {e}")
-    return None
-
-
-_TAG_ORIENTATION = 274
-
-
-def get_orientation(path: Path) -> str:
-    with Image.open(path) as img:
-        w, h = img.size
-        if img.getexif().get(_TAG_ORIENTATION) in (5, 6, 7, 8):
-            w, h = h, w
-    if w > h:
-        return 'landscape'
-    if h > w:
-        return 'portrait'
-    return 'square'
-
-
 def _pick_encoder() -> list[str]:
     result = subprocess.run(['ffmpeg', '-encoders', '-v', 'quiet'],
                             capture_output=True, text=True)
@@ -94,44 +44,35 @@ def make_timelapse(folder: Path, output: Path, width: int, height: int,
         print("ffmpeg not found on PATH. Install it with: brew install ffmpeg")
         sys.exit(1)
 
-    files = sorted(p for p in folder.rglob('*') if p.suffix.lower() in IMAGE_EXTS)
-    if not files:
+    with profiling.stage('metadata'), Catalog() as catalog:
+        images = catalog.scan(folder, IMAGE_EXTS)
+    if not images:
         print("No images found.")
         sys.exit(1)
 
-    print(f"Found {len(files)} image(s) in {folder}\n")
-
-    entries: list[tuple[datetime, Path]] = []
-    skipped = 0
-    for f in files:
-        ts = get_capture_time(f)
-        if ts is None:
-            skipped += 1
-        else:
-            entries.append((ts, f))
+    print(f"Found {len(images)} image(s) in {folder}\n")
 
+    with_time = [img for img in images if img.capture is not None]
+    skipped = len(images) - len(with_time)
     if skipped:
         print(f"  Skipped {skipped} image(s) with no readable timestamp\n")
 
-    if not entries:
+    if not with_time:
         print("No images with readable timestamps.")
         sys.exit(1)
 
     if match_orientation:
         target = 'landscape' if width > height else 'portrait' if height > width else 'square'
-        matched, excluded = [], 0
-        for ts, path in entries:
-            if get_orientation(path) in (target, 'square'):
-                matched.append((ts, path))
-            else:
-                excluded += 1
+        matched = [img for img in with_time if img.orientation in (target, 'square')]
+        excluded = len(with_time) - len(matched)
         if excluded:
             print(f"  Excluded {excluded} image(s) not matching {target} orientation\n")
-        entries = matched
-        if not entries:
+        with_time = matched
+        if not with_time:
             print(f"No images matching {target} orientation.")
             sys.exit(1)
 
+    entries: list[tuple[datetime, Path]] = [(img.captured_at, Path(img.path)) for img in with_time]
     entries.sort(key=lambda x: x[0])
 
     if limit is not None:
@@ -169,7 +110,10 @@ def make_timelapse(folder: Path, output: Path, width: int, height: int,
             str(output),
         ]
         print('Running:', ' '.join(cmd))
-        result = subprocess.run(cmd)
+        with profiling.stage('encode') as encode:
+            result = subprocess.run(cmd)
+            if output.exists():
+                encode.add_bytes(output.stat().st_size)
     finally:
         concat_file.unlink(missing_ok=True)
 
@@ -201,7 +145,9 @@ def main() -> None:
                              'the output size — square photos are always included')
     parser.add_argument('--test', action='store_true',
                         help='Stop after the first 10 images')
+    profiling.add_arguments(parser)
     args = parser.parse_args()
+    profiling.check_arguments(parser, args)
 
     folder = args.folder.expanduser().resolve()
     if not folder.exists():
@@ -215,8 +161,9 @@ def main() -> None:
         sys.exit(1)
 
     output = args.output or folder.parent / (folder.name + '_timelapse.mp4')
-    make_timelapse(folder, output, width, height, interval=args.interval, duration=args.duration,
-                    bpm=args.bpm, limit=10 if args.test else None, match_orientation=args.match_orientation)
+    with profiling.profiled(args, 'timelapse'):
+        make_timelapse(folder, output, width, height, interval=args.interval, duration=args.duration,
+                        bpm=args.bpm, limit=10 if args.test else None, match_orientation=args.match_orientation)
 
 
 if __name__ == '__main__':
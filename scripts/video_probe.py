@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""Probe videos with one ffprobe call each, in parallel, through a persistent cache.
+
+A single `ffprobe -show_format -show_streams -of json` call answers
+everything the video scripts need to know about a file: duration, size,
+codecs, pixel format, frame rate, bit rate, audio and timecode. The JSON is
+kept in a SQLite cache keyed by the file's absolute path and trusted while
+its size and mtime are unchanged, so re-running a batch over thousands of
+clips only launches ffprobe for the files that are new or have changed. The
+misses are probed several at a time, since each call mostly waits on the
+disk.
+
+compress_videos.py, denoise_videos.py and hls_package.py all probe through
+here. The cache lives at $PHOTOSBY_PROBE_CACHE, or photosby/probe.sqlite in
+the user cache directory ($XDG_CACHE_HOME, default ~/.cache). Failed probes
+aren't cached, so a file that was still being copied is probed again next time.
+
+Usage: python3 video_probe.py <folder-or-file> [...]
+Probes every video under the given paths (through the cache) and lists them.
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+
+CACHE_ENV = 'PHOTOSBY_PROBE_CACHE'
+CACHE_VERSION = 1
+PROBE_WORKERS = min(16, max(4, (os.cpu_count() or 2) * 2))  # ffprobe mostly waits on the disk
+
+VIDEO_EXTS = {'.mp4', '.mov', '.m4v', '.avi', '.mkv', '.mts', '.m2ts', '.wmv', '.flv', '.webm'}
+
+_SCHEMA = """
+CREATE TABLE probes (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    probe TEXT NOT NULL         -- ffprobe's JSON output
+) WITHOUT ROWID;
+"""
+
+
+def default_cache_path() -> str:
+    if os.environ.get(CACHE_ENV):
+        return os.environ[CACHE_ENV]
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_home, 'photosby', 'probe.sqlite')
+
+
+def _int(value) -> int | None:
+    return int(value) if isinstance(value, str) and value.isdigit() else None
+
+
+def _float(value) -> float | None:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _ratio(value) -> float | None:
+    """A rate like ffprobe's '30000/1001', or None for '0/0' and the like."""
+    num, _, den = (value or '').partition('/')
+    num, den = _float(num), _float(den or '1')
+    return num / den if num and den else None
+
+
+@dataclass(slots=True)
+class VideoInfo:
+    """What the video scripts use from one ffprobe result."""
+    duration: float | None
+    start_time: float             # the file's first timestamp, which ffmpeg's -ss counts from
+    width: int | None             # of the first video stream
+    height: int | None
+    rotation: int                 # degrees the player turns the picture, 0/90/180/270
+    video_codec: str | None
+    pix_fmt: str | None
+    frame_rate: float | None      # of the first video stream, average frames/s
+    bit_rate: int | None          # of the first video stream, bits/s
+    has_audio: bool
+    timecode: str | None          # from the first data (tmcd) stream that has one
+
+    @classmethod
+    def from_ffprobe(cls, data: dict) -> 'VideoInfo':
+        streams = data.get('streams', [])
+        video = next((s for s in streams if s.get('codec_type') == 'video'), {})
+        timecode = next((s['tags']['timecode'] for s in streams
+                         if s.get('codec_type') == 'data' and s.get('tags', {}).get('timecode')), None)
+        return cls(
+            duration=_float(data.get('format', {}).get('duration')),
+            start_time=_float(data.get('format', {}).get('start_time')) or 0.0,
+            width=video.get('width'),
+            height=video.get('height'),
+            rotation=_rotation(video),
+            video_codec=video.get('codec_name'),
+            pix_fmt=video.get('pix_fmt'),
+            frame_rate=_ratio(video.get('avg_frame_rate')) or _ratio(video.get('r_frame_rate')),
+            bit_rate=_int(video.get('bit_rate')),
+            has_audio=any(s.get('codec_type') == 'audio' for s in streams),
+            timecode=timecode,
+        )
+
+    @property
+    def size(self) -> tuple[int, int] | None:
+        """(width, height) of the first video stream, or None if it can't be read."""
+        if self.width is None or self.height is None:
+            return None
+        return self.width, self.height
+
+    @property
+    def display_size(self) -> tuple[int, int] | None:
+        """size as the clip plays (ffmpeg auto-rotates it the same way), or None."""
+        if self.size is None:
+            return None
+        return (self.height, self.width) if self.rotation in (90, 270) else self.size
+
+
+def _rotation(video: dict) -> int:
+    """A video stream's display rotation (phones store portrait clips as rotated landscape)."""
+    angle = next((side['rotation'] for side in video.get('side_data_list', [])
+                  if side.get('side_data_type') == 'Display Matrix' and 'rotation' in side), None)
+    if angle is None:
+        angle = video.get('tags', {}).get('rotate')
+    angle = _float(angle)
+    return round(angle / 90) % 4 * 90 if angle is not None else 0
+
+
+def _run_ffprobe(path: Path) -> dict | None:
+    cmd = ['ffprobe', '-v', 'error', '-show_format', '-show_streams', '-of', 'json', str(path)]
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    if result.returncode != 0:
+        return None
+    try:
+        data = json.loads(result.stdout)
+    except ValueError:
+        return None
+    return data if 'format' in data else None
+
+
+def probe(path: Path) -> VideoInfo | None:
+    """Probes one file with ffprobe, bypassing the cache. None if it can't be read."""
+    data = _run_ffprobe(path)
+    return VideoInfo.from_ffprobe(data) if data is not None else None
+
+
+def is_valid_video(path: Path) -> bool:
+    """True if path is a non-empty file ffprobe can read a duration from."""
+    if not path.exists() or path.stat().st_size == 0:
+        return False
+    info = probe(path)
+    return info is not None and info.duration is not None
+
+
+class ProbeCache:
+    """
+    The ffprobe cache (see the module docstring). Use as a context manager,
+    or close() when done. One instance per thread.
+    """
+
+    def __init__(self, path: str | None = None):
+        self.path = path or default_cache_path()
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._db = sqlite3.connect(self.path)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        if self._db.execute('PRAGMA user_version').fetchone()[0] != CACHE_VERSION:
+            self._db.executescript('DROP TABLE IF EXISTS probes;'
+                                   + _SCHEMA + f'PRAGMA user_version = {CACHE_VERSION};')
+
+    def close(self) -> None:
+        self._db.close()
+
+    def __enter__(self) -> 'ProbeCache':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def get(self, path: str, st: os.stat_result) -> dict | None:
+        row = self._db.execute('SELECT size, mtime_ns, probe FROM probes WHERE path = ?', (path,)).fetchone()
+        if row is None or row[0] != st.st_size or row[1] != st.st_mtime_ns:
+            return None
+        return json.loads(row[2])
+
+    def put_many(self, rows: list[tuple[str, os.stat_result, dict]]) -> None:
+        with self._db:
+            self._db.executemany('INSERT OR REPLACE INTO probes VALUES (?, ?, ?, ?)', [
+                (path, st.st_size, st.st_mtime_ns, json.dumps(data, separators=(',', ':')))
+                for path, st, data in rows
+            ])
+
+    def probe_all(self, paths: list[Path], workers: int = PROBE_WORKERS,
+                  desc: str = "Probing") -> dict[Path, VideoInfo | None]:
+        """
+        {path: VideoInfo, or None if unreadable} for every one of `paths`,
+        running ffprobe (`workers` at a time) only for files missing from the
+        cache or changed since they were probed.
+        """
+        from tqdm import tqdm
+        results: dict[Path, VideoInfo | None] = {}
+        misses = []
+        for path in paths:
+            try:
+                st = path.stat()
+            except OSError:
+                results[path] = None
+                continue
+            key = str(path.resolve())
+            data = self.get(key, st)
+            if data is not None:
+                results[path] = VideoInfo.from_ffprobe(data)
+            else:
+                misses.append((path, key, st))
+
+        if misses:
+            fresh = []
+            with ThreadPoolExecutor(max_workers=min(workers, len(misses))) as pool, \
+                    tqdm(total=len(misses), desc=desc, unit="file", leave=False) as pbar:
+                for (path, key, st), data in zip(misses, pool.map(lambda m: _run_ffprobe(m[0]), misses)):
+                    pbar.update(1)
+                    results[path] = VideoInfo.from_ffprobe(data) if data is not None else None
+                    if data is not None:
+                        fresh.append((key, st, data))
+            self.put_many(fresh)
+        return {path: results[path] for path in paths}
+
+
+def probe_all(paths: list[Path], workers: int = PROBE_WORKERS) -> dict[Path, VideoInfo | None]:
+    """ProbeCache.probe_all() against the default cache."""
+    with ProbeCache() as cache:
+        return cache.probe_all(paths, workers)
+
+
+def main() -> None:
+    import shutil
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('paths', type=Path, nargs='+', help='Video files, or folders to search recursively')
+    parser.add_argument('--workers', type=int, default=PROBE_WORKERS,
+                        help=f'ffprobe processes to run at once (default: {PROBE_WORKERS})')
+    args = parser.parse_args()
+    if not shutil.which('ffprobe'):
+        print("ERROR: ffprobe must be on PATH.")
+        sys.exit(1)
+
+    files = []
+    for path in args.paths:
+        if path.is_dir():
+            files += sorted(p for p in path.rglob('*')
+                            if p.is_file() and p.suffix.lower() in VIDEO_EXTS and not p.name.startswith('.'))
+        else:
+            files.append(path)
+    for path, info in probe_all(files, max(1, args.workers)).items():
+        if info is None or info.duration is None:
+            print(f"{path}  (unreadable)")
+            continue
+        size = 'x'.join(map(str, info.display_size)) if info.size else '?'
+        if info.frame_rate:
+            size += f"@{info.frame_rate:.3g}"
+        rate = f"{info.bit_rate / 1e6:.1f} Mbps" if info.bit_rate else '? Mbps'
+        extra = '' if info.has_audio else '  no audio'
+        if info.timecode:
+            extra += f"  tc {info.timecode}"
+        print(f"{path}  {info.duration:.1f}s  {info.video_codec} {size} {info.pix_fmt}  {rate}{extra}")
+
+
+if __name__ == '__main__':
+    main()
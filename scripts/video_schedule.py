@@ -0,0 +1,155 @@
+"""Longest-job-first scheduling for the video batch scripts.
+
+compress_videos.py and denoise_videos.py encode several files at once. In
+discovery order, a 40-minute clip that happens to come last runs alone
+while every other worker sits idle. Instead each job gets an estimated cost
+from its probe (duration × pixels × a factor for decoding its codec), and
+jobs start longest first (LPT). Each one goes to whichever worker frees up
+first. That keeps the batch's makespan (wall time from first start to last
+finish) within 4/3 of the best possible.
+
+Costs are in "1080p-seconds": one second of 1920x1080 H.264. Before a batch
+starts, the predicted makespan is printed in those units, next to what
+discovery order would have taken. It is also printed in wall time once a
+previous batch of the same tool and settings has measured how long a unit
+takes. The actual makespan is printed when the batch ends.
+
+When every job also has a predicted_seconds from encoding samples of the
+batch (see sample_predict.py), jobs are ordered by that instead, and the
+predicted makespan is printed in wall time straight from it.
+"""
+
+import heapq
+import json
+import os
+import time
+from dataclasses import dataclass
+
+from video_probe import VideoInfo
+
+REFERENCE_PIXELS = 1920 * 1080
+# Decode cost relative to H.264; the encode side is the same for every source
+CODEC_FACTORS = {
+    'h264': 1.0,
+    'hevc': 1.4,
+    'vp9': 1.4,
+    'av1': 2.0,
+    'mpeg2video': 0.6,
+    'mpeg4': 0.6,
+    'prores': 0.5,
+    'dnxhd': 0.5,
+    'mjpeg': 0.5,
+}
+RATES_NAME = 'encode_rates.json'
+
+
+def job_cost(info: VideoInfo) -> float:
+    """The estimated cost of encoding a probed video, in 1080p-seconds."""
+    pixels = info.width * info.height if info.size else REFERENCE_PIXELS
+    return (info.duration or 0.0) * pixels / REFERENCE_PIXELS * CODEC_FACTORS.get(info.video_codec, 1.0)
+
+
+def makespan(costs: list[float], workers: int) -> float:
+    """The makespan of running `costs` in the given order, each on the first free worker."""
+    finish = [0.0] * max(1, min(workers, len(costs)))
+    for cost in costs:
+        heapq.heappush(finish, heapq.heappop(finish) + cost)
+    return max(finish, default=0.0)
+
+
+def _rates_path() -> str:
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_home, 'photosby', RATES_NAME)
+
+
+def _load_rates() -> dict[str, float]:
+    try:
+        with open(_rates_path(), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def format_duration(seconds: float) -> str:
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes}:{seconds:02d}"
+
+
+@dataclass
+class BatchSchedule:
+    """
+    A batch's jobs in LPT order, with its predicted makespan. `rate_key`
+    names the tool and settings whose measured seconds per 1080p-second turn
+    the prediction into wall time; finish() records this batch's rate there.
+    """
+    jobs: list
+    workers: int
+    rate_key: str
+    predicted: float       # makespan in 1080p-seconds, LPT order
+    unordered: float       # ... and in the order the jobs came in
+    predicted_seconds: float | None = None  # makespan from the jobs' predicted_seconds, if all have one
+    unordered_seconds: float | None = None
+    started: float | None = None
+
+    @classmethod
+    def plan(cls, jobs: list, workers: int, rate_key: str) -> 'BatchSchedule':
+        """
+        Orders jobs (anything with a `cost`, and optionally a predicted_seconds)
+        longest first for `workers` workers.
+        """
+        sampled = bool(jobs) and all(getattr(job, 'predicted_seconds', None) is not None for job in jobs)
+        length = (lambda job: job.predicted_seconds) if sampled else (lambda job: job.cost)
+        ordered = sorted(jobs, key=length, reverse=True)
+        schedule = cls(jobs=ordered, workers=workers, rate_key=rate_key,
+                       predicted=makespan([job.cost for job in ordered], workers),
+                       unordered=makespan([job.cost for job in jobs], workers))
+        if sampled:
+            schedule.predicted_seconds = makespan([length(job) for job in ordered], workers)
+            schedule.unordered_seconds = makespan([length(job) for job in jobs], workers)
+        return schedule
+
+    def describe(self) -> str:
+        if self.predicted_seconds is not None:
+            return (f"Predicted makespan from samples: {format_duration(self.predicted_seconds)} "
+                    f"on {self.workers} worker(s) (discovery order: {format_duration(self.unordered_seconds)})")
+        text = (f"Predicted makespan: {self.predicted:,.0f} 1080p-s on {self.workers} worker(s) "
+                f"(discovery order: {self.unordered:,.0f})")
+        rate = _load_rates().get(self.rate_key)
+        if rate:
+            text += f", about {format_duration(self.predicted * rate)} at the last measured speed"
+        return text
+
+    def seconds_per_unit(self) -> float | None:
+        """
+        Wall seconds one encode takes per 1080p-second: from the samples if
+        there were any, else as the last batch with these settings measured.
+        """
+        if self.predicted_seconds is not None and self.predicted > 0:
+            return self.predicted_seconds / self.predicted
+        return _load_rates().get(self.rate_key)
+
+    def start(self) -> None:
+        self.started = time.perf_counter()
+
+    def finish(self, complete: bool) -> str:
+        """
+        The actual makespan, as a line to print. If every job ran (`complete`),
+        the measured speed is saved for the next batch's prediction.
+        """
+        actual = time.perf_counter() - self.started
+        text = f"Actual makespan: {format_duration(actual)}"
+        if complete and self.predicted > 0:
+            rates = _load_rates()
+            rate = rates.get(self.rate_key)
+            if self.predicted_seconds is not None:
+                text += f" (predicted {format_duration(self.predicted_seconds)} from samples)"
+            elif rate:
+                text += f" (predicted {format_duration(self.predicted * rate)})"
+            rates[self.rate_key] = actual / self.predicted
+            path = _rates_path()
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump(rates, f, indent=2, sort_keys=True)
+            os.replace(path + '.tmp', path)
+        return text
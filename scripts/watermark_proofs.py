@@ -9,10 +9,15 @@ are .jpg regardless of the source format.
 Usage: python3 watermark_proofs.py <source> <dest>
 """
 
+import argparse
 import sys
 from pathlib import Path
+from typing import TYPE_CHECKING
 
-from PIL import Image, ImageChops, ImageDraw, ImageFilter, ImageFont, ImageOps
+import profiling
+
+if TYPE_CHECKING:  # Pillow is imported where it's used (see photosby.py)
+    from PIL import Image, ImageDraw, ImageFont
 
 IMAGE_EXTS = {'.jpg', '.jpeg', '.tif', '.tiff', '.png'}
 FONT_PATH = Path.home() / 'Library/Fonts/Oswald-VariableFont_wght.ttf'
@@ -26,7 +31,8 @@ SHADOW_OPACITY = 0.45          # black shadow, kept stronger so the faint text s
 MAX_TEXT_WIDTH_FRAC = 0.9      # widest line should span at most this fraction of image width
 
 
-def load_font(size: int) -> ImageFont.FreeTypeFont:
+def load_font(size: int) -> 'ImageFont.FreeTypeFont':
+    from PIL import ImageFont
     font = ImageFont.truetype(str(FONT_PATH), size)
     try:
         font.set_variation_by_name(FONT_WEIGHT)
@@ -35,7 +41,7 @@ def load_font(size: int) -> ImageFont.FreeTypeFont:
     return font
 
 
-def fit_font(draw: ImageDraw.ImageDraw, canvas_width: int, max_height: int) -> ImageFont.FreeTypeFont:
+def fit_font(draw: 'ImageDraw.ImageDraw', canvas_width: int, max_height: int) -> 'ImageFont.FreeTypeFont':
     """Pick the largest font size that fits the width/height caps — scales up from
     the probe size just as readily as it scales down, rather than only ever shrinking.
     """
@@ -57,7 +63,9 @@ def fit_font(draw: ImageDraw.ImageDraw, canvas_width: int, max_height: int) -> I
     return load_font(size)
 
 
-def apply_watermark(img: Image.Image) -> Image.Image:
+def apply_watermark(img: 'Image.Image') -> 'Image.Image':
+    from PIL import Image, ImageChops, ImageDraw, ImageFilter, ImageOps
+
     base = img.convert('RGBA')
     draw = ImageDraw.Draw(base)
     band_height = base.height * 2 // 3
@@ -95,6 +103,8 @@ def apply_watermark(img: Image.Image) -> Image.Image:
 
 
 def process_image(src: Path, dest: Path) -> None:
+    from PIL import Image, ImageOps
+
     with Image.open(src) as img:
         exif = img.getexif()
         # exif_transpose bakes the rotation into the pixels themselves, so the
@@ -115,35 +125,43 @@ def process_image(src: Path, dest: Path) -> None:
 
 
 def main() -> None:
-    if len(sys.argv) < 3:
-        print("Usage: watermark_proofs.py <source> <dest>")
-        sys.exit(1)
-
-    source = Path(sys.argv[1]).expanduser().resolve()
-    dest = Path(sys.argv[2]).expanduser().resolve()
-    if not source.exists():
-        print(f"Source folder does not exist: {source}")
-        sys.exit(1)
-    if not FONT_PATH.exists():
-        print(f"Font not found: {FONT_PATH}")
-        sys.exit(1)
-
-    files = sorted(p for p in source.rglob('*') if p.is_file() and p.suffix.lower() in IMAGE_EXTS)
-    print(f"Found {len(files)} image(s) under {source}\n")
-
-    done = failed = 0
-    for src in files:
-        rel = src.relative_to(source).with_suffix('.jpg')
-        dest_path = dest / rel
-        try:
-            process_image(src, dest_path)
-            print(f"  {rel}")
-            done += 1
-        except Exception as e:
-            print(f"  FAILED: {rel} — {e}")
-            failed += 1
-
-    print(f"\nDone: {done} watermarked, {failed} failed.")
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('source', type=Path, help='Folder of photos (searched recursively)')
+    parser.add_argument('dest', type=Path, help='Folder to write the proofs into')
+    profiling.add_arguments(parser)
+    args = parser.parse_args()
+    profiling.check_arguments(parser, args)
+
+    with profiling.profiled(args, 'watermark_proofs'):
+        source = args.source.expanduser().resolve()
+        dest = args.dest.expanduser().resolve()
+        if not source.exists():
+            print(f"Source folder does not exist: {source}")
+            sys.exit(1)
+        if not FONT_PATH.exists():
+            print(f"Font not found: {FONT_PATH}")
+            sys.exit(1)
+
+        with profiling.stage('discover'):
+            files = sorted(p for p in source.rglob('*') if p.is_file() and p.suffix.lower() in IMAGE_EXTS)
+        print(f"Found {len(files)} image(s) under {source}\n")
+
+        done = failed = 0
+        with profiling.stage('watermark') as watermark:
+            for src in files:
+                rel = src.relative_to(source).with_suffix('.jpg')
+                dest_path = dest / rel
+                try:
+                    process_image(src, dest_path)
+                    watermark.add_bytes(src.stat().st_size)
+                    print(f"  {rel}")
+                    done += 1
+                except Exception as e:
+                    print(f"  FAILED: {rel} — {e}")
+                    failed += 1
+
+        print(f"\nDone: {done} watermarked, {failed} failed.")
 
 
 if __name__ == '__main__':
@@ -0,0 +1,98 @@
+"""Working files for the video scripts, placed so that finishing one is a rename.
+
+ffmpeg writes each output to a hidden working file in the same folder as
+its final path, named .<stem>.<tag>.tmp<ext>. Once the output has been
+checked, commit() renames it into place. That is atomic, and it costs
+nothing however big the file is, even when the output folder is on an
+external SSD or a NAS. A working file in a temp folder on another disk
+would instead be copied a second time at the end.
+
+Only if the destination folder can't hold that name (a stem too close to
+the filename length limit) does the working file get a short random name
+there instead. Only if it can't hold a working file at all does it go in
+the caller's fallback folder. commit() checks which filesystem the working
+file ended up on and copies only when it has to. A run that is killed
+leaves its working files behind, and cleanup_stale() removes them next time.
+"""
+
+import os
+import shutil
+import tempfile
+from glob import escape
+from pathlib import Path
+
+
+def working_path(final: Path, tag: str, fallback_dir: Path) -> Path:
+    """
+    Creates (empty) and returns the working file for `final`: a hidden
+    sibling of it where possible (see the module docstring), otherwise a
+    file in fallback_dir.
+    """
+    final.parent.mkdir(parents=True, exist_ok=True)
+    sibling = final.with_name(f".{final.stem}.{tag}.tmp{final.suffix}")
+    try:
+        sibling.touch()
+        return sibling
+    except OSError:
+        pass
+    for directory in (final.parent, fallback_dir):
+        try:
+            fd, name = tempfile.mkstemp(prefix=f".{tag}.", suffix=f".tmp{final.suffix}", dir=directory)
+        except OSError:
+            continue
+        os.close(fd)
+        return Path(name)
+    raise OSError(f"can't create a working file for {final} in {final.parent} or {fallback_dir}")
+
+
+def _fsync(path: Path | str) -> None:
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass  # directories can't be fsynced on some platforms and filesystems
+    finally:
+        os.close(fd)
+
+
+def commit(working: Path, final: Path) -> None:
+    """
+    Moves a finished working file to `final`, replacing anything there: a
+    rename when both are on the same filesystem, otherwise a copy followed
+    by a rename. The data is flushed to disk before the rename, and the
+    rename after it, so a power cut can't leave `final` renamed but empty
+    (see batch_journal.py).
+    """
+    if os.stat(working).st_dev == os.stat(final.parent).st_dev:
+        _fsync(working)
+        os.replace(working, final)
+        _fsync(final.parent)
+        return
+    fd, staged = tempfile.mkstemp(prefix='.commit.', suffix=f".tmp{final.suffix}", dir=final.parent)
+    os.close(fd)
+    try:
+        shutil.copyfile(working, staged)
+        _fsync(staged)
+        os.replace(staged, final)
+        _fsync(final.parent)
+    except BaseException:
+        Path(staged).unlink(missing_ok=True)
+        raise
+    working.unlink()
+
+
+def cleanup_stale(folder: Path, tag: str, name: str | None = None) -> None:
+    """
+    Removes working files tagged `tag` under `folder` left behind by a run
+    that was interrupted: all of them, or only the one for outputs named
+    `name` (a stem).
+    """
+    if name is None:
+        patterns = [f".*.{tag}.tmp*", f".{tag}.*.tmp*", ".commit.*.tmp*"]
+    else:
+        patterns = [f".{escape(name)}.{tag}.tmp*"]
+    for pattern in patterns:
+        for p in folder.rglob(pattern):
+            if p.is_file():
+                print(f"  Removing stale temp file from an interrupted run: {p.name}")
+                p.unlink(missing_ok=True)
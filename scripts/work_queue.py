@@ -0,0 +1,190 @@
+"""A work queue in a shared folder, so several compress_videos.py workers can split one batch.
+
+With --worker, any number of compress_videos.py processes can run over the
+same input and output folders, on one host or on several that share the
+filesystem (an NFS or SMB mount, say). Each worker builds the batch itself,
+then claims jobs one at a time by creating a lease file for each in
+<output>/.compress_videos.queue/. The lease is created with O_CREAT|O_EXCL,
+so exactly one worker gets it, and it's removed once the job's output is
+committed and journaled (see batch_journal.py). A job another worker has
+leased is left to it. A worker waits for the jobs still leased elsewhere
+and exits once none are left.
+
+A worker heartbeats: every HEARTBEAT_SECONDS it touches each lease it
+holds. A lease that hasn't been touched for LEASE_SECONDS belongs to a
+worker that died, or to a machine that went to sleep, and another worker
+reclaims it. Lease ages are measured against the shared filesystem's clock
+(each worker's .alive file, touched just before), not the local one, so
+hosts whose clocks disagree don't reclaim each other's live leases.
+
+A lease is stale by its age alone, so one left empty or cut short by a
+worker that died while writing it is reclaimed like any other. Reclaiming
+renames the stale lease aside first, so of two workers that both notice
+it, only one gets it. A worker checks it still holds its lease
+before committing an output. One that wakes up to find its lease reclaimed
+discards its output rather than racing the new owner. Working files carry
+the worker's name, so two encodes of the same job never write to the same
+file, and the new owner removes the old one's working file.
+"""
+
+import hashlib
+import json
+import os
+import secrets
+import socket
+import threading
+import time
+from pathlib import Path
+
+HEARTBEAT_SECONDS = 30
+LEASE_SECONDS = 120
+POLL_SECONDS = 10
+
+
+class WorkQueue:
+    """
+    Leases on the jobs of one tool's batch, in `folder` (the output folder).
+    Use as a context manager: leaving it stops the heartbeat and releases
+    every lease still held.
+    """
+
+    def __init__(self, folder: Path, tool: str):
+        self.folder = folder
+        self.dir = folder / f".{tool}.queue"
+        self.worker = f"{socket.gethostname().split('.')[0]}-{os.getpid()}-{secrets.token_hex(2)}"
+        self._alive = self.dir / f"{self.worker}.alive"
+        self._held: dict[str, str] = {}  # lease file name -> our token in it
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._heartbeat = threading.Thread(target=self._beat, daemon=True)
+
+    def __enter__(self) -> 'WorkQueue':
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self._alive.touch()
+        now = self._now()
+        for alive in self.dir.glob('*.alive'):
+            try:
+                if now - alive.stat().st_mtime > LEASE_SECONDS:
+                    alive.unlink()  # a worker that died
+            except OSError:
+                pass
+        self._heartbeat.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stop.set()
+        self._heartbeat.join()
+        for name in list(self._held):
+            self._release(name)
+        self._alive.unlink(missing_ok=True)
+
+    def _lease_path(self, final: Path) -> Path:
+        key = os.path.relpath(final, self.folder)
+        return self.dir / f"{hashlib.sha1(key.encode()).hexdigest()[:20]}.lease"
+
+    def _now(self) -> float:
+        """The shared filesystem's idea of the current time."""
+        os.utime(self._alive)
+        return os.stat(self._alive).st_mtime
+
+    def _beat(self) -> None:
+        while not self._stop.wait(HEARTBEAT_SECONDS):
+            with self._lock:
+                held = list(self._held)
+            for name in held:
+                if not self._holds_lease(name):
+                    continue
+                try:
+                    os.utime(self.dir / name)
+                except OSError:
+                    pass
+            try:
+                os.utime(self._alive)
+            except OSError:
+                pass
+
+    @staticmethod
+    def _read(path: Path) -> dict:
+        """What a lease says; empty if it's empty or cut short (its worker died writing it)."""
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _reclaim(self, path: Path) -> dict | None:
+        """Takes a stale lease at path out of the way. Returns what it said, or None if it isn't stale."""
+        try:
+            st = os.stat(path)
+            age = self._now() - st.st_mtime
+        except FileNotFoundError:
+            return {}
+        if age < LEASE_SECONDS:
+            return None  # live, or still being written
+        stale = self._read(path)
+        aside = path.with_name(f"{path.name}.{self.worker}.stale")
+        try:
+            os.rename(path, aside)
+        except FileNotFoundError:
+            return None  # another worker got there first
+        try:
+            moved_ino = os.stat(aside).st_ino
+        except OSError:
+            moved_ino = None
+        if moved_ino != st.st_ino or self._read(aside).get('token') != stale.get('token'):
+            # Another worker reclaimed it and leased it again in between: put theirs back
+            try:
+                os.link(aside, path)
+            except OSError:
+                pass
+            aside.unlink(missing_ok=True)
+            return None
+        aside.unlink(missing_ok=True)
+        return stale
+
+    def claim(self, final: Path) -> dict | None:
+        """
+        Leases the job whose output is `final`. Returns None if another worker
+        holds it; otherwise a dict that's empty, or, if the lease was reclaimed
+        from a worker that stopped heartbeating, what that worker's lease said.
+        """
+        path = self._lease_path(final)
+        token = secrets.token_hex(8)
+        previous = {}
+        for _ in range(2):
+            try:
+                fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+                break
+            except FileExistsError:
+                previous = self._reclaim(path)
+                if previous is None:
+                    return None
+        else:
+            return None
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump({'output': str(final), 'worker': self.worker, 'token': token, 'claimed': time.time()}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        with self._lock:
+            self._held[path.name] = token
+        return previous
+
+    def _holds_lease(self, name: str) -> bool:
+        try:
+            with open(self.dir / name, 'r', encoding='utf-8') as f:
+                return json.load(f).get('token') == self._held.get(name)
+        except (OSError, ValueError):
+            return False
+
+    def holds(self, final: Path) -> bool:
+        """Whether this worker still holds the lease on final's job (see the module docstring)."""
+        return self._holds_lease(self._lease_path(final).name)
+
+    def _release(self, name: str) -> None:
+        if self._holds_lease(name):
+            (self.dir / name).unlink(missing_ok=True)
+        with self._lock:
+            self._held.pop(name, None)
+
+    def release(self, final: Path) -> None:
+        self._release(self._lease_path(final).name)